@@ -1,14 +1,17 @@
 """
 Parrhesepstein — App factory - Tamaladissa.
+Gli import sono dentro create_app: importare un modulo di app (ad es. i worker
+del pool di processi) non crea il client MongoDB né registra le route.
 """
-from flask import Flask
-from flask_cors import CORS
-from app.config import SECRET_KEY
-from app import extensions
-from app.routes import register_blueprints
 
 
 def create_app():
+    from flask import Flask
+    from flask_cors import CORS
+    from app.config import SECRET_KEY
+    from app import extensions
+    from app.routes import register_blueprints
+
     app = Flask(
         __name__,
         template_folder="templates",
@@ -3,10 +3,14 @@ Re-export degli agenti principali per comodità di import.
 """
 from app.agents.vectordb import (
     add_document_to_vectordb,
+    add_documents_to_vectordb,
     semantic_search,
+    semantic_search_many,
+    keyword_search,
     delete_from_vectordb,
     get_collection_stats,
     is_document_indexed,
+    are_documents_indexed,
     get_or_create_collection,
     chroma_client,
 )
@@ -7,10 +7,16 @@ from app.extensions import db_epstein
 
 
 def get_rag_context(query, n_results=5):
-    """Cerca nel database vettoriale ChromaDB e ritorna contesto formattato."""
+    """
+    Cerca nel database vettoriale ChromaDB e ritorna contesto formattato.
+    `query` può essere una lista: le query partono in un solo batch e
+    i risultati vengono fusi (RRF).
+    """
     try:
-        from app.agents.vectordb import semantic_search
-        results = semantic_search(query, n_results=n_results)
+        from app.agents.vectordb import semantic_search_many
+        queries = query if isinstance(query, (list, tuple)) else [query]
+        results = semantic_search_many(queries, n_results=n_results, fuse=len(queries) > 1)
+        results = results["fused"] if len(queries) > 1 else (results["results"] or [[]])[0]
         if not results:
             return ""
         context = "## DOCUMENTI RILEVANTI DAL DATABASE VETTORIALE\n\n"
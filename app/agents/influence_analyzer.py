@@ -9,7 +9,7 @@ import requests
 from collections import defaultdict
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
-from app.services.justice_gov import search_justice_gov
+from app.services.justice_gov import search_justice_gov, search_all_pages
 from app.services.pdf import download_pdf_text
 
 # Organizzazioni target predefinite
@@ -139,24 +139,23 @@ class InfluenceNetworkAnalyzer:
             for alias in org["aliases"]:
                 search_term = f'"{alias}"' if " " in alias else alias
 
-                for page in range(config["pages"]):
-                    search_results = search_justice_gov(search_term, page)
-                    org_results["total_mentions"] = max(org_results["total_mentions"],
-                                                        search_results.get("total", 0))
-
-                    for doc in search_results.get("results", []):
-                        if doc["url"] not in seen_urls:
-                            seen_urls.add(doc["url"])
-                            doc["org_match"] = org_key
-                            doc["search_term"] = alias
-                            # Scarica e salva PDF
-                            if doc.get("url"):
-                                try:
-                                    download_pdf_text(doc["url"])
-                                except Exception:
-                                    pass
-                            org_results["documents"].append(doc)
-                            all_docs.append(doc)
+                search_results = search_all_pages(search_term, max_pages=config["pages"])
+                org_results["total_mentions"] = max(org_results["total_mentions"],
+                                                    search_results.get("total", 0))
+
+                for doc in search_results.get("results", []):
+                    if doc["url"] not in seen_urls:
+                        seen_urls.add(doc["url"])
+                        doc["org_match"] = org_key
+                        doc["search_term"] = alias
+                        # Scarica e salva PDF
+                        if doc.get("url"):
+                            try:
+                                download_pdf_text(doc["url"])
+                            except Exception:
+                                pass
+                        org_results["documents"].append(doc)
+                        all_docs.append(doc)
 
             # Cerca figure chiave
             for figure in org.get("key_figures", []):
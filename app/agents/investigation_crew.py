@@ -6,10 +6,9 @@ Un team di agenti AI che collaborano per investigare i documenti Epstein.
 import re
 import json
 import requests
-import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from anthropic import Anthropic
-from app.services.justice_gov import search_justice_gov
+from app.services.justice_gov import search_all_pages
 from app.services.pdf import download_pdf_text
 
 
@@ -146,7 +145,7 @@ Rispondi SOLO con il JSON, nient'altro."""
         return strategy
 
     def researcher_agent(self, search_terms, max_results_per_term=50):
-        """Agente Ricercatore: cerca documenti nel database"""
+        """Agente Ricercatore: cerca documenti nel database (al massimo max_results_per_term nuovi per termine)"""
         self.update_progress(f"Ricercatore: Ricerca di {len(search_terms)} termini...")
 
         all_results = []
@@ -156,30 +155,26 @@ Rispondi SOLO con il JSON, nient'altro."""
         for term in search_terms:
             self.update_progress(f"Ricercatore: Cerco '{term}'...")
 
-            for page in range(3):  # 3 pagine per termine
-                result = search_justice_gov(term, page)
-                total = result.get("total", 0)
+            result = search_all_pages(term, max_pages=3)  # 3 pagine per termine, in parallelo
+            search_stats.append(f"'{term}': {result.get('total', 0)} documenti"
+                                + (" (risultati parziali)" if result.get("partial") else ""))
 
-                if page == 0:
-                    search_stats.append(f"'{term}': {total} documenti")
-
-                for doc in result.get("results", []):
-                    doc_id = doc.get("id", "")
-                    if doc_id and doc_id not in seen_ids:
-                        seen_ids.add(doc_id)
-                        all_results.append(doc)
-
-                if len(all_results) >= max_results_per_term * len(search_terms):
+            added = 0
+            for doc in result.get("results", []):
+                if added >= max_results_per_term:
                     break
-
-            time.sleep(0.5)  # Rate limiting
+                doc_id = doc.get("id", "")
+                if doc_id and doc_id not in seen_ids:
+                    seen_ids.add(doc_id)
+                    all_results.append(doc)
+                    added += 1
 
         # Ricerca anche nel RAG locale
         try:
-            from app.agents.vectordb import semantic_search
+            from app.agents.vectordb import semantic_search_many
             rag_count = 0
-            for term in search_terms[:5]:
-                rag_results = semantic_search(term, n_results=10)
+            rag_batches = semantic_search_many(search_terms[:5], n_results=10)["results"]
+            for rag_results in rag_batches:
                 for r in rag_results:
                     doc_id = r.get('metadata', {}).get('doc_id', '')
                     if doc_id and doc_id not in seen_ids:
@@ -3,7 +3,9 @@ InvestigatorAgent — genera dossier su una persona.
 """
 import re
 from datetime import datetime
-from app.agents.vectordb import extract_entities_from_text, get_wikipedia_info
+from app.agents.vectordb import get_wikipedia_info
+from app.services.entity_extractor import merge_entities
+from app.services.entity_store import entities_for_documents
 
 
 class InvestigatorAgent:
@@ -32,10 +34,8 @@ class InvestigatorAgent:
         if wiki_info.get("exists"):
             dossier["wikipedia"] = wiki_info
 
-        all_text = ""
         for doc in documents:
             text = doc.get('full_text', '') or doc.get('text', '') or ' '.join(doc.get('snippets', []))
-            all_text += text + "\n"
             if name.lower() in text.lower():
                 pattern = re.compile(rf'.{{0,150}}{re.escape(name)}.{{0,150}}', re.IGNORECASE)
                 matches = pattern.findall(text)
@@ -46,7 +46,7 @@ class InvestigatorAgent:
                         "context": match.strip(),
                     })
 
-        entities = extract_entities_from_text(all_text)
+        entities = merge_entities(entities_for_documents(documents))
         dossier["connections"] = entities.get("people", [])[:20]
         dossier["financial"] = entities.get("money", [])
         dossier["timeline"] = sorted(entities.get("dates", []))
@@ -8,6 +8,7 @@ import json
 import requests
 from anthropic import Anthropic
 from app.services.justice_gov import search_justice_gov
+from app.services.efta_registry import resolve_efta_id
 from app.services.pdf import download_pdf_text
 
 
@@ -15,11 +16,10 @@ from app.services.pdf import download_pdf_text
 
 def get_document_content(doc_id, snippets=None):
     """Ottiene il contenuto di un documento, con fallback sugli snippet"""
-    # Prima cerca il documento per ottenere l'URL
-    result = search_justice_gov(doc_id)
+    # Prima risolve l'id per ottenere l'URL (registro locale, rete solo se sconosciuto)
+    doc = resolve_efta_id(doc_id)
 
-    if result.get("results"):
-        doc = result["results"][0]
+    if doc:
         url = doc.get("url", "")
         doc_snippets = doc.get("snippets", []) or snippets or []
 
@@ -144,6 +144,7 @@ Rispondi in JSON:
 
         resolution_docs = []
         searches_done = []
+        ids_resolved = []  # id citati risolti dal registro EFTA (non sono ricerche)
         document_analyses = []
 
         # Estrai gli ID dei documenti citati nelle contraddizioni
@@ -181,10 +182,9 @@ Rispondi in JSON:
                     "analysis": doc_analysis
                 })
             else:
-                # Prova comunque a cercare e usare gli snippet dalla ricerca
-                result = search_justice_gov(doc_id)
-                if result.get("results"):
-                    doc = result["results"][0]
+                # Prova comunque a usare gli snippet dalla ricerca
+                doc = resolve_efta_id(doc_id)
+                if doc:
                     snippets = doc.get("snippets", [])
                     if snippets:
                         snippet_text = "\n".join([s.replace("<em>", "**").replace("</em>", "**") for s in snippets])
@@ -206,14 +206,10 @@ Rispondi in JSON:
                         })
 
             # Aggiungi ai risultati
-            result = search_justice_gov(doc_id)
-            if result.get("results"):
-                resolution_docs.append(result["results"][0])
-                searches_done.append({
-                    "query": doc_id,
-                    "total": result.get("total", 0),
-                    "docs": result.get("results", [])[:3]
-                })
+            doc = resolve_efta_id(doc_id)
+            if doc:
+                resolution_docs.append(doc)
+                ids_resolved.append({"doc_id": doc_id, "doc": doc})
 
         # Cerca anche per le query suggerite
         for query in analysis.get("searches_needed", [])[:3]:
@@ -228,6 +224,7 @@ Rispondi in JSON:
 
         return {
             "searches_done": searches_done,
+            "ids_resolved": ids_resolved,
             "resolution_docs": resolution_docs,
             "document_analyses": document_analyses
         }
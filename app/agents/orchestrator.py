@@ -7,6 +7,8 @@ import re
 import json
 from datetime import datetime
 
+from app.services.efta_registry import resolve_efta_id
+
 
 class InvestigationOrchestrator:
     """Orchestratore che coordina investigazioni approfondite"""
@@ -113,9 +115,8 @@ class InvestigationOrchestrator:
 
         # Cerca e scarica il documento
         try:
-            search_result = self.search(doc_id)
-            if search_result.get('results'):
-                doc = search_result['results'][0]
+            doc = resolve_efta_id(doc_id, search_fn=self.search)
+            if doc:
                 doc_url = doc.get('url', '')
 
                 if doc_url:
@@ -181,8 +182,7 @@ Rispondi in JSON:
             if isinstance(initial_result, dict):
                 for f in initial_result.get('critical_findings', [])[:3]:
                     query_parts.append(str(f)[:100])
-            query = " ".join(query_parts) if query_parts else "Epstein investigation"
-            rag_context = get_rag_context(query, n_results=5)
+            rag_context = get_rag_context(query_parts or "Epstein investigation", n_results=5)
             if rag_context:
                 self._rag_context = rag_context
                 print(f"[ORCHESTRATOR] Contesto RAG recuperato: {len(rag_context)} caratteri", flush=True)
@@ -2,13 +2,15 @@
 ChromaDB: add, search, delete, stats — unica copia.
 """
 import os
-import re
+import copy
 import hashlib
+import threading
 from datetime import datetime
 from collections import defaultdict
 
 import chromadb
 from chromadb.config import Settings
+from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
 import networkx as nx
 
 try:
@@ -17,256 +19,564 @@ try:
 except ImportError:
     wiki = None
 
-from app.config import CHROMA_PATH
+from app.config import (
+    CHROMA_PATH, DOC_REGISTRY_DB, KEYWORD_INDEX_DB,
+    SEARCH_EMBEDDING_CACHE_SIZE, SEARCH_RESULT_CACHE_SIZE,
+)
+from app.services.cache import TTLCache
+from app.services.doc_registry import DocumentRegistry
+from app.services.keyword_index import KeywordIndex
+from app.services.chunker import iter_chunks, CHUNK_TOKENS, CHUNKER_VERSION
+from app.services.entity_extractor import extract_entities
+from app.services.entity_store import cooccurrence_subgraph, record_documents, document_key
 
 # ChromaDB setup
 chroma_client = chromadb.PersistentClient(path=CHROMA_PATH)
+doc_registry = DocumentRegistry(DOC_REGISTRY_DB)
+keyword_index = KeywordIndex(KEYWORD_INDEX_DB, fetch_texts=lambda ids: _chunk_texts(ids))
+_keyword_index_lock = threading.Lock()
+
+# Cache della ricerca semantica: embedding delle query e risultati.
+# I risultati sono legati alla versione della collection, incrementata
+# a ogni scrittura/cancellazione: una modifica li invalida tutti.
+embedding_cache = TTLCache(maxsize=SEARCH_EMBEDDING_CACHE_SIZE)
+result_cache = TTLCache(maxsize=SEARCH_RESULT_CACHE_SIZE)
+_collection_version = 0
+_version_lock = threading.Lock()
+_embedding_function = None
+
+
+def _get_embedding_function():
+    """Embedding function condivisa da collection e query (caricata al primo uso)"""
+    global _embedding_function
+    if _embedding_function is None:
+        _embedding_function = DefaultEmbeddingFunction()
+    return _embedding_function
+
+
+# Le collection nuove usano la distanza coseno; quelle create prima restano
+# in L2 al quadrato (Chroma ignora i metadati di una collection esistente)
+COLLECTION_SPACE = "cosine"
 
 
 def get_or_create_collection():
     """Ottiene o crea la collection ChromaDB"""
     return chroma_client.get_or_create_collection(
         name="epstein_docs",
-        metadata={"description": "Documenti Epstein Files"},
+        metadata={"description": "Documenti Epstein Files", "hnsw:space": COLLECTION_SPACE},
+        embedding_function=_get_embedding_function(),
     )
 
 
-def generate_doc_id(url, chunk_idx=0):
-    return hashlib.md5(f"{url}_{chunk_idx}".encode()).hexdigest()
+def _similarity(distance, space):
+    """
+    Distanza Chroma → similarità in [0, 1]. Gli embedding sono normalizzati:
+    L2 al quadrato = 2 - 2·cos, coseno e prodotto interno = 1 - cos.
+    Mai negativa: nella somma un chunk in più non abbassa il punteggio.
+    """
+    similarity = 1 - distance / 2 if space == "l2" else 1 - distance
+    return min(1.0, max(0.0, similarity))
 
 
-def chunk_text(text, chunk_size=1000, overlap=200):
-    chunks = []
-    start = 0
-    while start < len(text):
-        end = start + chunk_size
-        chunks.append(text[start:end])
-        start = end - overlap
-    return chunks
+def _bump_collection_version():
+    """Segnala una modifica della collection: i risultati in cache non valgono più"""
+    global _collection_version
+    with _version_lock:
+        _collection_version += 1
+    result_cache.clear()
 
 
-def add_document_to_vectordb(url, title, text, metadata=None):
-    """Aggiunge un documento al database vettoriale"""
-    collection = get_or_create_collection()
-    chunks = chunk_text(text)
+def get_search_cache_stats():
+    return {
+        "collection_version": _collection_version,
+        "embeddings": embedding_cache.stats(),
+        "results": result_cache.stats(),
+    }
+
+
+def generate_doc_id(url, chunk_idx=0, version=CHUNKER_VERSION):
+    """Id del chunk: i chunk della versione 1 (senza versione nell'id) restano raggiungibili"""
+    if version == 1:
+        return hashlib.md5(f"{url}_{chunk_idx}".encode()).hexdigest()
+    return hashlib.md5(f"{url}_v{version}_{chunk_idx}".encode()).hexdigest()
+
+
+# Sovrapposizione dei chunk a finestra fissa indicizzati prima del chunker semantico
+CHUNK_OVERLAP = 200
+
+
+def chunk_text(text, max_tokens=CHUNK_TOKENS):
+    """Testi dei chunk (vedi app.services.chunker)"""
+    return [c["text"] for c in iter_chunks(text, max_tokens)]
+
+
+def build_chunk_records(url, title, text, metadata=None):
+    """
+    Prepara id, testi e metadati dei chunk di un documento.
+    I metadati riportano gli offset del chunk nel testo sorgente, la versione
+    del chunker e le pagine coperte (page_start e page_end insieme o nessuna delle due).
+    """
+    chunks = list(iter_chunks(text))
+    indexed_at = datetime.now().isoformat()
+    records = []
     for i, chunk in enumerate(chunks):
-        doc_id = generate_doc_id(url, i)
-        existing = collection.get(ids=[doc_id])
-        if existing and existing['ids']:
-            continue
         meta = {
             "url": url,
             "title": title,
             "chunk_index": i,
             "total_chunks": len(chunks),
-            "indexed_at": datetime.now().isoformat(),
+            "indexed_at": indexed_at,
+            "char_start": chunk["start"],
+            "char_end": chunk["end"],
+            "tokens": chunk["tokens"],
+            "chunker_version": CHUNKER_VERSION,
         }
+        if chunk["page_start"] is not None and chunk["page_end"] is not None:
+            meta["page_start"] = chunk["page_start"]
+            meta["page_end"] = chunk["page_end"]
         if metadata:
             meta.update(metadata)
-        collection.add(ids=[doc_id], documents=[chunk], metadatas=[meta])
-    return len(chunks)
+        records.append((generate_doc_id(url, i), chunk["text"], meta))
+    return records
+
+
+def _max_batch_size():
+    try:
+        return chroma_client.get_max_batch_size()
+    except Exception:
+        return 5000
+
+
+def write_chunk_records(records):
+    """
+    Scrive chunk già preparati [(id, testo, metadati)]: una get per lotto per
+    scartare gli id esistenti, poi add a lotti (embedding calcolati in batch).
+    I documenti già indicizzati con un'altra versione del chunker vengono
+    prima eliminati per intero: confini vecchi e nuovi non si mescolano.
+    """
+    collection = get_or_create_collection()
+    batch_size = _max_batch_size()
+
+    _ensure_registry()
+    stale = doc_registry.stale_urls([r[2]["url"] for r in records if r[2].get("url")], CHUNKER_VERSION)
+    if stale:
+        for start in range(0, len(stale), 500):
+            collection.delete(where={"url": {"$in": stale[start:start + 500]}})
+        doc_registry.remove(stale)
+        keyword_index.remove_urls(stale)
+        _bump_collection_version()
+        print(f"[VECTORDB] Rechunking di {len(stale)} documenti (chunker v{CHUNKER_VERSION})", flush=True)
+
+    unique = []
+    seen_ids = set()
+    for record in records:
+        if record[0] not in seen_ids:
+            seen_ids.add(record[0])
+            unique.append(record)
+
+    existing = set()
+    all_ids = [r[0] for r in unique]
+    for start in range(0, len(all_ids), batch_size):
+        existing.update(collection.get(ids=all_ids[start:start + batch_size], include=[])['ids'])
+
+    missing = [r for r in unique if r[0] not in existing]
+    for start in range(0, len(missing), batch_size):
+        batch = missing[start:start + batch_size]
+        collection.add(
+            ids=[r[0] for r in batch],
+            documents=[r[1] for r in batch],
+            metadatas=[r[2] for r in batch],
+        )
+    doc_registry.record_chunks(unique)
+    keyword_index.add(missing)
+    if missing:
+        _bump_collection_version()
+    return len(missing)
+
+
+def add_documents_to_vectordb(documents):
+    """
+    Aggiunge molti documenti in blocco.
+    documents: [{"url", "title", "text", "metadata"}] → lista chunk per documento.
+    """
+    records = []
+    counts = []
+    for doc in documents:
+        doc_records = build_chunk_records(doc["url"], doc.get("title", ""), doc["text"], doc.get("metadata"))
+        counts.append(len(doc_records))
+        records.extend(doc_records)
+    write_chunk_records(records)
+    record_documents([
+        (document_key((doc.get("metadata") or {}).get("doc_id"), doc["url"]), doc["text"]) for doc in documents
+    ])
+    return counts
+
+
+def add_document_to_vectordb(url, title, text, metadata=None):
+    """Aggiunge un documento al database vettoriale"""
+    return add_documents_to_vectordb([{"url": url, "title": title, "text": text, "metadata": metadata}])[0]
+
+
+def recount_collection(page_size=5000):
+    """
+    Ricostruisce il registro documenti scorrendo tutti i metadati della collection.
+    Operazione amministrativa O(chunk): serve solo per riallineare il registro.
+    """
+    collection = get_or_create_collection()
+    documents = {}
+    offset = 0
+    while True:
+        page = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+        metadatas = page.get('metadatas') or []
+        for meta in metadatas:
+            if not meta:
+                continue
+            key = meta.get('url') or meta.get('doc_id')
+            if not key:
+                continue
+            doc = documents.setdefault(key, {
+                "doc_id": meta.get('doc_id'), "title": meta.get('title', ''),
+                "chunks": 0, "indexed_at": meta.get('indexed_at'),
+                "chunker_version": meta.get('chunker_version', 1),
+            })
+            doc["chunks"] += 1
+            # Documento con chunk di versioni diverse: vale la più vecchia (sarà riscritto)
+            doc["chunker_version"] = min(doc["chunker_version"], meta.get('chunker_version', 1))
+        if len(metadatas) < page_size:
+            break
+        offset += page_size
+    doc_registry.rebuild(documents)
+    print(f"[VECTORDB] Registro ricostruito: {len(documents)} documenti", flush=True)
+    return doc_registry.stats()
+
+
+def _chunk_texts(chunk_ids):
+    """Testo dei chunk dalla collection → {chunk_id: testo}"""
+    page = get_or_create_collection().get(ids=list(chunk_ids), include=["documents"])
+    return dict(zip(page.get('ids') or [], page.get('documents') or []))
+
+
+def _rebuild_keyword_index(page_size):
+    collection = get_or_create_collection()
+    keyword_index.clear()
+    offset = 0
+    total = 0
+    while True:
+        page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+        ids = page.get('ids') or []
+        keyword_index.add([
+            (chunk_id, text or "", meta or {})
+            for chunk_id, text, meta in zip(ids, page.get('documents') or [], page.get('metadatas') or [])
+        ])
+        total += len(ids)
+        if len(ids) < page_size:
+            break
+        offset += page_size
+    keyword_index.mark_initialized()
+    print(f"[VECTORDB] Indice BM25 ricostruito: {total} chunk", flush=True)
+    return total
+
+
+def rebuild_keyword_index(page_size=2000):
+    """Ricostruisce l'indice BM25 da tutti i chunk della collection"""
+    with _keyword_index_lock:
+        return _rebuild_keyword_index(page_size)
+
+
+def _ensure_keyword_index():
+    """Costruisce l'indice BM25 se manca; una sola costruzione anche con ricerche concorrenti"""
+    if keyword_index.is_initialized():
+        return
+    with _keyword_index_lock:
+        if not keyword_index.is_initialized():
+            _rebuild_keyword_index(2000)
+
+
+def keyword_search(query, n_results=20, operator="AND"):
+    """Ricerca per token esatti (BM25) sui chunk indicizzati: codici EFTA, nomi, importi"""
+    _ensure_keyword_index()
+    return keyword_index.search(query, limit=n_results, operator=operator)
+
+
+def _ensure_registry():
+    """Alla prima consultazione popola il registro da una collection già esistente"""
+    if not doc_registry.is_initialized():
+        recount_collection()
 
 
 def get_collection_stats():
+    """Statistiche dal registro documenti (contatori incrementali, O(1))"""
     try:
-        collection = get_or_create_collection()
-        count = collection.count()
-        all_meta = collection.get(include=["metadatas"])
-        unique_docs = set()
-        for meta in all_meta.get('metadatas', []):
-            if meta and meta.get('url'):
-                unique_docs.add(meta['url'])
-            elif meta and meta.get('doc_id'):
-                unique_docs.add(meta['doc_id'])
-        return {"total_chunks": count, "total_documents": len(unique_docs)}
+        _ensure_registry()
+        return doc_registry.stats()
     except Exception as e:
         return {"total_chunks": 0, "total_documents": 0, "error": str(e)}
 
 
-def is_document_indexed(doc_id):
+def are_documents_indexed(doc_ids):
+    """Verifica in blocco tramite il registro → {doc_id: {"indexed", "chunks"}}"""
     try:
-        collection = get_or_create_collection()
-        results = collection.get(where={"doc_id": doc_id}, include=["metadatas"])
-        chunks = len(results.get('ids', []))
-        return {"indexed": chunks > 0, "chunks": chunks}
-    except Exception:
-        try:
-            collection = get_or_create_collection()
-            results = collection.get(include=["metadatas"])
-            chunks = 0
-            for meta in results.get('metadatas', []):
-                if meta and (meta.get('doc_id') == doc_id or doc_id in meta.get('url', '')):
-                    chunks += 1
-            return {"indexed": chunks > 0, "chunks": chunks}
-        except Exception:
-            return {"indexed": False, "chunks": 0}
+        _ensure_registry()
+        found = doc_registry.lookup(doc_ids)
+    except Exception as e:
+        print(f"[VECTORDB] Errore lookup registro: {e}", flush=True)
+        found = dict.fromkeys(doc_ids, 0)
+    return {doc_id: {"indexed": chunks > 0, "chunks": chunks} for doc_id, chunks in found.items()}
+
+
+def is_document_indexed(doc_id):
+    return are_documents_indexed([doc_id])[doc_id]
+
+
+def delete_document_chunks(url):
+    """Elimina tutti i chunk di un documento (URL esatto)"""
+    collection = get_or_create_collection()
+    collection.delete(where={"url": url})
+    doc_registry.remove([url])
+    keyword_index.remove_urls([url])
+    _bump_collection_version()
+
+
+def reset_collection():
+    """Elimina l'intera collection e azzera registro e cache"""
+    get_or_create_collection()
+    chroma_client.delete_collection("epstein_docs")
+    doc_registry.rebuild({})
+    keyword_index.clear()
+    _bump_collection_version()
 
 
 def delete_from_vectordb(url_pattern):
+    """Elimina i documenti il cui URL contiene url_pattern (di norma un prefisso come merge://id)"""
     try:
+        _ensure_registry()
+        urls = doc_registry.urls_matching(url_pattern)
+        if not urls:
+            return {"deleted": 0}
         collection = get_or_create_collection()
-        all_data = collection.get(include=["metadatas"])
-        ids_to_delete = []
-        for i, meta in enumerate(all_data.get('metadatas', [])):
-            if meta and url_pattern in meta.get('url', ''):
-                ids_to_delete.append(all_data['ids'][i])
-        if ids_to_delete:
-            collection.delete(ids=ids_to_delete)
-            print(f"[VECTORDB] Eliminati {len(ids_to_delete)} chunk per pattern '{url_pattern}'", flush=True)
-            return {"deleted": len(ids_to_delete)}
-        return {"deleted": 0}
+        url_list = list(urls)
+        for start in range(0, len(url_list), 500):
+            collection.delete(where={"url": {"$in": url_list[start:start + 500]}})
+        doc_registry.remove(url_list)
+        keyword_index.remove_urls(url_list)
+        _bump_collection_version()
+        deleted = sum(urls.values())
+        print(f"[VECTORDB] Eliminati {deleted} chunk per pattern '{url_pattern}'", flush=True)
+        return {"deleted": deleted}
     except Exception as e:
         print(f"[VECTORDB] Errore eliminazione: {e}", flush=True)
         return {"deleted": 0, "error": str(e)}
 
 
-def semantic_search(query, n_results=20):
-    """Ricerca semantica nei documenti"""
-    collection = get_or_create_collection()
-    results = collection.query(
-        query_texts=[query], n_results=n_results,
-        include=["documents", "metadatas", "distances"],
-    )
-    formatted = []
-    seen_urls = set()
-    for i, doc in enumerate(results['documents'][0]):
-        meta = results['metadatas'][0][i]
-        distance = results['distances'][0][i] if results['distances'] else 0
-        if meta['url'] in seen_urls:
+RRF_K = 60  # costante standard della reciprocal rank fusion
+SEARCH_OVERFETCH = 3            # chunk richiesti per ogni documento atteso
+SEARCH_MAX_CHUNKS = 1000        # tetto dell'over-fetch adattivo
+
+
+def _aggregate_documents(results, qi, aggregate="max", space="l2"):
+    """
+    Raggruppa i chunk della query qi-esima per documento (URL).
+    Punteggio documento: similarità massima ("max") o somma ("sum") dei suoi chunk;
+    il testo restituito è quello del chunk migliore. space è la distanza della
+    collection (metadato hnsw:space, "l2" se assente).
+    """
+    docs = {}
+    distances = results.get('distances')
+    for i, doc in enumerate(results['documents'][qi]):
+        meta = results['metadatas'][qi][i]
+        similarity = _similarity(distances[qi][i], space) if distances else 1.0
+        url = meta.get('url', '')
+        entry = docs.get(url)
+        if entry is None:
+            docs[url] = {
+                "text": doc,
+                "title": meta.get('title', 'Unknown'),
+                "url": url,
+                "relevance": similarity,
+                "score": similarity,
+                "matched_chunks": 1,
+                "metadata": meta,
+            }
             continue
-        seen_urls.add(meta['url'])
-        formatted.append({
-            "text": doc,
-            "title": meta.get('title', 'Unknown'),
-            "url": meta.get('url', ''),
-            "relevance": 1 - distance,
-            "metadata": meta,
-        })
-    return formatted
-
-
-# ── Funzioni di supporto per InvestigatorAgent e NetworkAgent ──
-
-def extract_entities_from_text(text):
-    """Estrae entità (nomi, email, date, denaro) dal testo"""
-    entities = {
-        "people": set(), "organizations": set(), "locations": set(),
-        "emails": set(), "dates": set(), "money": set(),
-    }
-    # Split into segments at sentence/line boundaries to avoid cross-sentence merges
-    segments = re.split(r'[.!?\n\r]+', text)
-    names = []
-    for segment in segments:
-        clean_seg = re.sub(r'\s+', ' ', segment).strip()
-        if not clean_seg:
+        entry["matched_chunks"] += 1
+        if aggregate == "sum":
+            entry["score"] += similarity
+        if similarity > entry["relevance"]:
+            entry.update(text=doc, relevance=similarity, metadata=meta)
+            if aggregate != "sum":
+                entry["score"] = similarity
+    return sorted(docs.values(), key=lambda d: d["score"], reverse=True)
+
+
+def _join_chunks(a, b):
+    """Concatena due chunk consecutivi togliendo la sovrapposizione"""
+    if a[-CHUNK_OVERLAP:] == b[:CHUNK_OVERLAP]:
+        return a + b[CHUNK_OVERLAP:]
+    return a + "\n" + b
+
+
+def _attach_context(collection, docs):
+    """Aggiunge a ogni risultato il testo del chunk migliore con i chunk adiacenti (una sola get)"""
+    wanted = {}
+    for d in docs:
+        idx = d["metadata"].get("chunk_index")
+        if idx is None:
             continue
-        # Find consecutive capitalized words within this segment
-        cap_sequences = re.findall(r'(?:[A-Z][a-z]+[,;:\-]*(?:\s+|$)){2,}', clean_seg)
-        for seq in cap_sequences:
-            words = [w.rstrip(',;:-') for w in seq.strip().split()]
-            words = [w for w in words if w]
-            for i in range(len(words)):
-                if i + 1 < len(words):
-                    names.append(f"{words[i]} {words[i+1]}")
-                if i + 2 < len(words):
-                    names.append(f"{words[i]} {words[i+1]} {words[i+2]}")
-    stop_names = {
-        'The New', 'New York', 'United States', 'Dear Sir', 'Best Regards',
-        'Kind Regards', 'Thank You', 'Please Note', 'For Example', 'Prime Minister',
-        'Dear Jeffrey', 'Hey Jeffrey', 'The Daily', 'Daily Beast', 'New York Times',
-        'Wall Street', 'White House', 'United Kingdom', 'Los Angeles', 'San Francisco',
-        'The Guardian', 'Washington Post', 'Fox News', 'Dear Friend', 'Best Wishes',
-        'Happy Birthday', 'Merry Christmas', 'Happy New', 'Good Morning', 'Good Evening',
-        'Dear Mr', 'Dear Mrs', 'Dear Ms', 'The Honorable', 'His Excellency', 'Her Majesty',
-        'Democratic Party', 'Republican Party', 'Labour Party', 'Conservative Party',
-        'Supreme Court', 'District Court', 'High Court', 'Federal Court',
-        'January February', 'March April', 'October November', 'November December',
-        'Original Message', 'Sent Items', 'Read Receipt', 'Delivery Status',
-        'Auto Reply', 'Out Office', 'High Importance', 'Low Importance',
-    }
-    # Words that should never be part of a person's name
-    bad_words = {
-        # Email header terms
-        'sent', 'subject', 'from', 'to', 'date', 'reply', 'forward', 'forwarded',
-        'attachment', 'attached', 'received', 'importance', 'message', 'original',
-        'inbox', 'draft', 'drafts', 'deleted', 'archive', 'spam', 'junk',
-        'cc', 'bcc', 'mailto', 'regarding', 're',
-        # Document/legal terms often capitalized
-        'exhibit', 'page', 'paragraph', 'section', 'document', 'filed',
-        'redacted', 'sealed', 'confidential', 'privileged', 'produced',
-        'bates', 'stamped', 'marked', 'noted', 'stated', 'continued',
-        # Transport/misc terms
-        'flight', 'airport', 'reposition', 'passengers', 'departed',
-        'arrived', 'scheduled', 'cancelled', 'delayed',
-        # Location/organization suffixes mistaken for names
-        'beach', 'island', 'islands', 'city', 'county', 'state', 'park',
-        'avenue', 'boulevard', 'drive', 'road', 'lane', 'place',
-        'foundation', 'institute', 'university', 'college', 'school',
-        'corporation', 'company', 'group', 'associates', 'partners',
-        'management', 'capital', 'global', 'international', 'holdings',
-        'tower', 'building', 'center', 'centre', 'plaza', 'hotel',
-        'asset', 'assets', 'fund', 'funds', 'trust', 'services',
-        'girl', 'boy', 'man', 'woman', 'child', 'children',
-        # Common false positive verbs/words when capitalized
-        'having', 'being', 'doing', 'going', 'coming', 'making',
-        'taking', 'getting', 'putting', 'setting', 'running',
-        'called', 'wrote', 'said', 'told', 'asked', 'sent',
-        'monday', 'tuesday', 'wednesday', 'thursday', 'friday',
-        'saturday', 'sunday',
-        'january', 'february', 'march', 'april', 'may', 'june',
-        'july', 'august', 'september', 'october', 'november', 'december',
+        version = d["metadata"].get("chunker_version", 1)
+        for neighbour in (idx - 1, idx + 1):
+            if 0 <= neighbour < d["metadata"].get("total_chunks", neighbour + 1):
+                wanted[generate_doc_id(d["url"], neighbour, version)] = None
+    if wanted:
+        found = collection.get(ids=list(wanted), include=["documents"])
+        wanted.update(zip(found['ids'], found['documents']))
+    for d in docs:
+        idx = d["metadata"].get("chunk_index")
+        context = d["text"]
+        if idx is not None:
+            version = d["metadata"].get("chunker_version", 1)
+            prev = wanted.get(generate_doc_id(d["url"], idx - 1, version))
+            nxt = wanted.get(generate_doc_id(d["url"], idx + 1, version))
+            if prev:
+                context = _join_chunks(prev, context)
+            if nxt:
+                context = _join_chunks(context, nxt)
+        d["context"] = context
+
+
+def _hybrid_merge(vector_docs, keyword_docs, n_results, k=RRF_K):
+    """Fonde (RRF) la classifica densa e quella BM25 di una query, a livello di documento"""
+    merged = {}
+    scores = defaultdict(float)
+    for rank, d in enumerate(vector_docs, 1):
+        scores[d["url"]] += 1.0 / (k + rank)
+        merged[d["url"]] = dict(d, match="vector")
+    for rank, d in enumerate(keyword_docs, 1):
+        url = d["url"]
+        scores[url] += 1.0 / (k + rank)
+        if url in merged:
+            merged[url].update(bm25=d["bm25"], match="hybrid")
+        else:
+            merged[url] = {
+                "text": d["text"],
+                "title": d["title"],
+                "url": url,
+                "relevance": 0.0,
+                "score": 0.0,
+                "matched_chunks": 1,
+                "metadata": d["metadata"],
+                "bm25": d["bm25"],
+                "match": "keyword",
+            }
+    ranked = sorted(merged, key=scores.get, reverse=True)[:n_results]
+    return [dict(merged[url], hybrid_score=round(scores[url], 6)) for url in ranked]
+
+
+def fuse_rankings(rankings, k=RRF_K):
+    """Reciprocal rank fusion di più liste di risultati (per URL)"""
+    scores = defaultdict(float)
+    best = {}
+    for ranking in rankings:
+        for rank, r in enumerate(ranking, 1):
+            url = r['url']
+            scores[url] += 1.0 / (k + rank)
+            if url not in best or r['relevance'] > best[url]['relevance']:
+                best[url] = r
+    fused = []
+    for url in sorted(scores, key=scores.get, reverse=True):
+        fused.append(dict(best[url], rrf_score=round(scores[url], 6)))
+    return fused
+
+
+def _normalize_query(query):
+    return " ".join(query.split())
+
+
+def embed_queries(queries):
+    """Embedding delle query: quelli già noti dalla cache, i mancanti in un solo batch"""
+    embeddings = [embedding_cache.get(q) for q in queries]
+    missing = list(dict.fromkeys(q for q, e in zip(queries, embeddings) if e is None))
+    if missing:
+        computed = dict(zip(missing, _get_embedding_function()(missing)))
+        for q, e in computed.items():
+            embedding_cache.set(q, e)
+        embeddings = [e if e is not None else computed[q] for q, e in zip(queries, embeddings)]
+    return embeddings
+
+
+def semantic_search_many(queries, n_results=20, fuse=False, aggregate="max", hybrid=True):
+    """
+    Ricerca semantica di più query con un solo collection.query:
+    gli embedding delle query sono calcolati in un unico batch.
+    Risultati a livello di documento: si chiedono più chunk del necessario
+    (over-fetch) raddoppiando finché ogni query ha n_results documenti distinti
+    o la collection è esaurita. Ogni documento riporta il chunk migliore e,
+    in "context", lo stesso chunk con i vicini.
+    Con hybrid=True la classifica densa è fusa (RRF) con quella BM25
+    dell'indice per parole chiave.
+    Le query già viste con la stessa versione della collection escono dalla cache.
+    Ritorna {"results": [risultati per query], "fused": classifica RRF o None}.
+    """
+    queries = [_normalize_query(q) for q in queries if q and q.strip()]
+    if not queries:
+        return {"results": [], "fused": [] if fuse else None}
+
+    version = _collection_version
+    per_query = [result_cache.get((q, n_results, aggregate, hybrid, version)) for q in queries]
+    todo = list(dict.fromkeys(q for q, r in zip(queries, per_query) if r is None))
+    if todo:
+        collection = get_or_create_collection()
+        space = (collection.metadata or {}).get("hnsw:space", "l2")
+        embeddings = dict(zip(todo, embed_queries(todo)))
+        fresh = {}
+        pending = todo
+        max_k = max(1, min(SEARCH_MAX_CHUNKS, collection.count()))
+        k = min(n_results * SEARCH_OVERFETCH, max_k)
+        while pending:
+            results = collection.query(
+                query_embeddings=[embeddings[q] for q in pending], n_results=k,
+                include=["documents", "metadatas", "distances"],
+            )
+            retry = []
+            for qi, q in enumerate(pending):
+                docs = _aggregate_documents(results, qi, aggregate, space)
+                exhausted = len(results['ids'][qi]) < k or k >= max_k
+                if len(docs) < n_results and not exhausted:
+                    retry.append(q)
+                else:
+                    fresh[q] = docs[:n_results]
+            pending = retry
+            k = min(k * 2, max_k)
+
+        if hybrid:
+            try:
+                _ensure_keyword_index()
+                for q in todo:
+                    fresh[q] = _hybrid_merge(fresh[q], keyword_index.search(q, limit=n_results), n_results)
+            except Exception as e:
+                print(f"[VECTORDB] Ricerca BM25 non disponibile: {e}", flush=True)
+
+        _attach_context(collection, [d for docs in fresh.values() for d in docs])
+        for q, docs in fresh.items():
+            result_cache.set((q, n_results, aggregate, hybrid, version), docs)
+        per_query = [r if r is not None else fresh[q] for q, r in zip(queries, per_query)]
+
+    per_query = copy.deepcopy(per_query)
+    return {
+        "results": per_query,
+        "fused": fuse_rankings(per_query)[:n_results] if fuse else None,
     }
-    bad_patterns = [
-        r'^The\s+', r'^Dear\s+', r'^Hey\s+', r'^Mr\s+', r'^Mrs\s+', r'^Ms\s+', r'^Dr\s+',
-        r'Party$', r'Court$', r'Street$', r'Times$', r'Post$', r'News$',
-        r'Minister$', r'President$', r'Having\s+', r'With\s+', r'From\s+',
-        r'About\s+', r'After\s+', r'Before\s+',
-        r'\s+But\s+', r'\s+And\s+', r'\s+Or\s+',
-        r'\s+Will\s+', r'\s+Would\s+', r'\s+Could\s+', r'\s+Should\s+',
-    ]
-    for name in names:
-        if len(name) < 8 or len(name) > 35:
-            continue
-        if len(name.split()) > 3:
-            continue
-        if name in stop_names:
-            continue
-        # Check if any word in the name is a known bad word
-        name_words = name.lower().split()
-        if any(w in bad_words for w in name_words):
-            continue
-        skip = False
-        for pattern in bad_patterns:
-            if re.search(pattern, name, re.IGNORECASE):
-                skip = True
-                break
-        if skip:
-            continue
-        entities["people"].add(name)
 
-    # When a 3-word name exists, remove its 2-word subsets (they're partial matches)
-    three_word_names = [n for n in entities["people"] if len(n.split()) == 3]
-    partial_to_remove = set()
-    for name3 in three_word_names:
-        parts = name3.split()
-        partial_to_remove.add(f"{parts[0]} {parts[1]}")
-        partial_to_remove.add(f"{parts[1]} {parts[2]}")
-    entities["people"] -= partial_to_remove
 
-    entities["emails"] = set(re.findall(r'[\w\.-]+@[\w\.-]+\.\w+', text))
+def semantic_search(query, n_results=20, aggregate="max", hybrid=True):
+    """Ricerca semantica (ibrida densa + BM25) nei documenti: fino a n_results documenti distinti"""
+    return semantic_search_many([query], n_results, aggregate=aggregate, hybrid=hybrid)["results"][0]
 
-    date_patterns = [
-        r'\b(?:January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2},?\s+\d{4}\b',
-        r'\b\d{1,2}/\d{1,2}/\d{2,4}\b',
-        r'\b\d{4}-\d{2}-\d{2}\b',
-    ]
-    for pattern in date_patterns:
-        entities["dates"].update(re.findall(pattern, text, re.IGNORECASE))
 
-    money_pattern = r'[\$€£]\s*[\d,]+(?:\.\d{2})?(?:\s*(?:million|billion|thousand|k|m|b))?|\d+(?:,\d{3})*(?:\.\d{2})?\s*(?:dollars|euros|pounds|USD|EUR|GBP)'
-    entities["money"] = set(re.findall(money_pattern, text, re.IGNORECASE))
+# ── Funzioni di supporto per InvestigatorAgent e NetworkAgent ──
 
-    return {k: list(v) for k, v in entities.items()}
+def extract_entities_from_text(text):
+    """Estrae entità (nomi, email, date, denaro) dal testo"""
+    return extract_entities(text)
 
 
 def get_wikipedia_info(name):
@@ -287,34 +597,17 @@ def get_wikipedia_info(name):
 
 
 def build_network_graph(documents):
-    """Costruisce un grafo delle relazioni tra entità"""
+    """
+    Grafo delle relazioni tra persone: sottografo delle co-occorrenze
+    archiviate per i documenti dati (le persone più citate e i loro archi)
+    """
     G = nx.Graph()
-    all_entities = defaultdict(lambda: {"docs": [], "count": 0})
-    doc_entities = []
-    for doc in documents:
-        text = doc.get('full_text', '') or doc.get('text', '') or ' '.join(doc.get('snippets', []))
-        entities = extract_entities_from_text(text)
-        doc_entities.append({"doc": doc, "entities": entities})
-        for person in entities.get('people', []):
-            all_entities[person]["count"] += 1
-            all_entities[person]["docs"].append(doc.get('title', 'Unknown'))
-
-    top_people = sorted(all_entities.items(), key=lambda x: x[1]["count"], reverse=True)[:50]
-    for person, data in top_people:
-        G.add_node(person, type="person", count=data["count"], docs=data["docs"][:5])
-
-    for doc_data in doc_entities:
-        people = doc_data["entities"].get("people", [])
-        for i, p1 in enumerate(people):
-            if p1 not in G:
-                continue
-            for p2 in people[i + 1:]:
-                if p2 not in G:
-                    continue
-                if G.has_edge(p1, p2):
-                    G[p1][p2]["weight"] += 1
-                else:
-                    G.add_edge(p1, p2, weight=1)
+    people, edges = cooccurrence_subgraph(documents)
+    for person, indices in people:
+        G.add_node(person, type="person", count=len(indices),
+                   docs=[documents[i].get('title', 'Unknown') for i in indices[:5]])
+    for (p1, p2), weight in edges.items():
+        G.add_edge(p1, p2, weight=weight)
     return G
 
 
@@ -10,11 +10,39 @@ os.makedirs(DOCUMENTS_DIR, exist_ok=True)
 
 CHROMA_PATH = os.path.join(BASE_DIR, "chroma_db")
 
+INDEX_DIR = os.path.join(BASE_DIR, "index_data")
+os.makedirs(INDEX_DIR, exist_ok=True)
+INDEX_MANIFEST = os.path.join(INDEX_DIR, "index_manifest.json")
+DOC_REGISTRY_DB = os.path.join(INDEX_DIR, "doc_registry.sqlite")
+KEYWORD_INDEX_DB = os.path.join(INDEX_DIR, "keyword_index.sqlite")
+EFTA_REGISTRY_DB = os.path.join(INDEX_DIR, "efta_registry.sqlite")
+ENTITY_STORE_DB = os.path.join(INDEX_DIR, "document_entities.sqlite")
+
+PDF_CACHE_DB = os.path.join(DOCUMENTS_DIR, "pdf_cache.sqlite")
+PDF_CACHE_MAX_BYTES = 64 * 1024 * 1024
+PDF_CACHE_MAX_DISK_BYTES = 1024 * 1024 * 1024  # byte compressi nello store sqlite
+
+# Estrazione PDF su pool di processi
+PDF_WORKERS = max(1, (os.cpu_count() or 2) - 1)
+PDF_PARALLEL_MIN_PAGES = 16        # sotto questa soglia si estrae nel processo corrente
+PDF_PAGES_PER_TASK = 8
+
 ANALYSES_DIR = os.path.join(BASE_DIR, "saved_analyses")
 os.makedirs(ANALYSES_DIR, exist_ok=True)
 
 EMAILS_PARQUET = os.path.join(BASE_DIR, "epstein_emails.parquet")
+EMAILS_FTS_DB = os.path.join(INDEX_DIR, "emails_fts.sqlite")
+EMAILS_FTS_MMAP_BYTES = 256 * 1024 * 1024
+EMAIL_BODY_BATCH_ROWS = 256        # righe per blocco di corpi email decodificati (lettura e indicizzazione)
+EMAIL_BODY_CACHE_BATCHES = 8       # blocchi di corpi email tenuti decodificati
+EMAILS_BODY_BLOCK = os.path.join(INDEX_DIR, "emails_bodies.bin")  # corpi senza HTML, minuscoli (ricerca per sottostringa)
+EMAILS_GRAPH_DB = os.path.join(INDEX_DIR, "emails_graph.sqlite")
+EMAIL_GRAPH_TOP_EDGES = 200        # archi restituiti per persona (o in totale senza persona)
+EMAIL_GRAPH_EDGE_THREADS = 20      # thread elencati per arco (il totale è in thread_count)
 FLIGHTS_JSON = os.path.join(BASE_DIR, "epstein_flights_data.json")
+FLIGHTS_FIRST_YEAR = None          # anno del primo volo del registro (le date hanno solo giorno e mese)
+FLIGHTS_PAGE_SIZE = 50
+FLIGHTS_MAX_PAGE_SIZE = 1000
 
 SECRET_KEY = "epstein-files-analyzer-secret-key"
 
@@ -31,3 +59,20 @@ VALID_MODELS = [
 VALID_LANGUAGES = [
     "Italiano", "English", "Español", "Français", "Deutsch", "Português"
 ]
+
+# ── justice.gov client ─────────────────────────────────────────
+JUSTICE_GOV_CACHE_SIZE = 2048
+JUSTICE_GOV_CACHE_TTL = 3600       # secondi
+JUSTICE_GOV_RATE = 4.0             # richieste/secondo (media)
+JUSTICE_GOV_BURST = 8              # richieste consentite a raffica
+JUSTICE_GOV_MAX_WORKERS = 4        # pagine scaricate in parallelo
+JUSTICE_GOV_PAGE_RETRIES = 2       # nuovi tentativi per una pagina in errore
+
+# ── Ricerca semantica ──────────────────────────────────────────
+SEARCH_EMBEDDING_CACHE_SIZE = 4096  # embedding di query già calcolati
+SEARCH_RESULT_CACHE_SIZE = 512      # risultati per (query, n_results, versione collection)
+
+# ── Entità e grafo delle co-occorrenze ─────────────────────────
+NETWORK_TOP_PEOPLE = 50             # nodi del grafo restituito da build_network_graph
+ENTITY_PAIR_MAX_PEOPLE = 100        # persone per documento (le più citate) considerate per le coppie
+COOCCURRENCE_WINDOW = 400           # caratteri: due persone co-occorrono se citate a questa distanza (≈ uno snippet)
@@ -1,10 +1,22 @@
 """
 Stato condiviso: MongoDB, DataFrame email, flag OCR.
-Tutto inizializzato via init_app() o al primo import.
+Tutto inizializzato via init_app() o al primo import, tranne il dataset
+email che viene letto al primo uso.
 """
+import os
+import threading
+from bisect import bisect_right
+from collections import OrderedDict
+
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from pymongo import MongoClient
-from app.config import MONGO_URI, DB_SETTINGS_NAME, DB_EPSTEIN_NAME, EMAILS_PARQUET
+from app.config import (
+    MONGO_URI, DB_SETTINGS_NAME, DB_EPSTEIN_NAME, EMAILS_PARQUET,
+    EMAIL_BODY_BATCH_ROWS, EMAIL_BODY_CACHE_BATCHES, PDF_CACHE_DB, PDF_CACHE_MAX_BYTES, PDF_CACHE_MAX_DISK_BYTES,
+)
+from app.services.pdf_cache import PdfTextCache
 
 # ── MongoDB ────────────────────────────────────────────────────
 mongo_client = MongoClient(MONGO_URI)
@@ -22,16 +34,113 @@ people_collection = db_epstein["people"]
 app_settings_collection = db_epstein["app_settings"]
 
 # ── Email DataFrame ────────────────────────────────────────────
-EMAILS_DF = None
-try:
-    import os
-    if os.path.exists(EMAILS_PARQUET):
-        EMAILS_DF = pd.read_parquet(EMAILS_PARQUET)
-        print(f"✅ Dataset email caricato: {len(EMAILS_DF)} email")
-    else:
-        print("⚠️  Dataset email non trovato.")
-except Exception as e:
-    print(f"⚠️  Errore caricamento dataset email: {e}")
+# Caricamento pigro: al primo uso solo le colonne di metadati; i corpi
+# (message_html) si leggono su richiesta dal parquet mappato in memoria,
+# a blocchi di EMAIL_BODY_BATCH_ROWS righe (anche dentro un row group unico).
+EMAIL_BODY_COLUMN = "message_html"
+
+_emails_df = None
+_emails_loaded = False
+_emails_lock = threading.Lock()
+_parquet_file = None
+_body_batches = OrderedDict()  # (row group, blocco) → message_html decodificato (LRU)
+
+
+def get_emails_df():
+    """DataFrame email senza i corpi dei messaggi (caricato al primo uso), None se assente"""
+    global _emails_df, _emails_loaded
+    if not _emails_loaded:
+        with _emails_lock:
+            if not _emails_loaded:
+                try:
+                    if os.path.exists(EMAILS_PARQUET):
+                        columns = [c for c in pq.read_schema(EMAILS_PARQUET).names if c != EMAIL_BODY_COLUMN]
+                        _emails_df = pd.read_parquet(EMAILS_PARQUET, columns=columns)
+                        print(f"✅ Dataset email caricato: {len(_emails_df)} email")
+                    else:
+                        print("⚠️  Dataset email non trovato.")
+                except Exception as e:
+                    print(f"⚠️  Errore caricamento dataset email: {e}")
+                _emails_loaded = True
+    return _emails_df
+
+
+def _open_parquet():
+    global _parquet_file
+    if _parquet_file is None:
+        _parquet_file = pq.ParquetFile(pa.memory_map(EMAILS_PARQUET, "r"))
+    return _parquet_file
+
+
+def _group_starts(pf):
+    starts = [0]
+    for i in range(pf.metadata.num_row_groups):
+        starts.append(starts[-1] + pf.metadata.row_group(i).num_rows)
+    return starts
+
+
+def iter_email_bodies(batch_rows=EMAIL_BODY_BATCH_ROWS):
+    """
+    Corpi HTML di tutte le email in ordine, a blocchi: (prima riga, [corpi]).
+    Un blocco alla volta resta decodificato, senza toccare la cache; il file
+    è aperto a parte per non contendere il lock alle letture puntuali.
+    """
+    if not os.path.exists(EMAILS_PARQUET):
+        return
+    pf = pq.ParquetFile(pa.memory_map(EMAILS_PARQUET, "r"))
+    row = 0
+    for batch in pf.iter_batches(batch_size=batch_rows, columns=[EMAIL_BODY_COLUMN]):
+        bodies = [v or "" for v in batch.column(0).to_pylist()]
+        yield row, bodies
+        row += len(bodies)
+
+
+def get_email_bodies(rows):
+    """
+    Corpi HTML delle email alle posizioni date, letti solo dai blocchi di
+    EMAIL_BODY_BATCH_ROWS righe che le contengono; gli ultimi blocchi letti
+    restano decodificati in formato Arrow.
+    """
+    rows = [int(r) for r in rows]
+    if not os.path.exists(EMAILS_PARQUET):
+        return [""] * len(rows)
+    with _emails_lock:
+        pf = _open_parquet()
+        starts = _group_starts(pf)
+        wanted = {}
+        for row in rows:
+            group = bisect_right(starts, row) - 1
+            wanted.setdefault((group, (row - starts[group]) // EMAIL_BODY_BATCH_ROWS), set()).add(row)
+        bodies = {}
+        for group in sorted({g for g, _ in wanted}):
+            needed = {b for g, b in wanted if g == group and (g, b) not in _body_batches}
+            if needed:
+                # Il row group si scorre a blocchi fino all'ultimo richiesto
+                batches = pf.iter_batches(batch_size=EMAIL_BODY_BATCH_ROWS, row_groups=[group],
+                                          columns=[EMAIL_BODY_COLUMN])
+                for index, batch in enumerate(batches):
+                    if index in needed:
+                        _body_batches[(group, index)] = batch.column(0)
+                        needed.discard(index)
+                    if not needed:
+                        break
+        for (group, index), batch_rows in wanted.items():
+            column = _body_batches[(group, index)]
+            _body_batches.move_to_end((group, index))
+            offset = starts[group] + index * EMAIL_BODY_BATCH_ROWS
+            for row in batch_rows:
+                bodies[row] = column[row - offset].as_py() or ""
+        while len(_body_batches) > EMAIL_BODY_CACHE_BATCHES:
+            _body_batches.popitem(last=False)
+    return [bodies[row] for row in rows]
+
+
+def __getattr__(name):
+    # Compatibilità: EMAILS_DF resta importabile, ma si carica solo quando viene usato
+    if name == "EMAILS_DF":
+        return get_emails_df()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 # ── OCR flags ──────────────────────────────────────────────────
 OCR_AVAILABLE = False
@@ -50,7 +159,8 @@ except ImportError:
     print("⚠️  PyMuPDF non disponibile. Installa: pip install PyMuPDF")
 
 # ── PDF cache ──────────────────────────────────────────────────
-pdf_cache = {}
+pdf_cache = PdfTextCache(PDF_CACHE_DB, max_memory_bytes=PDF_CACHE_MAX_BYTES,
+                         max_disk_bytes=PDF_CACHE_MAX_DISK_BYTES)
 
 
 def init_app(app):
@@ -1,5 +1,5 @@
 """
-/api/documents/*, /api/vectordb/*, /api/archive/ask — 6 route
+/api/documents/*, /api/vectordb/*, /api/archive/ask — 7 route
 """
 import os
 from flask import Blueprint, jsonify, request, send_from_directory
@@ -38,13 +38,24 @@ def api_document_pdf(doc_id):
 
 @bp.route('/api/vectordb/stats', methods=['GET'])
 def api_vectordb_stats():
-    from app.agents.vectordb import get_collection_stats
+    from app.agents.vectordb import get_collection_stats, get_search_cache_stats
     from app.services.documents import count_local_txt
     stats = get_collection_stats()
     stats['local_documents'] = count_local_txt()
+    stats['search_cache'] = get_search_cache_stats()
     return jsonify(stats)
 
 
+@bp.route('/api/vectordb/recount', methods=['POST'])
+def api_vectordb_recount():
+    """Riallinea il registro documenti con il contenuto reale della collection"""
+    from app.agents.vectordb import recount_collection
+    try:
+        return jsonify(recount_collection())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
 @bp.route('/api/vectordb/check/<doc_id>', methods=['GET'])
 def api_vectordb_check(doc_id):
     from app.agents.vectordb import is_document_indexed
@@ -73,7 +84,7 @@ def api_archive_ask():
         for i, r in enumerate(rag_results, 1):
             doc_id = r.get('metadata', {}).get('doc_id', r.get('title', f'doc_{i}'))
             relevance = r.get('relevance', 0)
-            context += f"### [{doc_id}] (relevance: {relevance:.2f})\n{r.get('text', '')}\n\n---\n\n"
+            context += f"### [{doc_id}] (relevance: {relevance:.2f})\n{r.get('context') or r.get('text', '')}\n\n---\n\n"
             sources.append({'doc_id': doc_id, 'relevance': relevance, 'title': r.get('title', '')})
 
         prompt = f"""{context}
@@ -1,60 +1,78 @@
 """
 /api/flights, /api/flights/passengers
 """
-import json
-from flask import Blueprint, jsonify
-from app.config import FLIGHTS_JSON
-import os
+from flask import Blueprint, Response, jsonify, request
+from app.config import FLIGHTS_PAGE_SIZE
+from app.services.flights import get_flight_log
 
 bp = Blueprint("flights", __name__)
 
-_flights_cache = {}
+# Parametri di /api/flights che attivano la query filtrata e paginata
+QUERY_PARAMS = ("passenger", "with", "airport", "from", "to", "route", "tail",
+                "date_from", "date_to", "page", "per_page")
 
 
-def _load_flights_data():
-    """Carica e cache i dati voli dal JSON."""
-    if _flights_cache.get('data') is not None:
-        return _flights_cache['data']
+def _int_arg(name, default):
     try:
-        if os.path.exists(FLIGHTS_JSON):
-            with open(FLIGHTS_JSON, 'r') as f:
-                _flights_cache['data'] = json.load(f)
-        else:
-            _flights_cache['data'] = None
-    except Exception:
-        _flights_cache['data'] = None
-    return _flights_cache['data']
+        return int(request.args.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _conditional(log, build, *key):
+    """Risposta con ETag; 304 senza ricalcolarla se il client ha già questa versione"""
+    etag = log.etag(request.path, *key)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    return response
 
 
 @bp.route('/api/flights')
 def api_flights():
+    """
+    Senza parametri: il registro voli completo (come il JSON originale).
+    Con passenger, with (ripetibile), airport, from, to, route, tail,
+    date_from, date_to, page, per_page: i voli filtrati, una pagina alla volta.
+    """
     try:
-        data = _load_flights_data()
-        if data:
-            return jsonify(data)
-        else:
+        log = get_flight_log()
+        if log is None:
             return jsonify({"error": "Flight data not found", "flights": [], "route_counts": {}, "passenger_counts": {}})
+
+        if not any(p in request.args for p in QUERY_PARAMS):
+            return _conditional(log, lambda: log.data)
+
+        filters = {
+            "passenger": request.args.get('passenger', '').strip() or None,
+            "with_passengers": [p.strip() for p in request.args.getlist('with') if p.strip()],
+            "airport": request.args.get('airport', '').strip() or None,
+            "origin": request.args.get('from', '').strip() or None,
+            "destination": request.args.get('to', '').strip() or None,
+            "route": request.args.get('route', '').strip() or None,
+            "tail": request.args.get('tail', '').strip() or None,
+            "date_from": request.args.get('date_from', '').strip() or None,
+            "date_to": request.args.get('date_to', '').strip() or None,
+            "page": _int_arg('page', 1),
+            "per_page": _int_arg('per_page', FLIGHTS_PAGE_SIZE),
+        }
+        return _conditional(log, lambda: log.query(**filters), sorted(filters.items()))
+    except ValueError as e:
+        # Filtri per data senza anno iniziale del registro
+        return jsonify({"error": str(e), "flights": [], "route_counts": {}, "passenger_counts": {}}), 400
     except Exception as e:
         return jsonify({"error": str(e), "flights": [], "route_counts": {}, "passenger_counts": {}})
 
 
 @bp.route('/api/flights/passengers')
 def api_flights_passengers():
-    """Restituisce tutti i nomi passeggeri unici estratti dai voli."""
+    """Restituisce tutti i nomi passeggeri unici estratti dai voli (sigle espanse)."""
     try:
-        data = _load_flights_data()
-        if not data:
+        log = get_flight_log()
+        if log is None:
             return jsonify({"passengers": []})
-
-        names = set()
-        skip = {'JE', 'GM', 'REPOSITION', 'NO PASSENGERS', 'EMPTY', 'N/A', ''}
-        for flight in data.get('flights', []):
-            raw = flight.get('passengers', '')
-            for part in raw.split(','):
-                name = part.strip()
-                if name and name.upper() not in skip and len(name) > 2:
-                    names.add(name)
-
-        return jsonify({"passengers": sorted(names)})
+        return _conditional(log, lambda: {"passengers": log.passenger_names()})
     except Exception as e:
         return jsonify({"error": str(e), "passengers": []})
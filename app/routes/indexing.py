@@ -2,11 +2,8 @@
 /api/index-document, /api/index-batch,
 /api/vectordb/index-all-local POST+GET — 4 route
 """
-import os
 import uuid
-import threading
 from flask import Blueprint, jsonify, request
-from app.config import DOCUMENTS_DIR
 from app.services.pdf import download_pdf_text
 from app.services.jobs import job_manager
 
@@ -40,13 +37,13 @@ def api_index_document():
 @bp.route('/api/index-batch', methods=['POST'])
 def api_index_batch():
     """Indicizza un batch di documenti"""
-    from app.agents.vectordb import add_document_to_vectordb
+    from app.agents.vectordb import add_documents_to_vectordb
 
     data = request.json
     documents = data.get('documents', [])
 
-    indexed = 0
     errors = []
+    to_index = []
 
     for doc in documents:
         url = doc.get('url', '')
@@ -61,11 +58,15 @@ def api_index_batch():
             errors.append({"url": url, "error": text})
             continue
 
+        to_index.append({"url": url, "title": title, "text": text})
+
+    indexed = 0
+    if to_index:
         try:
-            add_document_to_vectordb(url, title, text)
-            indexed += 1
+            add_documents_to_vectordb(to_index)
+            indexed = len(to_index)
         except Exception as e:
-            errors.append({"url": url, "error": str(e)})
+            errors.extend({"url": d["url"], "error": str(e)} for d in to_index)
 
     return jsonify({
         "indexed": indexed,
@@ -79,51 +80,13 @@ vectordb_index_jobs = {}
 
 @bp.route('/api/vectordb/index-all-local', methods=['POST'])
 def api_vectordb_index_all_local():
-    """Indicizza tutti i documenti locali in background"""
-    from app.agents.vectordb import add_document_to_vectordb
-
-    job_id = str(uuid.uuid4())
-    vectordb_index_jobs[job_id] = {
-        'status': 'running',
-        'progress': 'Avvio indicizzazione...',
-        'indexed': 0,
-        'skipped': 0,
-        'errors': [],
-        'total': 0
-    }
-
-    def _index_all():
-        try:
-            txt_files = [f for f in os.listdir(DOCUMENTS_DIR) if f.endswith('.txt')]
-            vectordb_index_jobs[job_id]['total'] = len(txt_files)
-
-            for i, filename in enumerate(txt_files):
-                doc_id = filename.replace('.txt', '')
-                vectordb_index_jobs[job_id]['progress'] = f'Indicizzazione {i+1}/{len(txt_files)}: {doc_id}'
-
-                try:
-                    txt_path = os.path.join(DOCUMENTS_DIR, filename)
-                    with open(txt_path, 'r', encoding='utf-8') as f:
-                        text = f.read()
-
-                    if not text.strip() or text.startswith('[Errore'):
-                        vectordb_index_jobs[job_id]['skipped'] += 1
-                        continue
-
-                    url = f"local://documents/{doc_id}"
-                    add_document_to_vectordb(url, doc_id, text, {'doc_id': doc_id})
-                    vectordb_index_jobs[job_id]['indexed'] += 1
-                except Exception as e:
-                    vectordb_index_jobs[job_id]['errors'].append({'doc_id': doc_id, 'error': str(e)})
-
-            vectordb_index_jobs[job_id]['status'] = 'completed'
-            vectordb_index_jobs[job_id]['progress'] = 'Completato!'
-            print(f"[INDEX-ALL] Completato: {vectordb_index_jobs[job_id]['indexed']} indicizzati", flush=True)
-        except Exception as e:
-            vectordb_index_jobs[job_id]['status'] = 'error'
-            vectordb_index_jobs[job_id]['progress'] = f'Errore: {str(e)}'
+    """Indicizza in background i documenti locali nuovi o modificati"""
+    from app.services.indexer import start_local_index_job
 
-    threading.Thread(target=_index_all, daemon=True).start()
+    force = bool((request.get_json(silent=True) or {}).get('force', False))
+    job_id, started = start_local_index_job(str(uuid.uuid4()), vectordb_index_jobs, force=force)
+    if not started:
+        return jsonify({'error': 'Indicizzazione già in corso', 'job_id': job_id, 'status': 'running'}), 409
     return jsonify({'job_id': job_id, 'status': 'started'})
 
 
@@ -9,7 +9,7 @@ from pathlib import Path
 from flask import Blueprint, jsonify, request, Response
 from app.services.claude import get_anthropic_client, call_claude_with_retry
 from app.services.settings import get_model, get_language_instruction
-from app.services.justice_gov import search_justice_gov
+from app.services.efta_registry import resolve_efta_id
 from app.services.pdf import download_pdf_text
 from app.config import ANALYSES_DIR
 from app.extensions import analyses_collection, deep_analyses_collection
@@ -110,10 +110,9 @@ def run_deep_analysis(job_id, doc_ids, context):
             deep_analysis_jobs[job_id]['progress'] = f'Analisi documento {i+1}/{len(doc_ids)}: {doc_id}...'
             print(f"[DEEP] Analisi {doc_id}", flush=True)
 
-            search_result = search_justice_gov(doc_id, 0)
+            doc = resolve_efta_id(doc_id)
 
-            if search_result.get('results'):
-                doc = search_result['results'][0]
+            if doc:
                 url = doc.get('url', '')
 
                 deep_analysis_jobs[job_id]['progress'] = f'Download {doc_id}...'
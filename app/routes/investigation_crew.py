@@ -471,9 +471,8 @@ def api_delete_all_investigations():
         counts['searches'] = r.deleted_count
 
         try:
-            from app.agents.vectordb import get_or_create_collection, chroma_client
-            collection = get_or_create_collection()
-            chroma_client.delete_collection("epstein_docs")
+            from app.agents.vectordb import reset_collection
+            reset_collection()
             counts['chromadb'] = 'reset'
         except Exception as e:
             counts['chromadb_error'] = str(e)
@@ -8,7 +8,7 @@ import uuid
 import threading
 from datetime import datetime
 from flask import Blueprint, jsonify, request
-from app.services.justice_gov import search_justice_gov
+from app.services.efta_registry import resolve_efta_id
 from app.services.pdf import download_pdf_text
 from app.services.claude import get_anthropic_client, call_claude_with_retry
 from app.services.settings import get_model, get_language_instruction
@@ -72,9 +72,8 @@ def run_merge_background(merge_id, investigation_ids):
 
         for doc_id in critical_doc_ids:
             try:
-                search_result = search_justice_gov(doc_id)
-                if search_result.get('results'):
-                    doc = search_result['results'][0]
+                doc = resolve_efta_id(doc_id)
+                if doc:
                     doc_url = doc.get('url', '')
 
                     if doc_url:
@@ -424,11 +423,10 @@ def api_deep_dive():
         })
 
     try:
-        search_result = search_justice_gov(doc_id)
-        if not search_result.get('results'):
+        doc = resolve_efta_id(doc_id)
+        if not doc:
             return jsonify({'error': f'Documento {doc_id} non trovato'})
 
-        doc = search_result['results'][0]
         doc_url = doc.get('url', '')
 
         if not doc_url:
@@ -4,7 +4,7 @@
 import uuid
 import threading
 from flask import Blueprint, jsonify, request
-from app.services.justice_gov import search_justice_gov
+from app.services.justice_gov import search_all_pages
 from app.services.pdf import download_pdf_text
 
 bp = Blueprint("network", __name__)
@@ -21,12 +21,8 @@ def run_network_job(job_id, query, documents, download_full):
 
     try:
         if not documents and query:
-            all_results = []
-            for page in range(3):
-                network_jobs[job_id]['progress'] = f'Ricerca pagina {page+1}/3...'
-                search_results = search_justice_gov(query, page=page)
-                all_results.extend(search_results.get('results', []))
-            documents = all_results
+            network_jobs[job_id]['progress'] = 'Ricerca documenti (3 pagine)...'
+            documents = search_all_pages(query, max_pages=3).get('results', [])
 
         network_jobs[job_id]['progress'] = f'Trovati {len(documents)} documenti'
 
@@ -1,11 +1,12 @@
 """
-/api/pdf-text, /api/ocr-status, /api/extract-images, /api/extract-images-batch — 4 route
+/api/pdf-text, /api/ocr-status, /api/extract-images, /api/extract-images-batch,
+/api/pdf-cache/stats — 5 route
 """
 import requests
 from flask import Blueprint, jsonify, request
 from app.services.pdf import download_pdf_text, extract_images_from_pdf
 from app.services.claude import get_claude_api_key
-from app.extensions import OCR_AVAILABLE, PYMUPDF_AVAILABLE
+from app.extensions import OCR_AVAILABLE, PYMUPDF_AVAILABLE, pdf_cache
 
 bp = Blueprint("ocr", __name__)
 
@@ -132,3 +133,9 @@ def api_extract_images_batch():
         "total_pdfs": len(results),
         "total_images": total_images
     })
+
+
+@bp.route('/api/pdf-cache/stats')
+def api_pdf_cache_stats():
+    """Statistiche della cache testi PDF (memoria + disco)"""
+    return jsonify(pdf_cache.stats())
@@ -4,30 +4,41 @@
 import re
 import threading
 from flask import Blueprint, jsonify, request
-from app.services.justice_gov import search_justice_gov
+from app.services.justice_gov import search_all_pages
 from app.services.pdf import download_pdf_text
-from app.agents.vectordb import extract_entities_from_text
+from app.services.entity_store import cooccurring_people
+from app.services.email_graph import get_email_graph
 
 bp = Blueprint("relationships", __name__)
 
 
 @bp.route('/api/relationships/emails')
 def api_relationships_emails():
-    """Estrae comunicazioni email dai documenti cercati su justice.gov"""
+    """
+    Comunicazioni email di una persona dal grafo del dataset email (senza persona:
+    le coppie più attive); se il grafo non trova nulla, estratte dai documenti
+    cercati su justice.gov
+    """
     try:
         communications = []
         person = request.args.get('person', '').strip()
 
+        graph = get_email_graph()
+        if graph is not None:
+            found = graph.edges_for(person) if person else graph.top_edges()
+            if found['edges']:
+                return jsonify({
+                    'communications': found['edges'],
+                    'total': found['total'],
+                    'searched_person': person or None,
+                    'matched_people': found['people'],
+                    'source': 'email_graph'
+                })
+
         if not person:
             return jsonify({'communications': [], 'total': 0, 'searched_person': None})
 
-        all_results = []
-        for page in range(10):
-            results = search_justice_gov(person, page=page)
-            new_results = results.get('results', [])
-            if not new_results:
-                break
-            all_results.extend(new_results)
+        all_results = search_all_pages(person, max_pages=10).get('results', [])
 
         email_pattern = re.compile(r'(?:From|Da|Sent by):\s*([^<\n]+?)(?:<[^>]+>)?[\s\n]+(?:To|A|Sent to):\s*([^<\n]+)', re.IGNORECASE)
         subject_pattern = re.compile(r'(?:Subject|Oggetto|Re):\s*(.+?)(?:\n|$)', re.IGNORECASE)
@@ -74,7 +85,8 @@ def api_relationships_emails():
         return jsonify({
             'communications': communications,
             'total': len(communications),
-            'searched_person': person
+            'searched_person': person,
+            'source': 'justice_gov'
         })
 
     except Exception as e:
@@ -101,25 +113,24 @@ def api_relationships_documents():
                 'searched_person': None, 'documents_searched': 0
             })
 
-        all_results = []
-        for page in range(10):
-            results = search_justice_gov(person, page=page)
-            new_results = results.get('results', [])
-            if not new_results:
-                break
-            all_results.extend(new_results)
+        all_results = search_all_pages(person, max_pages=10).get('results', [])
 
         intro_pattern = re.compile(r'(?:introduc|present|meet|connect)(?:ed|ing|s)?\s+(?:to\s+)?([A-Z][a-z]+\s+[A-Z][a-z]+)', re.IGNORECASE)
 
-        for doc in all_results:
+        # Persone citate vicine tra loro: dall'archivio per documento (testo completo
+        # già scaricato, entro COOCCURRENCE_WINDOW caratteri), altrimenti dagli snippet
+        doc_people = cooccurring_people([
+            {'url': doc.get('url'), 'text': ' '.join(doc.get('snippets', [])) + ' ' + doc.get('title', '')}
+            for doc in all_results
+        ])
+
+        for doc, people in zip(all_results, doc_people):
             text = ' '.join(doc.get('snippets', []))
             title = doc.get('title', '')
             doc_id = doc.get('url', '').split('/')[-1].replace('.pdf', '') if doc.get('url') else 'N/A'
             full_text = text + ' ' + title
 
-            # Use the shared entity extractor (with false-positive filtering)
-            entities = extract_entities_from_text(full_text)
-            names_found = set(entities.get('people', []))
+            names_found = set(people)
 
             # Also check if the searched person appears
             if person.lower() in full_text.lower():
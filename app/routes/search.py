@@ -1,6 +1,7 @@
 """
 /api/search, /api/searches, /api/download-pdf, /api/search-emails,
-/api/search-multi, /api/semantic-search, /api/searches/<id> DELETE — 7 route
+/api/search-multi, /api/semantic-search, /api/keyword-search,
+/api/searches/<id> DELETE — 8 route
 """
 import threading
 from datetime import datetime
@@ -146,18 +147,46 @@ def api_search_multi():
 
 @bp.route('/api/semantic-search', methods=['POST'])
 def api_semantic_search():
-    """Ricerca semantica nei documenti indicizzati"""
-    from app.agents.vectordb import semantic_search
+    """Ricerca semantica nei documenti indicizzati (query singola o lista `queries`)"""
+    from app.agents.vectordb import semantic_search, semantic_search_many
 
     data = request.json
     query = data.get('query', '')
+    queries = data.get('queries') or []
     n_results = data.get('n_results', 20)
+    aggregate = 'sum' if data.get('aggregate') == 'sum' else 'max'
+    hybrid = bool(data.get('hybrid', True))
+
+    if not query and not queries:
+        return jsonify({"error": "Query richiesta"}), 400
+
+    try:
+        if queries:
+            batch = semantic_search_many(queries, n_results, fuse=data.get('fuse', True),
+                                         aggregate=aggregate, hybrid=hybrid)
+            results = batch["fused"] if batch["fused"] is not None else [r for rs in batch["results"] for r in rs]
+            return jsonify({"results": results, "count": len(results), "per_query": batch["results"]})
+        results = semantic_search(query, n_results, aggregate=aggregate, hybrid=hybrid)
+        return jsonify({"results": results, "count": len(results)})
+    except Exception as e:
+        return jsonify({"error": str(e), "results": []})
+
+
+@bp.route('/api/keyword-search', methods=['POST'])
+def api_keyword_search():
+    """Ricerca per token esatti (BM25) nei documenti indicizzati"""
+    from app.agents.vectordb import keyword_search
+
+    data = request.json
+    query = data.get('query', '')
+    n_results = data.get('n_results', 20)
+    operator = 'OR' if data.get('match') == 'any' else 'AND'
 
     if not query:
         return jsonify({"error": "Query richiesta"}), 400
 
     try:
-        results = semantic_search(query, n_results)
+        results = keyword_search(query, n_results, operator=operator)
         return jsonify({"results": results, "count": len(results)})
     except Exception as e:
         return jsonify({"error": str(e), "results": []})
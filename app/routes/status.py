@@ -5,6 +5,7 @@ from flask import Blueprint, jsonify
 from datetime import datetime
 from app.services.claude import get_claude_api_key
 from app.services.documents import count_local_txt
+from app.services.justice_gov import justice_gov_client
 from app.extensions import (
     crew_investigations_collection, people_collection,
     searches_collection,
@@ -16,7 +17,11 @@ bp = Blueprint("status", __name__)
 @bp.route('/api/status')
 def api_status():
     api_key = get_claude_api_key()
-    return jsonify({"ai_configured": api_key is not None, "mongodb_connected": True})
+    return jsonify({
+        "ai_configured": api_key is not None,
+        "mongodb_connected": True,
+        "justice_gov": justice_gov_client.stats(),
+    })
 
 
 @bp.route('/api/dashboard/stats', methods=['GET'])
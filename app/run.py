@@ -11,7 +11,10 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app import create_app
 
-application = create_app()
+# I processi del pool (spawn/forkserver) importano questo file come __mp_main__:
+# non devono ricreare l'app
+if __name__ != '__mp_main__':
+    application = create_app()
 
 if __name__ == '__main__':
     application.run(debug=True, port=5001, threaded=True)
@@ -0,0 +1,155 @@
+"""
+Chunking semantico dei testi per ChromaDB.
+Divide su intestazioni email e marcatori "--- Pagina N ---", poi su confini
+di frase (e, solo se serve, di riga o di parola) impacchettando i pezzi fino
+a un budget di token stimato. Nessuna sovrapposizione: ogni chunk è descritto
+dagli offset nel testo originale e dalle pagine che copre; i marcatori di
+pagina non compaiono nel testo dei chunk.
+CHUNKER_VERSION entra negli id e nei metadati dei chunk: va incrementata
+a ogni modifica dei confini, così i documenti vengono riscritti per intero.
+"""
+import re
+
+# Il modello di embedding di default tronca a 256 token WordPiece: si resta sotto con margine
+CHUNK_TOKENS = 200
+# 1: finestre fisse di caratteri con sovrapposizione; 2: chunking semantico;
+# 3: marcatori di pagina tolti dal testo, testo iniziale in pagina 1
+CHUNKER_VERSION = 3
+
+PAGE_MARKER_RE = re.compile(r'^--- Pagina (\d+) ---[ \t]*$', re.M)
+PAGE_MARKER_LINE_RE = re.compile(r'^--- Pagina \d+ ---[ \t]*(?:\n|$)', re.M)
+EMAIL_HEADER_RE = re.compile(
+    r'^(?:-{2,}\s*(?:Original Message|Forwarded message)\s*-{2,}|From:[ \t])', re.M | re.I
+)
+SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?])\s+|\n[ \t]*\n\s*')
+LINE_SPLIT_RE = re.compile(r'\n\s*')
+WORD_RE = re.compile(r'\S+')
+TOKEN_RE = re.compile(r'\w+|[^\w\s]')
+
+
+def estimate_tokens(text):
+    """Stima del numero di token: parole e segni di punteggiatura"""
+    return len(TOKEN_RE.findall(text))
+
+
+def _trim(text, start, end):
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
+
+
+def _sections(text):
+    """
+    Sezioni delimitate da marcatori di pagina e intestazioni email:
+    (inizio, fine, pagina, tipo di confine iniziale).
+    I marcatori di pagina sono esclusi, le intestazioni email restano nel testo;
+    se ci sono marcatori, il testo prima del primo è in pagina 1.
+    """
+    events = [(m.start(), m.end(), "page", int(m.group(1))) for m in PAGE_MARKER_RE.finditer(text)]
+    page = 1 if events else None
+    prev = None
+    for m in EMAIL_HEADER_RE.finditer(text):
+        # "-----Original Message-----" seguito subito da "From:" è un solo confine
+        if prev is not None and "\n" not in text[prev:m.start()].strip():
+            continue
+        events.append((m.start(), m.start(), "email", None))
+        prev = m.start()
+    events.sort()
+
+    start, boundary = 0, None
+    for pos, resume, kind, value in events:
+        if pos > start:
+            yield start, pos, page, boundary
+        if kind == "page":
+            page = value
+            boundary = "page"
+        else:
+            boundary = "email"
+        start = max(start, resume)
+    if start < len(text):
+        yield start, len(text), page, boundary
+
+
+def _split(text, start, end, regex):
+    """Pezzi non vuoti di text[start:end] separati da regex"""
+    pos = start
+    for m in regex.finditer(text, start, end):
+        a, b = _trim(text, pos, m.start())
+        if a < b:
+            yield a, b
+        pos = m.end()
+    a, b = _trim(text, pos, end)
+    if a < b:
+        yield a, b
+
+
+def _word_windows(text, start, end, max_tokens):
+    """Ultima risorsa per pezzi senza punteggiatura né a capo: finestre di parole"""
+    win_start, win_end, tokens = None, None, 0
+    for m in WORD_RE.finditer(text, start, end):
+        t = estimate_tokens(m.group())
+        if win_start is not None and tokens + t > max_tokens:
+            yield win_start, win_end, tokens
+            win_start, tokens = None, 0
+        if win_start is None:
+            win_start = m.start()
+        win_end = m.end()
+        tokens += t
+    if win_start is not None:
+        yield win_start, win_end, tokens
+
+
+def _pieces(text, start, end, max_tokens):
+    """Frasi della sezione; quelle oltre il budget sono divise per riga, poi per parole"""
+    for a, b in _split(text, start, end, SENTENCE_SPLIT_RE):
+        t = estimate_tokens(text[a:b])
+        if t <= max_tokens:
+            yield a, b, t
+            continue
+        for c, d in _split(text, a, b, LINE_SPLIT_RE):
+            t = estimate_tokens(text[c:d])
+            if t <= max_tokens:
+                yield c, d, t
+            else:
+                yield from _word_windows(text, c, d, max_tokens)
+
+
+def iter_chunks(text, max_tokens=CHUNK_TOKENS):
+    """
+    Generatore di chunk {"text", "start", "end", "tokens", "page_start", "page_end"}.
+    Un nuovo messaggio email apre un nuovo chunk, salvo che quello corrente
+    sia ancora troppo piccolo; i cambi pagina non spezzano il chunk.
+    page_start e page_end sono entrambi None (testo senza marcatori) o entrambi
+    valorizzati: il testo prima del primo marcatore conta come prima pagina.
+    "text" è text[start:end] senza le righe dei marcatori di pagina.
+    """
+    min_tokens = max_tokens // 4
+    cur = None
+
+    def _emit(c):
+        return {
+            "text": PAGE_MARKER_LINE_RE.sub("", text[c["start"]:c["end"]]),
+            "start": c["start"],
+            "end": c["end"],
+            "tokens": c["tokens"],
+            "page_start": c["page_start"],
+            "page_end": c["page_end"],
+        }
+
+    for sec_start, sec_end, page, boundary in _sections(text):
+        first = True
+        for a, b, t in _pieces(text, sec_start, sec_end, max_tokens):
+            new_message = first and boundary == "email"
+            first = False
+            if cur and (cur["tokens"] + t > max_tokens or (new_message and cur["tokens"] >= min_tokens)):
+                yield _emit(cur)
+                cur = None
+            if cur is None:
+                cur = {"start": a, "tokens": 0, "page_start": page}
+            cur["end"] = b
+            cur["tokens"] += t
+            cur["page_end"] = page
+    if cur:
+        yield _emit(cur)
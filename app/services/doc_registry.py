@@ -0,0 +1,206 @@
+"""
+Registro dei documenti presenti in ChromaDB (sqlite).
+Una riga per URL con numero di chunk, più contatori aggregati aggiornati
+nella stessa transazione di add/delete: le statistiche costano O(1)
+invece di una scansione di tutti i metadati della collection.
+Indici su codice EFTA e URL per lookup e cancellazioni per prefisso.
+Per ogni URL è salvata anche la versione del chunker che ne ha prodotto i
+chunk (NULL = chunk precedenti al versionamento, cioè versione 1).
+"""
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+EFTA_RE = re.compile(r'EFTA\d{8,}')
+LOOKUP_BATCH = 500  # limite prudente sui parametri di una query IN (...)
+
+
+def extract_efta_id(*values):
+    """Primo codice EFTA trovato tra i valori dati (doc_id, url, ...)"""
+    for value in values:
+        if value:
+            match = EFTA_RE.search(value)
+            if match:
+                return match.group(0)
+    return None
+
+
+class DocumentRegistry:
+    """Registro URL → {doc_id, title, chunks, indexed_at, chunker_version} con contatori totali."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _db(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                "url TEXT PRIMARY KEY, doc_id TEXT, title TEXT, "
+                "chunks INTEGER NOT NULL, indexed_at TEXT, efta_id TEXT, chunker_version INTEGER)"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(documents)")}
+            if "efta_id" not in columns:
+                conn.execute("ALTER TABLE documents ADD COLUMN efta_id TEXT")
+                conn.executemany(
+                    "UPDATE documents SET efta_id = ? WHERE url = ?",
+                    [(extract_efta_id(doc_id, url), url)
+                     for url, doc_id in conn.execute("SELECT url, doc_id FROM documents").fetchall()],
+                )
+            if "chunker_version" not in columns:
+                conn.execute("ALTER TABLE documents ADD COLUMN chunker_version INTEGER")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_doc_id ON documents (doc_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_documents_efta_id ON documents (efta_id)")
+            conn.execute("CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            conn.executemany(
+                "INSERT OR IGNORE INTO counters (name, value) VALUES (?, 0)",
+                [("documents",), ("chunks",)],
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _bump(conn, documents, chunks):
+        conn.execute("UPDATE counters SET value = value + ? WHERE name = 'documents'", (documents,))
+        conn.execute("UPDATE counters SET value = value + ? WHERE name = 'chunks'", (chunks,))
+
+    # ── aggiornamenti ──
+
+    def record_chunks(self, records):
+        """Registra i chunk scritti [(id, testo, metadati)] raggruppandoli per URL"""
+        docs = {}
+        for _, _, meta in records:
+            url = meta.get("url")
+            if not url:
+                continue
+            doc = docs.setdefault(url, {
+                "doc_id": meta.get("doc_id"), "title": meta.get("title", ""),
+                "chunks": 0, "indexed_at": meta.get("indexed_at"),
+                "chunker_version": meta.get("chunker_version"),
+            })
+            doc["chunks"] = max(doc["chunks"], meta.get("total_chunks") or 0, meta.get("chunk_index", 0) + 1)
+        if not docs:
+            return
+
+        with self._lock:
+            conn = self._db()
+            for url, doc in docs.items():
+                row = conn.execute("SELECT chunks FROM documents WHERE url = ?", (url,)).fetchone()
+                # Gli id dei chunk sono deterministici (url + indice): dopo una add
+                # la collection contiene il massimo tra i chunk vecchi e i nuovi
+                chunks = max(doc["chunks"], row[0]) if row else doc["chunks"]
+                conn.execute(
+                    "INSERT OR REPLACE INTO documents (url, doc_id, title, chunks, indexed_at, efta_id, chunker_version) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (url, doc["doc_id"], doc["title"], chunks, doc["indexed_at"],
+                     extract_efta_id(doc["doc_id"], url), doc["chunker_version"]),
+                )
+                self._bump(conn, 0 if row else 1, chunks - (row[0] if row else 0))
+            conn.commit()
+
+    def remove(self, urls):
+        """Rimuove dal registro i documenti eliminati dalla collection"""
+        with self._lock:
+            conn = self._db()
+            for url in urls:
+                row = conn.execute("SELECT chunks FROM documents WHERE url = ?", (url,)).fetchone()
+                if row:
+                    conn.execute("DELETE FROM documents WHERE url = ?", (url,))
+                    self._bump(conn, -1, -row[0])
+            conn.commit()
+
+    def rebuild(self, documents):
+        """Sostituisce l'intero registro: documents = {url: {doc_id, title, chunks, indexed_at, chunker_version}}"""
+        with self._lock:
+            conn = self._db()
+            conn.execute("DELETE FROM documents")
+            conn.executemany(
+                "INSERT INTO documents (url, doc_id, title, chunks, indexed_at, efta_id, chunker_version) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(url, d.get("doc_id"), d.get("title", ""), d["chunks"], d.get("indexed_at"),
+                  extract_efta_id(d.get("doc_id"), url), d.get("chunker_version"))
+                 for url, d in documents.items()],
+            )
+            conn.execute("UPDATE counters SET value = ? WHERE name = 'documents'", (len(documents),))
+            conn.execute("UPDATE counters SET value = ? WHERE name = 'chunks'",
+                         (sum(d["chunks"] for d in documents.values()),))
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('recounted_at', ?)",
+                         (datetime.now().isoformat(),))
+            conn.commit()
+
+    # ── letture ──
+
+    def is_initialized(self):
+        with self._lock:
+            return self._db().execute("SELECT 1 FROM meta WHERE key = 'recounted_at'").fetchone() is not None
+
+    def lookup(self, ids):
+        """
+        Chunk indicizzati per ciascun id (codice EFTA o doc_id) in poche query
+        sugli indici → {id: numero di chunk}, 0 se assente.
+        """
+        ids = list(dict.fromkeys(ids))
+        found = dict.fromkeys(ids, 0)
+        with self._lock:
+            conn = self._db()
+            for start in range(0, len(ids), LOOKUP_BATCH):
+                batch = ids[start:start + LOOKUP_BATCH]
+                marks = ",".join("?" * len(batch))
+                for column in ("efta_id", "doc_id"):
+                    rows = conn.execute(
+                        f"SELECT {column}, SUM(chunks) FROM documents WHERE {column} IN ({marks}) GROUP BY {column}",
+                        batch,
+                    ).fetchall()
+                    for key, chunks in rows:
+                        found[key] = max(found[key], chunks)
+        return found
+
+    def stale_urls(self, urls, version):
+        """URL già registrati i cui chunk vengono da una versione del chunker diversa da `version`"""
+        urls = list(dict.fromkeys(urls))
+        stale = []
+        with self._lock:
+            conn = self._db()
+            for start in range(0, len(urls), LOOKUP_BATCH):
+                batch = urls[start:start + LOOKUP_BATCH]
+                marks = ",".join("?" * len(batch))
+                stale.extend(url for (url,) in conn.execute(
+                    f"SELECT url FROM documents WHERE url IN ({marks}) AND COALESCE(chunker_version, 1) != ?",
+                    batch + [version],
+                ).fetchall())
+        return stale
+
+    def urls_matching(self, pattern):
+        """
+        URL registrati che contengono `pattern`: prima una range scan sulla
+        chiave primaria (prefisso), poi il confronto per sottostringa
+        solo se il prefisso non trova nulla.
+        """
+        with self._lock:
+            conn = self._db()
+            rows = conn.execute(
+                "SELECT url, chunks FROM documents WHERE url >= ? AND url < ?",
+                (pattern, pattern + "\U0010ffff"),
+            ).fetchall()
+            if not rows:
+                rows = conn.execute(
+                    "SELECT url, chunks FROM documents WHERE instr(url, ?) > 0", (pattern,)
+                ).fetchall()
+        return dict(rows)
+
+    def stats(self):
+        with self._lock:
+            conn = self._db()
+            counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+            row = conn.execute("SELECT value FROM meta WHERE key = 'recounted_at'").fetchone()
+        return {
+            "total_chunks": counters.get("chunks", 0),
+            "total_documents": counters.get("documents", 0),
+            "recounted_at": row[0] if row else None,
+        }
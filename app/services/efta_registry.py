@@ -0,0 +1,155 @@
+"""
+Registro locale dei documenti EFTA (sqlite): id → URL, titolo, dataset,
+intervallo di pagine e disponibilità del testo in locale.
+Alimentato da ogni risposta di justice.gov e da ogni download, così la
+risoluzione di un id va in rete solo quando il documento non è mai stato visto.
+"""
+import os
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+from app.config import DOCUMENTS_DIR, EFTA_REGISTRY_DB
+from app.services.cache import TTLCache
+from app.services.doc_registry import extract_efta_id
+
+MISS_TTL = 600  # secondi durante i quali un id non trovato non viene ricercato di nuovo
+
+_FIELDS = ("title", "url", "dataset", "start_page", "end_page", "file_size", "total_words")
+
+
+class EftaRegistry:
+    """Tabella efta_documents con chiave primaria sull'id EFTA."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _db(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS efta_documents ("
+                "doc_id TEXT PRIMARY KEY, title TEXT, url TEXT, dataset TEXT, "
+                "start_page INTEGER, end_page INTEGER, file_size INTEGER, total_words INTEGER, "
+                "snippets TEXT, has_local_text INTEGER DEFAULT 0, updated_at TEXT)"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def record_results(self, results):
+        """Registra i risultati di una ricerca justice.gov (formato parse_json_results)"""
+        rows = []
+        for r in results:
+            doc_id = extract_efta_id(r.get("id"), r.get("url"))
+            if not doc_id or not r.get("url"):
+                continue
+            rows.append((
+                doc_id, r.get("title", ""), r["url"], r.get("dataset"),
+                r.get("start_page"), r.get("end_page"), r.get("file_size"), r.get("total_words"),
+                json.dumps(r.get("snippets", [])), datetime.now().isoformat(),
+            ))
+        if not rows:
+            return
+        with self._lock:
+            conn = self._db()
+            conn.executemany(
+                "INSERT INTO efta_documents (doc_id, title, url, dataset, start_page, end_page, "
+                "file_size, total_words, snippets, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(doc_id) DO UPDATE SET title = excluded.title, url = excluded.url, "
+                "dataset = excluded.dataset, start_page = excluded.start_page, end_page = excluded.end_page, "
+                "file_size = excluded.file_size, total_words = excluded.total_words, "
+                "snippets = CASE WHEN excluded.snippets = '[]' THEN efta_documents.snippets ELSE excluded.snippets END, "
+                "updated_at = excluded.updated_at",
+                rows,
+            )
+            conn.commit()
+
+    def mark_local(self, doc_id, url=None):
+        """Segna che il testo del documento è salvato in DOCUMENTS_DIR"""
+        with self._lock:
+            conn = self._db()
+            conn.execute(
+                "INSERT INTO efta_documents (doc_id, url, has_local_text, updated_at) VALUES (?, ?, 1, ?) "
+                "ON CONFLICT(doc_id) DO UPDATE SET has_local_text = 1, "
+                "url = COALESCE(efta_documents.url, excluded.url)",
+                (doc_id, url, datetime.now().isoformat()),
+            )
+            conn.commit()
+
+    def get_many(self, doc_ids):
+        """{doc_id: documento} per gli id presenti nel registro"""
+        doc_ids = list(dict.fromkeys(doc_ids))
+        found = {}
+        with self._lock:
+            conn = self._db()
+            for start in range(0, len(doc_ids), 500):
+                batch = doc_ids[start:start + 500]
+                rows = conn.execute(
+                    f"SELECT doc_id, {', '.join(_FIELDS)}, snippets, has_local_text "
+                    f"FROM efta_documents WHERE doc_id IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                for row in rows:
+                    doc = {"id": row[0], **dict(zip(_FIELDS, row[1:len(_FIELDS) + 1]))}
+                    doc["title"] = doc["title"] or ""
+                    doc["snippets"] = json.loads(row[-2]) if row[-2] else []
+                    doc["has_local_text"] = bool(row[-1]) or os.path.exists(
+                        os.path.join(DOCUMENTS_DIR, f"{row[0]}.txt"))
+                    found[row[0]] = doc
+        return found
+
+    def get(self, doc_id):
+        return self.get_many([doc_id]).get(doc_id)
+
+
+efta_registry = EftaRegistry(EFTA_REGISTRY_DB)
+_misses = TTLCache(maxsize=4096, ttl=MISS_TTL)
+
+
+def resolve_efta_ids(doc_ids, search_fn=None):
+    """
+    Risolve più id EFTA → {doc_id: documento | None}.
+    Gli id già registrati non toccano la rete; per gli altri si interroga
+    justice.gov (e la risposta alimenta il registro). I mancati ritrovamenti
+    restano in cache per MISS_TTL secondi.
+    """
+    if search_fn is None:
+        from app.services.justice_gov import search_justice_gov
+        search_fn = search_justice_gov
+
+    try:
+        resolved = {k: v for k, v in efta_registry.get_many(doc_ids).items() if v.get("url")}
+    except sqlite3.Error as e:
+        print(f"[EFTA] Errore registro: {e}", flush=True)
+        resolved = {}
+
+    for doc_id in doc_ids:
+        if doc_id in resolved or doc_id in _misses:
+            continue
+        result = search_fn(doc_id)
+        if result.get("error"):
+            continue
+        try:
+            efta_registry.record_results(result.get("results", []))
+            doc = efta_registry.get(doc_id)
+        except sqlite3.Error:
+            doc = None
+        if doc is None:
+            # Nessuna corrispondenza esatta: si usa il primo risultato, senza registrarlo per questo id
+            doc = (result.get("results") or [None])[0]
+            if doc is None:
+                _misses.set(doc_id, True)
+                continue
+        resolved[doc_id] = doc
+
+    return {doc_id: resolved.get(doc_id) for doc_id in doc_ids}
+
+
+def resolve_efta_id(doc_id, search_fn=None):
+    """Risolve un id EFTA in {id, title, url, dataset, start_page, end_page, snippets, ...} o None"""
+    return resolve_efta_ids([doc_id], search_fn)[doc_id]
@@ -0,0 +1,220 @@
+"""
+Indice full-text (sqlite FTS5) del dataset email, salvato in index_data/.
+Campi: oggetto, mittente, destinatari, corpo senza HTML; ranking BM25.
+Sintassi delle query: parole (AND implicito), "frasi", prefissi (parola*),
+AND / OR / NOT e -parola, filtri from:, to:, subject:, date:AAAA[-MM[-GG]][..AAAA[-MM[-GG]]],
+after: e before: su timestamp_iso. Una query fatta solo di esclusioni o
+operatori non ha termini positivi: nessun risultato (le esclusioni valgono
+solo insieme a un filtro di data).
+L'indice viene ricostruito se il parquet cambia (dimensione/mtime).
+"""
+import os
+import re
+import sqlite3
+import threading
+
+from app.config import EMAILS_PARQUET, EMAILS_FTS_DB, EMAILS_FTS_MMAP_BYTES
+
+# Pesi BM25 per colonna: subject, sender, recipients, body
+BM25_WEIGHTS = (4.0, 2.0, 2.0, 1.0)
+
+QUERY_TOKEN_RE = re.compile(r'(\w+):("[^"]*"|\S+)|(-?)"([^"]*)"|(\S+)')
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+DATE_RE = re.compile(r'^(\d{4})(?:-(\d{2}))?(?:-(\d{2}))?$')
+OPERATORS = ("AND", "OR", "NOT")
+FIELD_COLUMNS = {"from": "sender", "to": "recipients", "subject": "subject"}
+
+
+def _phrase(text, prefix=False):
+    tokens = WORD_RE.findall(text)
+    if not tokens:
+        return None
+    return '"' + " ".join(tokens) + '"' + ("*" if prefix else "")
+
+
+def _date_bound(value):
+    """"2015-01-05" → "20150105" (prefisso confrontabile con timestamp_iso)"""
+    m = DATE_RE.match(value)
+    return "".join(g for g in m.groups() if g) if m else None
+
+
+def plain_terms(text):
+    """Parole della query se non usa la sintassi di ricerca (campi, frasi, operatori, -, *), altrimenti None"""
+    words = text.split()
+    if not words:
+        return None
+    for m in QUERY_TOKEN_RE.finditer(text):
+        word = m.group(5)
+        if word is None or word in OPERATORS or word.startswith("-") or word.endswith("*") or '"' in word:
+            return None
+    return words
+
+
+def parse_query(text):
+    """
+    Query utente → (espressione FTS5 o None, [(operatore, valore)] su timestamp_iso,
+    espressione FTS5 dei termini esclusi o None).
+    Le esclusioni finiscono nell'espressione principale se c'è almeno un termine
+    positivo, altrimenti sono restituite a parte (FTS5 non ammette un NOT iniziale).
+    Ogni termine è quotato: la punteggiatura dell'utente non può produrre
+    errori di sintassi FTS5.
+    """
+    terms, negated, filters = [], [], []
+    pending = None
+    for m in QUERY_TOKEN_RE.finditer(text):
+        field, value, minus, phrase, word = m.groups()
+        term = None
+        negate = False
+        if field is not None:
+            field = field.lower()
+            value = value.strip('"')
+            if field in FIELD_COLUMNS:
+                expr = _phrase(value)
+                if expr:
+                    filters.append(("fts", f"{FIELD_COLUMNS[field]} : {expr}"))
+                continue
+            if field in ("date", "after", "before"):
+                low, _, high = value.partition("..") if field == "date" else (value, "", "")
+                low, high = _date_bound(low), _date_bound(high) if high else None
+                if low and field in ("date", "after"):
+                    filters.append(("date", (">=", low)))
+                if low and field == "date":
+                    # "~" segue le cifre: date:2015 comprende tutto il 2015
+                    filters.append(("date", ("<", (high or low) + "~")))
+                elif low and field == "before":
+                    filters.append(("date", ("<", low)))
+                continue
+            # Campo sconosciuto: si cerca il testo così com'è
+            term = _phrase(m.group(0))
+        elif phrase is not None:
+            term, negate = _phrase(phrase), minus == "-"
+        else:
+            if word in OPERATORS:
+                pending = word
+                continue
+            negate = word.startswith("-") and len(word) > 1
+            term = _phrase(word, prefix=word.endswith("*"))
+        if not term:
+            continue
+        if negate or pending == "NOT":
+            negated.append(term)
+        elif terms and pending == "OR":
+            terms[-1] = f"{terms[-1]} OR {term}"
+        else:
+            terms.append(term)
+        pending = None
+
+    clauses = [f"({t})" if " OR " in t else t for t in terms]
+    clauses += [expr for kind, expr in filters if kind == "fts"]
+    fts = " AND ".join(clauses) if clauses else None
+    excluded = None
+    if fts and negated:
+        fts += "".join(f" NOT {t}" for t in negated)
+    elif negated:
+        excluded = " OR ".join(negated)
+    return fts, [expr for kind, expr in filters if kind == "date"], excluded
+
+
+class EmailFullTextIndex:
+    """Tabella FTS5 emails_fts (rowid = posizione nel parquet) + timestamp per i filtri di data."""
+
+    def __init__(self, db_path=EMAILS_FTS_DB, source_path=EMAILS_PARQUET):
+        self.db_path = db_path
+        self.source_path = source_path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _db(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA mmap_size={int(EMAILS_FTS_MMAP_BYTES)}")
+            conn.executescript("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS emails_fts USING fts5(
+                    subject, sender, recipients, body,
+                    tokenize='unicode61 remove_diacritics 2'
+                );
+                CREATE TABLE IF NOT EXISTS email_dates (
+                    row INTEGER PRIMARY KEY,
+                    timestamp_iso TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_email_dates_ts ON email_dates (timestamp_iso);
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            """)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _source_signature(self):
+        st = os.stat(self.source_path)
+        return f"{st.st_size}:{int(st.st_mtime)}"
+
+    def is_current(self):
+        with self._lock:
+            row = self._db().execute("SELECT value FROM meta WHERE key = 'source'").fetchone()
+        return row is not None and row[0] == self._source_signature()
+
+    def build(self, df, body_batches):
+        """
+        Ricostruisce l'indice dal DataFrame email (una riga FTS per riga del parquet);
+        body_batches: blocchi (prima riga, [testi senza HTML]) nello stesso ordine,
+        inseriti uno alla volta: i corpi non sono mai tutti in memoria.
+        """
+        def col(name):
+            return df[name].fillna('').astype(str).tolist() if name in df.columns else [''] * len(df)
+
+        subjects, senders = col('subject'), col('from_address')
+        recipients = [f"{to} {other}" for to, other in zip(col('to_address'), col('other_recipients'))]
+        with self._lock:
+            conn = self._db()
+            conn.execute("DELETE FROM emails_fts")
+            conn.execute("DELETE FROM email_dates")
+            for start, bodies in body_batches:
+                rows = range(start, start + len(bodies))
+                conn.executemany(
+                    "INSERT INTO emails_fts (rowid, subject, sender, recipients, body) VALUES (?, ?, ?, ?, ?)",
+                    [(r, subjects[r], senders[r], recipients[r], body) for r, body in zip(rows, bodies)])
+            conn.executemany("INSERT INTO email_dates (row, timestamp_iso) VALUES (?, ?)",
+                             enumerate(col('timestamp_iso')))
+            conn.execute("INSERT INTO emails_fts (emails_fts) VALUES ('optimize')")
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('source', ?)", (self._source_signature(),))
+            conn.commit()
+
+    def search(self, query, limit=50):
+        """
+        → {"rows": [posizioni nel parquet], "scores", "snippets", "total"} ordinati per BM25
+        (per data se la query ha solo filtri di data); senza termini positivi né
+        filtri di data nessun risultato, con "error".
+        """
+        fts, date_filters, excluded = parse_query(query)
+        if not fts and not date_filters:
+            return {"rows": [], "scores": [], "snippets": [], "total": 0,
+                    "error": "La query non contiene termini da cercare"}
+        where = [f"d.timestamp_iso {op} ?" for op, _ in date_filters]
+        params = [value for _, value in date_filters]
+        if excluded:
+            where.append("d.row NOT IN (SELECT rowid FROM emails_fts WHERE emails_fts MATCH ?)")
+            params.append(excluded)
+
+        if fts:
+            base = "FROM emails_fts JOIN email_dates d ON d.row = emails_fts.rowid WHERE emails_fts MATCH ?"
+            base_params = [fts] + params
+            if where:
+                base += " AND " + " AND ".join(where)
+            select = (f"SELECT emails_fts.rowid, bm25(emails_fts, {', '.join(map(str, BM25_WEIGHTS))}) AS rank, "
+                      f"snippet(emails_fts, -1, '', '', '…', 24) {base} ORDER BY rank LIMIT ?")
+        else:
+            base = "FROM email_dates d WHERE " + " AND ".join(where)
+            base_params = params
+            select = f"SELECT d.row, 0, '' {base} ORDER BY d.timestamp_iso DESC LIMIT ?"
+
+        with self._lock:
+            conn = self._db()
+            total = conn.execute(f"SELECT COUNT(*) {base}", base_params).fetchone()[0]
+            rows = conn.execute(select, base_params + [limit]).fetchall()
+        return {
+            "rows": [r[0] for r in rows],
+            "scores": [round(-r[1], 4) if fts else None for r in rows],
+            "snippets": [r[2] for r in rows],
+            "total": total,
+        }
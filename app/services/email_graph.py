@@ -0,0 +1,299 @@
+"""
+Grafo mittente → destinatario del dataset email, salvato in index_data/.
+Indirizzi normalizzati ("Cognome, Nome" → "Nome Cognome", <email>, [mailto:...],
+segnaposto come <REDACTED> scartati); per ogni coppia: numero di messaggi
+(di cui in copia), primo e ultimo timestamp (ISO 8601 nelle risposte), thread
+(email_document_id, i primi EMAIL_GRAPH_EDGE_THREADS più il totale),
+oggetto e documento dell'ultimo messaggio.
+Il grafo viene ricostruito se il parquet cambia (dimensione/mtime).
+"""
+import os
+import re
+import json
+import sqlite3
+import threading
+from collections import Counter
+
+from app.config import EMAILS_PARQUET, EMAILS_GRAPH_DB, EMAIL_GRAPH_TOP_EDGES, EMAIL_GRAPH_EDGE_THREADS
+from app.extensions import get_emails_df
+
+# Cambia quando cambia la normalizzazione: forza la ricostruzione
+GRAPH_VERSION = 1
+
+MAILTO_RE = re.compile(r'\[mailto:[^\]]*\]', re.IGNORECASE)
+ANGLE_RE = re.compile(r'<([^>]*)>')
+KEY_WORD_RE = re.compile(r'\w+', re.UNICODE)
+PLACEHOLDER_RE = re.compile(r'^(?:redacted|unknown|house oversight\b.*|n a)?$')
+COMPACT_TS_RE = re.compile(r'^(\d{4})(\d{2})(\d{2})(?:(\d{2})(\d{2})(\d{2})?)?$')
+# Persone considerate al massimo per una query (le più attive)
+MAX_MATCHED_PEOPLE = 100
+
+
+def person_key(name):
+    """Chiave di confronto: minuscole, senza punteggiatura (gli indirizzi email restano interi)"""
+    name = name.strip().lower()
+    if "@" in name:
+        return name
+    return " ".join(KEY_WORD_RE.findall(name))
+
+
+def _clean_name(part):
+    """'Nome <email>' → 'Nome'; solo '<email>' → 'email'; '<111>' e simili scartati"""
+    emails = [a.strip() for a in ANGLE_RE.findall(part) if "@" in a]
+    name = ANGLE_RE.sub(" ", part)
+    # "<" senza chiusura: resto troncato dall'OCR
+    name = (name.split("<")[0] or name).strip(" \"'\t")
+    return " ".join(name.split()) or (emails[0] if emails else "")
+
+
+def iso_timestamp(value):
+    """timestamp_iso compatto del dataset ("20140923200400") → "2014-09-23T20:04:00"; altro invariato"""
+    m = COMPACT_TS_RE.match(value or "")
+    if not m:
+        return value or ""
+    year, month, day, hour, minute, second = m.groups()
+    date = f"{year}-{month}-{day}"
+    return f"{date}T{hour}:{minute}:{second or '00'}" if hour else date
+
+
+def parse_addresses(value):
+    """Campo mittente/destinatari → lista di nomi normalizzati"""
+    value = (value or "").strip()
+    if value.startswith("["):
+        try:
+            parts = [str(v) for v in json.loads(value)]
+        except ValueError:
+            parts = [value.strip("[]")]
+    else:
+        parts = MAILTO_RE.sub(" ", value).split(";")
+
+    names = []
+    for part in parts:
+        part = MAILTO_RE.sub(" ", part)
+        pieces = [p.strip() for p in part.split(",")]
+        if len(pieces) == 2 and len(pieces[0].split()) == 1 and 1 <= len(pieces[1].split()) <= 2 and "@" not in part:
+            # "Weingarten, Reid" → "Reid Weingarten"
+            pieces = [f"{pieces[1]} {pieces[0]}"]
+        for piece in pieces:
+            name = _clean_name(piece)
+            key = person_key(name)
+            if key and not PLACEHOLDER_RE.match(key):
+                names.append(name)
+    return names
+
+
+class EmailGraph:
+    """Tabelle people / edges (una riga per coppia mittente → destinatario)."""
+
+    def __init__(self, db_path=EMAILS_GRAPH_DB, source_path=EMAILS_PARQUET):
+        self.db_path = db_path
+        self.source_path = source_path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _db(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS people (
+                    id INTEGER PRIMARY KEY,
+                    key TEXT UNIQUE,
+                    name TEXT,
+                    sent INTEGER,
+                    received INTEGER
+                );
+                CREATE TABLE IF NOT EXISTS edges (
+                    sender INTEGER,
+                    recipient INTEGER,
+                    messages INTEGER,
+                    cc INTEGER,
+                    first_ts TEXT,
+                    last_ts TEXT,
+                    threads TEXT,
+                    last_subject TEXT,
+                    last_document TEXT,
+                    PRIMARY KEY (sender, recipient)
+                );
+                CREATE INDEX IF NOT EXISTS idx_edges_recipient ON edges (recipient);
+                CREATE INDEX IF NOT EXISTS idx_edges_messages ON edges (messages);
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            """)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _source_signature(self):
+        st = os.stat(self.source_path)
+        return f"{GRAPH_VERSION}:{st.st_size}:{int(st.st_mtime)}"
+
+    def is_current(self):
+        with self._lock:
+            row = self._db().execute("SELECT value FROM meta WHERE key = 'source'").fetchone()
+        return row is not None and row[0] == self._source_signature()
+
+    def build(self, df):
+        """Ricostruisce persone e archi dal DataFrame email (metadati, senza corpi)"""
+        def col(name):
+            return df[name].fillna('').astype(str).tolist() if name in df.columns else [''] * len(df)
+
+        ids, names = {}, {}
+        sent, received = Counter(), Counter()
+        edges = {}
+
+        def person(name):
+            key = person_key(name)
+            if key not in ids:
+                ids[key] = len(ids) + 1
+                names[key] = Counter()
+            names[key][name] += 1
+            return ids[key]
+
+        rows = zip(col('from_address'), col('to_address'), col('other_recipients'),
+                   col('timestamp_iso'), col('email_document_id'), col('subject'), col('document_id'))
+        for sender, to, other, ts, thread, subject, document in rows:
+            senders = parse_addresses(sender)
+            if not senders:
+                continue
+            a = person(senders[0])
+            recipients = [(person(n), False) for n in parse_addresses(to)]
+            recipients += [(person(n), True) for n in parse_addresses(other)]
+            seen = set()
+            for b, is_cc in recipients:
+                if b == a or b in seen:
+                    continue
+                seen.add(b)
+                received[b] += 1
+                edge = edges.get((a, b))
+                if edge is None:
+                    edge = edges[(a, b)] = {"messages": 0, "cc": 0, "first": None, "last": None,
+                                            "threads": set(), "subject": "", "document": ""}
+                edge["messages"] += 1
+                edge["cc"] += is_cc
+                if thread:
+                    edge["threads"].add(thread)
+                if ts and (edge["first"] is None or ts < edge["first"]):
+                    edge["first"] = ts
+                if ts and (edge["last"] is None or ts >= edge["last"]):
+                    edge["last"], edge["subject"], edge["document"] = ts, subject, document
+            if seen:
+                sent[a] += 1
+
+        def thread_order(t):
+            return (0, int(t), t) if t.isdigit() else (1, 0, t)
+
+        with self._lock:
+            conn = self._db()
+            conn.execute("DELETE FROM people")
+            conn.execute("DELETE FROM edges")
+            conn.executemany(
+                "INSERT INTO people (id, key, name, sent, received) VALUES (?, ?, ?, ?, ?)",
+                [(pid, key, names[key].most_common(1)[0][0], sent[pid], received[pid]) for key, pid in ids.items()])
+            conn.executemany(
+                "INSERT INTO edges (sender, recipient, messages, cc, first_ts, last_ts, threads, last_subject, last_document) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(a, b, e["messages"], e["cc"], e["first"], e["last"],
+                  json.dumps(sorted(e["threads"], key=thread_order)), e["subject"], e["document"])
+                 for (a, b), e in edges.items()])
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('source', ?)", (self._source_signature(),))
+            conn.commit()
+        return {"people": len(ids), "edges": len(edges)}
+
+    def find_people(self, query):
+        """
+        Persone il cui nome normalizzato contiene la query a parole intere
+        ("summers" → "lawrence summers"), altrimenti come sottostringa → [(id, nome)]
+        """
+        names = parse_addresses(query)
+        key = person_key(names[0] if len(names) == 1 else query)
+        if not key:
+            return []
+        like = re.sub(r'([%_\\])', r'\\\1', key)
+        order = f"ORDER BY key = ? DESC, sent + received DESC LIMIT {MAX_MATCHED_PEOPLE}"
+        with self._lock:
+            conn = self._db()
+            rows = conn.execute(
+                "SELECT id, name FROM people WHERE key = ? OR key LIKE ? ESCAPE '\\' OR key LIKE ? ESCAPE '\\' "
+                f"OR key LIKE ? ESCAPE '\\' {order}",
+                (key, like + " %", "% " + like, "% " + like + " %", key)).fetchall()
+            if not rows:
+                rows = conn.execute(f"SELECT id, name FROM people WHERE key LIKE ? ESCAPE '\\' {order}",
+                                    ("%" + like + "%", key)).fetchall()
+        return rows
+
+    _EDGE_SELECT = (
+        "SELECT s.name, r.name, e.messages, e.cc, e.first_ts, e.last_ts, e.threads, e.last_subject, e.last_document "
+        "FROM edges e JOIN people s ON s.id = e.sender JOIN people r ON r.id = e.recipient "
+    )
+
+    @staticmethod
+    def _edge(row, max_threads=EMAIL_GRAPH_EDGE_THREADS):
+        sender, recipient, messages, cc, first, last, threads, subject, document = row
+        threads = json.loads(threads)
+        return {
+            "from": sender,
+            "to": recipient,
+            "messages": messages,
+            "cc": cc,
+            "first_date_iso": iso_timestamp(first),
+            "last_date_iso": iso_timestamp(last),
+            "threads": threads[:max_threads],
+            "thread_count": len(threads),
+            "subject": subject,
+            "doc_id": document,
+        }
+
+    def edges_for(self, query, limit=EMAIL_GRAPH_TOP_EDGES):
+        """
+        Archi in entrata e in uscita delle persone che corrispondono a query,
+        per numero di messaggi → {"people": [nomi], "edges": [...], "total"}
+        """
+        people = self.find_people(query)
+        if not people:
+            return {"people": [], "edges": [], "total": 0}
+        ids = [pid for pid, _ in people]
+        marks = ", ".join("?" * len(ids))
+        where = f"WHERE e.sender IN ({marks}) OR e.recipient IN ({marks})"
+        with self._lock:
+            conn = self._db()
+            total = conn.execute(f"SELECT COUNT(*) FROM edges e {where}", ids + ids).fetchone()[0]
+            rows = conn.execute(f"{self._EDGE_SELECT}{where} ORDER BY e.messages DESC, e.last_ts DESC LIMIT ?",
+                                ids + ids + [limit]).fetchall()
+        return {"people": [name for _, name in people], "edges": [self._edge(r) for r in rows], "total": total}
+
+    def top_edges(self, limit=EMAIL_GRAPH_TOP_EDGES):
+        """Archi con più messaggi in tutto il dataset"""
+        with self._lock:
+            conn = self._db()
+            total = conn.execute("SELECT COUNT(*) FROM edges").fetchone()[0]
+            rows = conn.execute(f"{self._EDGE_SELECT}ORDER BY e.messages DESC, e.last_ts DESC LIMIT ?",
+                                (limit,)).fetchall()
+        return {"people": [], "edges": [self._edge(r) for r in rows], "total": total}
+
+
+_graph = None
+_graph_lock = threading.Lock()
+_graph_failed = False
+
+
+def get_email_graph():
+    """Grafo delle email, (ri)costruito se manca o se il parquet è cambiato; None senza dataset"""
+    global _graph, _graph_failed
+    if _graph is not None or _graph_failed:
+        return _graph
+    df = get_emails_df()
+    if df is None:
+        return None
+    with _graph_lock:
+        if _graph is None and not _graph_failed:
+            try:
+                graph = EmailGraph()
+                if not graph.is_current():
+                    counts = graph.build(df)
+                    print(f"[EMAILS] Grafo email pronto: {counts['people']} persone, "
+                          f"{counts['edges']} archi", flush=True)
+                _graph = graph
+            except (sqlite3.Error, OSError) as e:
+                print(f"[EMAILS] Grafo email non disponibile: {e}", flush=True)
+                _graph_failed = True
+    return _graph
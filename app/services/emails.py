@@ -1,48 +1,286 @@
 """
 Ricerca nel dataset email Epstein (parquet).
+Prima l'indice full-text FTS5 (ranking BM25, filtri from:/to:/date:),
+salvato in index_data/. La ricerca per sottostringa resta solo per le query
+senza sintassi: quando l'indice non è disponibile, o quando una parola
+singola non trova nulla nell'indice (ad es. parte di un indirizzo email);
+query con campi, date o operatori non ricadono mai sulla sottostringa.
+La ricerca per sottostringa concatena i campi testuali, minuscoli e senza
+HTML, in una stringa con gli offset di inizio di ogni riga; una ricerca è una
+serie di find sul testo (UTF-8), ciascuna seguita da una bisezione sugli offset.
+I metadati restano in memoria; i corpi sono ripuliti una volta sola, scritti
+in index_data/ e letti in memory-map: nessuna copia dell'intero corpus resta
+nella memoria del processo e nessuna query rilegge il parquet.
 """
-from app.extensions import EMAILS_DF
+import os
+import re
+import html
+import json
+import mmap
+import sqlite3
+import threading
+from bisect import bisect_right
+
+import numpy as np
+
+from app.config import EMAILS_PARQUET, EMAILS_BODY_BLOCK
+from app.extensions import get_emails_df, get_email_bodies, iter_email_bodies, EMAIL_BODY_COLUMN
+from app.services.email_fts import EmailFullTextIndex, plain_terms
+
+SEARCH_FIELDS = ['subject', 'from_address', 'to_address', 'other_recipients']  # più il corpo, a blocchi
+RESULT_FIELDS = [
+    'id', 'document_id', 'source_filename', 'from_address', 'to_address',
+    'other_recipients', 'subject', 'timestamp_raw', 'timestamp_iso',
+]
+
+TAG_RE = re.compile(r'<[^>]+>')
+FIELD_SEP = "\x00"  # non compare nelle query: nessuna corrispondenza attraversa due campi
+
+
+def strip_html(value):
+    """Testo visibile di un frammento HTML"""
+    return html.unescape(TAG_RE.sub(" ", value))
+
+
+def _text_block(rows):
+    """Righe [[campi]] → (testo UTF-8 minuscolo, offset di inizio di ogni riga + fine)"""
+    # UTF-8: bytes.find è molto più veloce di str.find su testo con caratteri non latini
+    encoded = [(FIELD_SEP.join(values).lower() + FIELD_SEP).encode('utf-8') for values in rows]
+    lengths = np.fromiter((len(r) for r in encoded), dtype=np.int64, count=len(encoded))
+    return b"".join(encoded), np.concatenate(([0], np.cumsum(lengths))).tolist()
+
+
+def _find_rows(haystack, starts, needle):
+    """Righe del blocco che contengono needle (ciascuna una volta)"""
+    find = haystack.find
+    rows = []
+    pos = find(needle)
+    while pos != -1:
+        row = bisect_right(starts, pos) - 1
+        rows.append(row)
+        # Una riga conta una volta: si riparte dall'inizio della successiva
+        pos = find(needle, starts[row + 1])
+    return rows
+
+
+class EmailBodyBlock:
+    """
+    Corpi di tutte le email senza HTML e minuscoli, in un file di index_data/
+    con gli offset di riga accanto; ricostruito se il parquet cambia (dimensione/mtime).
+    """
+
+    def __init__(self, path=EMAILS_BODY_BLOCK, source_path=EMAILS_PARQUET):
+        self.path = path
+        self.offsets_path = os.path.splitext(path)[0] + ".npy"
+        self.meta_path = os.path.splitext(path)[0] + ".json"
+        self.source_path = source_path
+        self._map = None
+        self.starts = None
+
+    def _source_signature(self):
+        st = os.stat(self.source_path)
+        return f"{st.st_size}:{int(st.st_mtime)}"
+
+    def is_current(self):
+        try:
+            with open(self.meta_path, encoding='utf-8') as f:
+                return json.load(f).get("source") == self._source_signature()
+        except (OSError, ValueError):
+            return False
+
+    def build(self):
+        """Scrive il blocco un lotto di corpi alla volta (file temporanei, poi rinominati)"""
+        offsets = [0]
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            for _, bodies in iter_email_bodies():
+                block, starts = _text_block([strip_html(b)] for b in bodies)
+                f.write(block)
+                base = offsets[-1]
+                offsets.extend(base + end for end in starts[1:])
+        with open(self.offsets_path + ".tmp", 'wb') as f:
+            np.save(f, np.asarray(offsets, dtype=np.int64))
+        os.replace(tmp_path, self.path)
+        os.replace(self.offsets_path + ".tmp", self.offsets_path)
+        # Il file dei metadati per ultimo: senza, il blocco non è considerato valido
+        with open(self.meta_path, 'w', encoding='utf-8') as f:
+            json.dump({"source": self._source_signature(), "rows": len(offsets) - 1}, f)
+
+    def open(self):
+        """Apre il blocco in memory-map → self"""
+        self.starts = np.load(self.offsets_path).tolist()
+        if os.path.getsize(self.path):
+            with open(self.path, 'rb') as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self
+
+    def match_rows(self, needle):
+        """Righe il cui corpo contiene needle (byte UTF-8 minuscoli)"""
+        if self._map is None:
+            return []
+        return _find_rows(self._map, self.starts, needle)
+
+
+class EmailSearchIndex:
+    """Metadati di tutte le email in una stringa contigua + offset di riga; corpi dal blocco su disco."""
+
+    def __init__(self, df, bodies=None):
+        self.size = len(df)
+        fields = [df[field].fillna('').astype(str) if field in df.columns else [''] * self.size
+                  for field in SEARCH_FIELDS]
+        self.haystack, self._starts = _text_block(zip(*fields))
+        self.bodies = bodies
+
+    def match_rows(self, query):
+        """Posizioni (ordine del file) delle righe che contengono query, senza distinzione di maiuscole"""
+        needle = query.lower().encode('utf-8')
+        if not needle or not self.size:
+            return np.empty(0, dtype=np.int64)
+        rows = set(_find_rows(self.haystack, self._starts, needle))
+        if self.bodies is not None:
+            rows.update(self.bodies.match_rows(needle))
+        return np.asarray(sorted(rows), dtype=np.int64)
+
+
+def _email_body_block():
+    """Blocco dei corpi ripuliti, costruito se manca o è vecchio; None se non disponibile"""
+    block = EmailBodyBlock()
+    try:
+        if not block.is_current():
+            print("[EMAILS] Costruzione blocco dei corpi per la ricerca per sottostringa...", flush=True)
+            block.build()
+        return block.open()
+    except (OSError, ValueError) as e:
+        print(f"[EMAILS] Blocco dei corpi non disponibile, ricerca solo nei metadati: {e}", flush=True)
+        return None
+
+
+_columns = None
+_index = None
+_index_lock = threading.Lock()
+
+
+def _result_columns():
+    """Colonne dei risultati come array (i risultati si leggono per posizione)"""
+    global _columns
+    if _columns is None:
+        df = get_emails_df()
+        if df is not None:
+            _columns = {c: df[c].fillna('').astype(str).to_numpy() for c in RESULT_FIELDS if c in df.columns}
+    return _columns
+
+
+def email_records(rows):
+    """Email alle posizioni date come dict {colonna: valore}, corpo letto dal parquet"""
+    columns = _result_columns() or {}
+    rows = np.asarray(rows, dtype=np.int64)
+    sliced = {c: values[rows] for c, values in columns.items()}
+    records = [dict(zip(sliced, values)) for values in zip(*sliced.values())] if sliced else [{} for _ in rows]
+    for record, body in zip(records, get_email_bodies(rows.tolist())):
+        record[EMAIL_BODY_COLUMN] = body
+    return records
+
+
+def get_email_index():
+    """Indice di ricerca per sottostringa, costruito al primo uso"""
+    global _index
+    df = get_emails_df()
+    if _index is None and df is not None:
+        with _index_lock:
+            if _index is None:
+                _index = EmailSearchIndex(df, _email_body_block())
+                print(f"[EMAILS] Indice di ricerca pronto: {len(df)} email, "
+                      f"{len(_index.haystack) // 1024} KB di metadati", flush=True)
+    return _index
+
+
+_fts = None
+_fts_lock = threading.Lock()
+_fts_failed = False
+
+
+def get_email_fts():
+    """Indice FTS5 del dataset email, (ri)costruito se manca o se il parquet è cambiato"""
+    global _fts, _fts_failed
+    df = get_emails_df()
+    if _fts is not None or _fts_failed or df is None:
+        return _fts
+    with _fts_lock:
+        if _fts is None and not _fts_failed:
+            try:
+                index = EmailFullTextIndex()
+                if not index.is_current():
+                    print(f"[EMAILS] Costruzione indice full-text ({len(df)} email)...", flush=True)
+                    index.build(df, ((start, [strip_html(v) for v in bodies])
+                                     for start, bodies in iter_email_bodies()))
+                    print(f"[EMAILS] Indice full-text pronto: {os.path.basename(index.db_path)}", flush=True)
+                _fts = index
+            except (sqlite3.Error, OSError) as e:
+                # Ad es. sqlite senza FTS5: resta la ricerca per sottostringa
+                print(f"[EMAILS] Indice full-text non disponibile: {e}", flush=True)
+                _fts_failed = True
+    return _fts
+
+
+def _result(row, snippet, score=None):
+    msg = str(row.get('message_html', ''))
+    result = {
+        "id": str(row.get('id', '')),
+        "doc_id": str(row.get('document_id', '')),
+        "source": str(row.get('source_filename', '')),
+        "from": str(row.get('from_address', '')),
+        "to": str(row.get('to_address', '')),
+        "other_recipients": str(row.get('other_recipients', '')),
+        "subject": str(row.get('subject', '')),
+        "date": str(row.get('timestamp_raw', '')),
+        "date_iso": str(row.get('timestamp_iso', '')),
+        "message": msg[:2000],
+        "snippet": snippet(msg) if callable(snippet) else snippet,
+    }
+    if score is not None:
+        result["score"] = score
+    return result
+
+
+def _snippet(msg, query_lower):
+    """Contesto della prima occorrenza nel testo senza HTML (lo stesso usato per la ricerca)"""
+    text = strip_html(msg)
+    idx = text.lower().find(query_lower)
+    if idx == -1:
+        return ""
+    start = max(0, idx - 100)
+    end = min(len(text), idx + len(query_lower) + 100)
+    return "..." + " ".join(text[start:end].split()) + "..."
 
 
 def search_emails(query, limit=50):
-    """Cerca nel dataset email di Epstein"""
-    if EMAILS_DF is None:
+    """Cerca nel dataset email di Epstein: BM25 sull'indice full-text, altrimenti per sottostringa"""
+    if get_emails_df() is None:
         return {"total": 0, "results": [], "error": "Dataset email non caricato"}
 
-    query_lower = query.lower()
+    words = plain_terms(query)
+    fts = get_email_fts()
+    found = None
+    if fts is not None:
+        try:
+            found = fts.search(query, limit)
+        except sqlite3.Error as e:
+            print(f"[EMAILS] Errore ricerca full-text '{query}': {e}", flush=True)
+    if found is not None and (found["total"] or not words or len(words) > 1):
+        rows = email_records(found["rows"])
+        results = [
+            _result(row, f"...{snippet}..." if snippet else "", score)
+            for row, snippet, score in zip(rows, found["snippets"], found["scores"])
+        ]
+        response = {"total": found["total"], "results": results, "source": "huggingface_emails", "ranking": "bm25"}
+        if found.get("error"):
+            response["error"] = found["error"]
+        return response
+    if not words:
+        return {"total": 0, "results": [], "source": "huggingface_emails", "ranking": "bm25",
+                "error": "Indice full-text non disponibile: campi, date e operatori non sono supportati"}
 
-    mask = (
-        EMAILS_DF['subject'].fillna('').str.lower().str.contains(query_lower, regex=False) |
-        EMAILS_DF['from_address'].fillna('').str.lower().str.contains(query_lower, regex=False) |
-        EMAILS_DF['to_address'].fillna('').str.lower().str.contains(query_lower, regex=False) |
-        EMAILS_DF['message_html'].fillna('').str.lower().str.contains(query_lower, regex=False) |
-        EMAILS_DF['other_recipients'].fillna('').str.lower().str.contains(query_lower, regex=False)
-    )
-
-    matches = EMAILS_DF[mask].head(limit)
-
-    results = []
-    for _, row in matches.iterrows():
-        msg = str(row.get('message_html', ''))
-        snippet = ""
-        if query_lower in msg.lower():
-            idx = msg.lower().find(query_lower)
-            start = max(0, idx - 100)
-            end = min(len(msg), idx + len(query_lower) + 100)
-            snippet = "..." + msg[start:end] + "..."
-
-        results.append({
-            "id": str(row.get('id', '')),
-            "doc_id": str(row.get('document_id', '')),
-            "source": str(row.get('source_filename', '')),
-            "from": str(row.get('from_address', '')),
-            "to": str(row.get('to_address', '')),
-            "other_recipients": str(row.get('other_recipients', '')),
-            "subject": str(row.get('subject', '')),
-            "date": str(row.get('timestamp_raw', '')),
-            "date_iso": str(row.get('timestamp_iso', '')),
-            "message": msg[:2000],
-            "snippet": snippet,
-        })
-
-    return {"total": int(mask.sum()), "results": results, "source": "huggingface_emails"}
+    query_lower = query.lower()
+    rows = get_email_index().match_rows(query)
+    results = [_result(row, lambda msg: _snippet(msg, query_lower)) for row in email_records(rows[:limit])]
+    return {"total": int(len(rows)), "results": results, "source": "huggingface_emails", "ranking": "substring"}
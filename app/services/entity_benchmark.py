@@ -0,0 +1,63 @@
+"""
+Benchmark dell'estrazione entità sul corpus locale: tempi e throughput
+dell'estrattore precompilato, con e senza posizioni delle menzioni.
+Uso: python -m app.services.entity_benchmark [limite_documenti]
+"""
+import os
+import re
+import sys
+import time
+
+from app.config import DOCUMENTS_DIR, EMAILS_PARQUET
+from app.services.entity_extractor import extract_entities
+
+TAG_RE = re.compile(r'<[^>]+>')
+
+
+def load_corpus(limit=None):
+    """Testi di DOCUMENTS_DIR; se vuota, le email del parquet raggruppate per thread"""
+    texts = []
+    if os.path.isdir(DOCUMENTS_DIR):
+        for name in sorted(os.listdir(DOCUMENTS_DIR)):
+            if name.endswith(".txt"):
+                with open(os.path.join(DOCUMENTS_DIR, name), encoding="utf-8", errors="ignore") as f:
+                    texts.append(f.read())
+    if not texts and os.path.exists(EMAILS_PARQUET):
+        import pandas as pd
+        df = pd.read_parquet(EMAILS_PARQUET, columns=["email_document_id", "message_html"])
+        for _, group in df.groupby("email_document_id", sort=True):
+            texts.append("\n\n".join(TAG_RE.sub(" ", h or "") for h in group["message_html"]))
+    return texts[:limit] if limit else texts
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def run_benchmark(limit=None):
+    texts = load_corpus(limit)
+    if not texts:
+        print("[BENCH] Nessun documento locale", flush=True)
+        return None
+    chars = sum(len(t) for t in texts)
+    print(f"[BENCH] {len(texts)} documenti, {chars:,} caratteri", flush=True)
+
+    plain, t_plain = _timed(lambda: [extract_entities(t) for t in texts])
+    _, t_spans = _timed(lambda: [extract_entities(t, with_spans=True) for t in texts])
+    report = {
+        "documents": len(texts),
+        "chars": chars,
+        "entities": sum(len(v) for e in plain for v in e.values()),
+        "plain_s": round(t_plain, 3),
+        "spans_s": round(t_spans, 3),
+        "chars_per_s": round(chars / t_plain) if t_plain else None,
+    }
+    for key, value in report.items():
+        print(f"[BENCH] {key}: {value}", flush=True)
+    return report
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else None)
@@ -0,0 +1,386 @@
+"""
+Entità per documento (sqlite): estratte una sola volta quando un documento
+viene salvato o indicizzato, con chiave codice EFTA (o URL) e hash del contenuto.
+Grafo, dossier e co-occorrenze leggono da qui invece di rieseguire le regex.
+Nello stesso file, menzioni di persone e coppie co-occorrenti per documento,
+aggiornate insieme alle entità: i sottografi si ottengono filtrando per documento.
+Ogni coppia porta la distanza minima (caratteri) tra le menzioni delle due
+persone: una coppia conta solo se entro COOCCURRENCE_WINDOW, come quando le
+co-occorrenze si calcolavano sui singoli snippet e non sul documento intero.
+"""
+import json
+import bisect
+import sqlite3
+import hashlib
+import threading
+from datetime import datetime
+
+from app.config import ENTITY_STORE_DB, ENTITY_PAIR_MAX_PEOPLE, NETWORK_TOP_PEOPLE, COOCCURRENCE_WINDOW
+from app.services.doc_registry import extract_efta_id, LOOKUP_BATCH
+from app.services.entity_extractor import extract_entities_batch, ENTITY_TYPES
+
+
+def content_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def document_key(doc_id=None, url=None):
+    """Chiave di un documento: codice EFTA se presente, altrimenti URL o doc_id"""
+    return extract_efta_id(doc_id, url) or url or doc_id
+
+
+def _is_document_text(text):
+    return bool(text and text.strip()) and not text.startswith(('[Errore', '[OCR'))
+
+
+class EntityStore:
+    """Tabella document_entities: chiave → hash del testo, entità e offset."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _db(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS document_entities (
+                    doc_key TEXT PRIMARY KEY,
+                    content_hash TEXT NOT NULL,
+                    entities TEXT NOT NULL,
+                    spans TEXT,
+                    computed_at TEXT
+                );
+                CREATE TABLE IF NOT EXISTS mentions (
+                    doc_key TEXT NOT NULL,
+                    person TEXT NOT NULL,
+                    occurrences INTEGER NOT NULL,
+                    PRIMARY KEY (doc_key, person)
+                ) WITHOUT ROWID;
+            """)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(cooccurrences)")}
+            if columns and "distance" not in columns:
+                # Coppie per documento intero senza distanza: ricalcolate dagli offset
+                conn.execute("DROP TABLE cooccurrences")
+                conn.execute("DELETE FROM mentions")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS cooccurrences (
+                    doc_key TEXT NOT NULL,
+                    person_a TEXT NOT NULL,
+                    person_b TEXT NOT NULL,
+                    distance INTEGER,
+                    PRIMARY KEY (doc_key, person_a, person_b)
+                ) WITHOUT ROWID;
+            """)
+            if (conn.execute("SELECT 1 FROM mentions LIMIT 1").fetchone() is None
+                    and conn.execute("SELECT 1 FROM document_entities LIMIT 1").fetchone() is not None):
+                self._backfill_graph(conn)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _people_counts(entities):
+        spans = entities.get("spans", {}).get("people", {})
+        return {p: len(spans.get(p, ())) or 1 for p in entities.get("people", [])}
+
+    @staticmethod
+    def _people_offsets(entities):
+        """{persona: inizi delle menzioni ordinati}; lista vuota se mancano gli offset"""
+        spans = entities.get("spans", {}).get("people", {})
+        return {p: sorted(s[0] for s in spans.get(p, ())) for p in entities.get("people", [])}
+
+    @staticmethod
+    def _min_distance(a, b):
+        """Distanza minima tra due liste ordinate di offset; None se una è vuota"""
+        if not a or not b:
+            return None
+        if len(a) > len(b):
+            a, b = b, a
+        best = None
+        for x in a:
+            i = bisect.bisect_left(b, x)
+            for j in (i - 1, i):
+                if 0 <= j < len(b):
+                    d = abs(b[j] - x)
+                    if best is None or d < best:
+                        best = d
+        return best
+
+    @classmethod
+    def _write_graph(cls, conn, key, counts, offsets):
+        """Sostituisce menzioni e coppie (con distanza minima) di un documento (idempotente)"""
+        conn.execute("DELETE FROM mentions WHERE doc_key = ?", (key,))
+        conn.execute("DELETE FROM cooccurrences WHERE doc_key = ?", (key,))
+        conn.executemany(
+            "INSERT INTO mentions (doc_key, person, occurrences) VALUES (?, ?, ?)",
+            [(key, person, n) for person, n in counts.items()],
+        )
+        people = sorted(sorted(counts, key=counts.get, reverse=True)[:ENTITY_PAIR_MAX_PEOPLE])
+        conn.executemany(
+            "INSERT INTO cooccurrences (doc_key, person_a, person_b, distance) VALUES (?, ?, ?, ?)",
+            [(key, a, b, cls._min_distance(offsets.get(a), offsets.get(b)))
+             for i, a in enumerate(people) for b in people[i + 1:]],
+        )
+
+    def _backfill_graph(self, conn):
+        """Archivi creati prima delle tabelle del grafo: menzioni e coppie dalle entità salvate"""
+        rows = conn.execute("SELECT doc_key, entities, spans FROM document_entities").fetchall()
+        for key, entities, spans in rows:
+            entities = json.loads(entities)
+            entities["spans"] = json.loads(spans) if spans else {}
+            self._write_graph(conn, key, self._people_counts(entities), self._people_offsets(entities))
+        print(f"[ENTITIES] Grafo delle co-occorrenze ricostruito per {len(rows)} documenti", flush=True)
+
+    def put_many(self, rows):
+        """
+        Salva [(chiave, hash, entità con "spans")] sostituendo le versioni precedenti,
+        insieme a menzioni e coppie di persone dei documenti
+        """
+        now = datetime.now().isoformat()
+        values = []
+        for key, digest, entities in rows:
+            lists = {t: entities.get(t, []) for t in ENTITY_TYPES}
+            values.append((key, digest, json.dumps(lists), json.dumps(entities.get("spans", {})), now))
+        if not values:
+            return
+        with self._lock:
+            conn = self._db()
+            conn.executemany(
+                "INSERT OR REPLACE INTO document_entities (doc_key, content_hash, entities, spans, computed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                values,
+            )
+            for key, _, entities in rows:
+                self._write_graph(conn, key, self._people_counts(entities), self._people_offsets(entities))
+            conn.commit()
+
+    def get_many(self, keys, with_spans=False):
+        """{chiave: {"hash", "entities"}} per le chiavi presenti"""
+        keys = list(dict.fromkeys(k for k in keys if k))
+        columns = "doc_key, content_hash, entities" + (", spans" if with_spans else "")
+        found = {}
+        with self._lock:
+            conn = self._db()
+            for start in range(0, len(keys), LOOKUP_BATCH):
+                batch = keys[start:start + LOOKUP_BATCH]
+                rows = conn.execute(
+                    f"SELECT {columns} FROM document_entities WHERE doc_key IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                for row in rows:
+                    entities = json.loads(row[2])
+                    if with_spans:
+                        entities["spans"] = json.loads(row[3]) if row[3] else {}
+                    found[row[0]] = {"hash": row[1], "entities": entities}
+        return found
+
+    def documents_by_person(self, keys):
+        """{persona: [chiavi dei documenti che la citano]} per i documenti dati"""
+        keys = list(dict.fromkeys(k for k in keys if k))
+        people = {}
+        with self._lock:
+            conn = self._db()
+            for start in range(0, len(keys), LOOKUP_BATCH):
+                batch = keys[start:start + LOOKUP_BATCH]
+                rows = conn.execute(
+                    f"SELECT person, doc_key FROM mentions WHERE doc_key IN ({','.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+                for person, key in rows:
+                    people.setdefault(person, []).append(key)
+        return people
+
+    def edge_weights(self, keys, people, window=COOCCURRENCE_WINDOW):
+        """
+        {(persona_a, persona_b): documenti in cui sono citate entro `window` caratteri}
+        tra le persone date, nei documenti dati (coppie senza offset: contate)
+        """
+        keys = list(dict.fromkeys(k for k in keys if k))
+        people = sorted(set(people))
+        if not people:
+            return {}
+        marks = ",".join("?" * len(people))
+        weights = {}
+        with self._lock:
+            conn = self._db()
+            for start in range(0, len(keys), LOOKUP_BATCH):
+                batch = keys[start:start + LOOKUP_BATCH]
+                rows = conn.execute(
+                    "SELECT person_a, person_b, COUNT(*) FROM cooccurrences "
+                    f"WHERE doc_key IN ({','.join('?' * len(batch))}) "
+                    f"AND person_a IN ({marks}) AND person_b IN ({marks}) "
+                    "AND (distance IS NULL OR distance <= ?) GROUP BY person_a, person_b",
+                    batch + people + people + [window],
+                ).fetchall()
+                for a, b, n in rows:
+                    weights[(a, b)] = weights.get((a, b), 0) + n
+        return weights
+
+    def paired_people(self, keys, window=COOCCURRENCE_WINDOW):
+        """{chiave: persone citate entro `window` caratteri da un'altra persona} per i documenti dati"""
+        keys = list(dict.fromkeys(k for k in keys if k))
+        paired = {}
+        with self._lock:
+            conn = self._db()
+            for start in range(0, len(keys), LOOKUP_BATCH):
+                batch = keys[start:start + LOOKUP_BATCH]
+                rows = conn.execute(
+                    "SELECT doc_key, person_a, person_b FROM cooccurrences "
+                    f"WHERE doc_key IN ({','.join('?' * len(batch))}) AND (distance IS NULL OR distance <= ?)",
+                    batch + [window],
+                ).fetchall()
+                for key, a, b in rows:
+                    paired.setdefault(key, set()).update((a, b))
+        return paired
+
+    def stats(self):
+        with self._lock:
+            count = self._db().execute("SELECT COUNT(*) FROM document_entities").fetchone()[0]
+        return {"documents": count}
+
+
+entity_store = EntityStore(ENTITY_STORE_DB)
+
+
+def record_documents(items):
+    """
+    Estrae e salva le entità dei testi completi [(chiave, testo)];
+    i documenti il cui hash è già registrato non vengono rielaborati.
+    """
+    items = [(key, text) for key, text in items if key and _is_document_text(text)]
+    if not items:
+        return
+    hashes = [content_hash(text) for _, text in items]
+    try:
+        stored = entity_store.get_many([key for key, _ in items])
+    except sqlite3.Error as e:
+        print(f"[ENTITIES] Errore archivio entità: {e}", flush=True)
+        return
+    todo = [(key, digest, text) for (key, text), digest in zip(items, hashes)
+            if stored.get(key, {}).get("hash") != digest]
+    if not todo:
+        return
+    extracted = extract_entities_batch([text for _, _, text in todo], with_spans=True)
+    try:
+        entity_store.put_many([(key, digest, entities) for (key, digest, _), entities in zip(todo, extracted)])
+    except sqlite3.Error as e:
+        print(f"[ENTITIES] Errore archivio entità: {e}", flush=True)
+
+
+def record_document(key, text):
+    record_documents([(key, text)])
+
+
+def _resolve(documents):
+    """[(chiave, entità, archiviato)] per ciascun documento, estraendo e archiviando i mancanti"""
+    keys, texts, full = [], [], []
+    for doc in documents:
+        keys.append(document_key(doc.get('doc_id') or doc.get('id'), doc.get('url')))
+        full_text = doc.get('full_text', '')
+        texts.append(full_text or doc.get('text', '') or ' '.join(doc.get('snippets', [])))
+        full.append(_is_document_text(full_text))
+
+    try:
+        stored = entity_store.get_many(keys)
+    except sqlite3.Error as e:
+        print(f"[ENTITIES] Errore archivio entità: {e}", flush=True)
+        stored = {}
+
+    results = [None] * len(documents)
+    missing = []
+    for i, (key, text) in enumerate(zip(keys, texts)):
+        entry = stored.get(key)
+        if entry and (not full[i] or entry["hash"] == content_hash(text)):
+            results[i] = (key, entry["entities"], True)
+        else:
+            missing.append(i)
+
+    if missing:
+        extracted = extract_entities_batch([texts[i] for i in missing], with_spans=True)
+        to_store = [(keys[i], content_hash(texts[i]), entities)
+                    for i, entities in zip(missing, extracted) if full[i] and keys[i]]
+        try:
+            entity_store.put_many(to_store)
+            written = {key for key, _, _ in to_store}
+        except sqlite3.Error as e:
+            print(f"[ENTITIES] Errore archivio entità: {e}", flush=True)
+            written = set()
+        for i, entities in zip(missing, extracted):
+            entities.pop("spans", None)
+            results[i] = (keys[i], entities, full[i] and keys[i] in written)
+    return results
+
+
+def entities_for_documents(documents):
+    """
+    Entità per ciascun documento {"doc_id"/"url", "full_text"/"text"/"snippets"},
+    nello stesso ordine. Con il testo completo si usa la voce archiviata se l'hash
+    coincide (altrimenti si estrae e si archivia); con solo estratti o snippet si
+    preferiscono le entità già archiviate del documento intero.
+    """
+    return [entities for _, entities, _ in _resolve(documents)]
+
+
+def cooccurring_people(documents):
+    """
+    Per ciascun documento (come entities_for_documents), le persone citate
+    vicino ad almeno un'altra: per i documenti archiviati entro COOCCURRENCE_WINDOW
+    caratteri, per quelli con solo snippet le persone degli snippet stessi.
+    """
+    resolved = _resolve(documents)
+    try:
+        paired = entity_store.paired_people([key for key, _, stored in resolved if stored])
+    except sqlite3.Error as e:
+        print(f"[ENTITIES] Errore archivio entità: {e}", flush=True)
+        paired = {}
+    return [
+        sorted(paired.get(key, ())) if stored else list(dict.fromkeys(entities.get("people", [])))
+        for key, entities, stored in resolved
+    ]
+
+
+def cooccurrence_subgraph(documents, top_n=NETWORK_TOP_PEOPLE):
+    """
+    Sottografo delle co-occorrenze tra persone per i documenti dati → (persone, archi):
+    persone = [(nome, [indici dei documenti che la citano])] per numero di documenti,
+    al massimo top_n; archi = {(a, b): documenti in cui sono citate entro
+    COOCCURRENCE_WINDOW caratteri}. I documenti archiviati sono letti dalle tabelle
+    mentions/cooccurrences, gli altri (solo snippet non archiviati, già brevi) sono
+    contati in memoria, con le coppie limitate alle persone scelte.
+    """
+    first_index = {}
+    transient = []
+    for i, (key, entities, stored) in enumerate(_resolve(documents)):
+        if stored:
+            first_index.setdefault(key, i)
+        else:
+            transient.append((i, entities))
+
+    people = {}
+    try:
+        for person, keys in entity_store.documents_by_person(first_index).items():
+            people[person] = [first_index[k] for k in keys]
+    except sqlite3.Error as e:
+        print(f"[ENTITIES] Errore archivio entità: {e}", flush=True)
+    for i, entities in transient:
+        for person in dict.fromkeys(entities.get("people", [])):
+            people.setdefault(person, []).append(i)
+
+    top = sorted(people.items(), key=lambda x: (-len(x[1]), x[0]))[:top_n]
+    names = {person for person, _ in top}
+
+    try:
+        edges = entity_store.edge_weights(first_index, names)
+    except sqlite3.Error as e:
+        print(f"[ENTITIES] Errore archivio entità: {e}", flush=True)
+        edges = {}
+    for _, entities in transient:
+        present = sorted(set(entities.get("people", [])) & names)
+        for j, a in enumerate(present):
+            for b in present[j + 1:]:
+                edges[(a, b)] = edges.get((a, b), 0) + 1
+
+    return [(person, sorted(indices)) for person, indices in top], edges
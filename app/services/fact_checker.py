@@ -3,7 +3,8 @@ Fact-checker per citazioni EFTA nei report investigativi.
 Verifica che ogni codice EFTA citato esista realmente in ChromaDB o su justice.gov.
 """
 import re
-from app.agents.vectordb import is_document_indexed
+from app.agents.vectordb import are_documents_indexed
+from app.services.efta_registry import efta_registry
 from app.services.justice_gov import search_justice_gov
 
 
@@ -33,18 +34,26 @@ def verify_citations(report_text):
     details = []
     verified_count = 0
 
+    # Check 1: ChromaDB — un'unica verifica in blocco sul registro
+    try:
+        indexed = are_documents_indexed(efta_codes)
+    except Exception:
+        indexed = {}
+
+    # Id già visti in risposte di justice.gov: verificati senza andare in rete
+    try:
+        known = efta_registry.get_many(efta_codes)
+    except Exception:
+        known = {}
+
     for doc_id in sorted(efta_codes):
         source = None
+        if indexed.get(doc_id, {}).get("indexed"):
+            source = "chromadb"
 
-        # Check 1: ChromaDB
-        try:
-            chroma_result = is_document_indexed(doc_id)
-            if chroma_result.get("indexed"):
-                source = "chromadb"
-        except Exception:
-            pass
-
-        # Check 2: justice.gov (solo se non trovato in ChromaDB)
+        # Check 2: registro EFTA locale, poi justice.gov solo per gli id mai visti
+        if not source and doc_id in known:
+            source = "justice.gov"
         if not source:
             try:
                 gov_result = search_justice_gov(doc_id, size=1)
@@ -0,0 +1,360 @@
+"""
+Registro voli (epstein_flights_data.json) analizzato una sola volta:
+colonne per volo (data normalizzata, tratta, aereo, passeggeri) e indici
+per passeggero, tratta, aeroporto, aereo e data. Le query filtrate
+intersecano gli indici: il costo dipende dai voli trovati, non dal registro.
+
+Le date del registro hanno solo giorno e mese ("6-Jan", "25-Sept"): l'anno
+avanza quando la data torna indietro di oltre YEAR_ROLLOVER_DAYS giorni.
+Senza FLIGHTS_FIRST_YEAR l'anno reale non è noto: i voli riportano solo
+log_year/month/day (date_iso è null) e i filtri per data sono rifiutati.
+Le sigle dei passeggeri sono espanse (JE, GM e, dai dati, le sigle che
+corrispondono alle iniziali di un solo nome completo nel registro).
+"""
+import os
+import re
+import json
+import hashlib
+import threading
+from bisect import bisect_left, bisect_right
+from collections import Counter
+
+from app.config import FLIGHTS_JSON, FLIGHTS_FIRST_YEAR, FLIGHTS_PAGE_SIZE, FLIGHTS_MAX_PAGE_SIZE
+
+KNOWN_INITIALS = {"JE": "JEFFREY EPSTEIN", "GM": "GHISLAINE MAXWELL"}
+
+MONTHS = {m: i for i, m in enumerate(
+    ("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"), 1)}
+# Una data più indietro di così rispetto alla precedente apre un nuovo anno
+# (piccole inversioni sono righe fuori ordine nello stesso anno)
+YEAR_ROLLOVER_DAYS = 45
+
+LOG_DATE_RE = re.compile(r'^\s*(\d{1,2})-([A-Za-z]{3,})')
+QUERY_DATE_RE = re.compile(r'^(\d{4})(?:-(\d{1,2}))?(?:-(\d{1,2}))?$')
+BRACKET_RE = re.compile(r'\[([^\]?]+)\]')
+# Annotazioni del trascrittore: "(SP?)", "[?]", "(ILLEGIBLE)", "(NM CROSSED OUT)"
+NOTE_RE = re.compile(r'\([^)]*\)|\[[^\]]*\]')
+EDGE_PUNCT = " &/.?()[]-+:;\"'"
+# "SAME AS ABOVE", "SAME AS 116", con eventuale ADD / LESS: con LESS i nomi elencati
+# sono passeggeri scesi, non presenti sul volo
+SAME_AS_RE = re.compile(r'^\s*SAME AS (?:ABOVE|\d+)\s*(?:(ADD|LESS)\b)?\s*')
+# Date di altre righe finite nella cella passeggeri dall'OCR ("ET 1-SEPT JE")
+STRAY_DATE_RE = re.compile(r'\b(?:\d{1,2}-(?:JAN|FEB|MAR|APR|MAY|JUNE?|JULY?|AUG|SEPT?|OCT|NOV|DEC)'
+                           r'|(?:JAN|FEB|MAR|APR|MAY|JUNE?|JULY?|AUG|SEPT?|OCT|NOV|DEC)-\d{1,2})\b')
+INITIALS_RE = re.compile(r'^[A-Z]{2,3}$')
+WORD_RE = re.compile(r"[A-Z][A-Z'-]*")
+# Voci senza nome: "1 FEMALE", "4 SECRET SERVICE", "1MALE"
+UNNAMED_RE = re.compile(r'^(\d+)(?:\s|(?=(?:FE)?MALES?\b|PAX\b))')
+# Conteggio accodato a un nome: "JESSICA & 6 PAX", "MONICA. 2 FEMALES"
+TRAILING_UNNAMED_RE = re.compile(r'\s*(?:&|\.|\bAND\b)\s*(\d+)\s*(?:PAX|(?:FE)?MALES?)\b.*$')
+NO_PASSENGERS = frozenset({"", "NO PASSENGERS", "EMPTY", "N/A", "NA"})
+# Voci operative (riposizionamenti, voli di prova, addestramento): nessun passeggero
+OPERATIONAL_WORDS = frozenset({
+    "REPOSITION", "REPOSITON", "TEST", "CHECK", "C-CHECK", "HOLDING", "LANDING", "LANDINGS",
+    "TCAS", "ILS", "APU", "FMS", "VOR", "SIM", "TAKEOFF", "APPROACHES", "APPROPACHES",
+    "TAXING", "CERTIFICATION", "ABORT", "CURFEW", "PAINT", "GEAR", "PPE", "OPS",
+})
+
+
+def _bracketed(value):
+    """'"" [N908JE]' → 'N908JE'"""
+    m = BRACKET_RE.search(value or "")
+    return (m.group(1) if m else (value or "")).strip().strip('"').strip()
+
+
+def _log_date(value):
+    """'6-Jan' / '25-Sept' → (mese, giorno), None se non leggibile"""
+    m = LOG_DATE_RE.match(value or "")
+    if not m or m.group(2)[:3].lower() not in MONTHS:
+        return None
+    return MONTHS[m.group(2)[:3].lower()], int(m.group(1))
+
+
+def _day_of_year(month, day):
+    return (month - 1) * 31 + day
+
+
+def _split_passengers(value):
+    """
+    Stringa passeggeri → (voci normalizzate, numero di passeggeri senza nome,
+    voci scese dopo "SAME AS ABOVE LESS": nomi validi ma assenti dal volo).
+    Scarta i residui dell'OCR: il testo da una data di un'altra riga in poi
+    ("ALBER TO& LINDA PINTO 5-Sept JE"), i prefissi ADD/LESS e le voci con
+    cifre che non sono un conteggio ("3K").
+    """
+    entries, unnamed = [], 0
+    value = (value or "").upper()
+    m = SAME_AS_RE.match(value)
+    if m:
+        if m.group(1) == "LESS":
+            return [], 0, _split_passengers(value[m.end():])[0]
+        value = value[m.end():]
+    for part in re.split(r'[,/+]', value):
+        entry = " ".join(part.split())
+        if set(WORD_RE.findall(entry)) & OPERATIONAL_WORDS:
+            continue
+        m = UNNAMED_RE.match(entry)
+        if m:
+            unnamed += int(m.group(1))
+            continue
+        m = TRAILING_UNNAMED_RE.search(entry)
+        if m:
+            unnamed += int(m.group(1))
+            entry = entry[:m.start()]
+        stray = STRAY_DATE_RE.search(entry)
+        if stray:
+            entry = entry[:stray.start()]
+        entry = " ".join(NOTE_RE.sub(" ", entry).split()).strip(EDGE_PUNCT)
+        if entry in NO_PASSENGERS or not re.search(r'[A-Z]', entry) or re.search(r'\d', entry):
+            continue
+        tokens = entry.split()
+        if all(len(t) == 1 for t in tokens):
+            # "L V" → "LV"
+            entry = "".join(tokens)
+        entries.append(entry)
+    return entries, unnamed, []
+
+
+def _initials(name):
+    words = name.split()
+    if len(words) < 2 or not all(w.isalpha() and len(w) > 1 for w in words):
+        return None
+    return "".join(w[0] for w in words)
+
+
+def _query_date(value, end=False):
+    """
+    'AAAA[-MM[-GG]]' → chiave confrontabile con FlightLog.date_keys.
+    ValueError se manca FLIGHTS_FIRST_YEAR: l'anno non si può collocare nel registro.
+    """
+    m = QUERY_DATE_RE.match((value or "").strip())
+    if not m:
+        return None
+    if FLIGHTS_FIRST_YEAR is None:
+        raise ValueError("Filtri per data non disponibili: anno iniziale del registro (FLIGHTS_FIRST_YEAR) non impostato")
+    year, month, day = int(m.group(1)), m.group(2), m.group(3)
+    log_year = year - FLIGHTS_FIRST_YEAR
+    month = int(month) if month else (12 if end else 1)
+    day = int(day) if day else (31 if end else 1)
+    return log_year * 10000 + month * 100 + day
+
+
+class FlightLog:
+    """Voli in colonne parallele (posizione = id del volo) + indici inversi."""
+
+    def __init__(self, data, version=""):
+        self.version = version
+        self.data = data
+        self.airports = data.get("airports", {})
+        flights = data.get("flights", [])
+        self.size = len(flights)
+
+        self.log_years, self.months, self.days, self.date_keys = [], [], [], []
+        self.origins, self.destinations, self.tails, self.aircraft = [], [], [], []
+        self.passengers, self.unnamed = [], []
+
+        log_year, previous = 0, None
+        entries_per_flight, removed = [], []
+        for flight in flights:
+            date = _log_date(flight.get("date"))
+            if date is not None:
+                if previous is not None and _day_of_year(*previous) - _day_of_year(*date) > YEAR_ROLLOVER_DAYS:
+                    log_year += 1
+                previous = date
+            month, day = date or (0, 0)
+            self.log_years.append(log_year)
+            self.months.append(month)
+            self.days.append(day)
+            self.date_keys.append(log_year * 10000 + month * 100 + day)
+            self.origins.append((flight.get("from") or "").strip().upper())
+            self.destinations.append((flight.get("to") or "").strip().upper())
+            self.tails.append(_bracketed(flight.get("tail")).upper())
+            self.aircraft.append(_bracketed(flight.get("aircraft")))
+            entries, unnamed, left = _split_passengers(flight.get("passengers"))
+            entries_per_flight.append(entries)
+            removed.extend(left)
+            self.unnamed.append(unnamed)
+
+        self.expansions = self._expansions(entries_per_flight + [removed])
+        self.aliases = {}
+        for entries in entries_per_flight:
+            names = []
+            for entry in entries:
+                for name in self._canonical(entry):
+                    if name not in names:
+                        names.append(name)
+                    if entry != name:
+                        self.aliases.setdefault(name, set()).add(entry)
+            self.passengers.append(tuple(names))
+
+        self.by_passenger, self.by_route, self.by_airport, self.by_tail = {}, {}, {}, {}
+        for i in range(self.size):
+            for name in self.passengers[i]:
+                self.by_passenger.setdefault(name, []).append(i)
+            self.by_route.setdefault(f"{self.origins[i]}-{self.destinations[i]}", []).append(i)
+            for code in {self.origins[i], self.destinations[i]}:
+                self.by_airport.setdefault(code, []).append(i)
+            self.by_tail.setdefault(self.tails[i], []).append(i)
+        self.passenger_counts = Counter({name: len(rows) for name, rows in self.by_passenger.items()})
+
+        self._by_date = sorted(range(self.size), key=self.date_keys.__getitem__)
+        self._sorted_keys = [self.date_keys[i] for i in self._by_date]
+
+    def _expansions(self, entries_per_flight):
+        """
+        Sigla → nome completo: JE e GM, più le sigle con un solo nome del registro
+        con quelle iniziali (compresi i nomi delle righe "SAME AS ABOVE LESS")
+        """
+        names = {e for entries in entries_per_flight for e in entries}
+        self.codes = {e for e in names if INITIALS_RE.match(e)}
+        candidates = {}
+        for name in names:
+            initials = _initials(name)
+            if initials in self.codes:
+                candidates.setdefault(initials, set()).add(name)
+        expansions = {code: found.pop() for code, found in candidates.items() if len(found) == 1}
+        expansions.update(KNOWN_INITIALS)
+        return expansions
+
+    def _canonical(self, entry):
+        """Voce → nomi: sigle espanse, sigle accostate ("SK LV", "TD GARY BLACKWELL") separate"""
+        tokens = entry.split()
+        if len(tokens) > 1 and tokens[0] in self.codes:
+            if all(t in self.codes for t in tokens):
+                return [self.expansions.get(t, t) for t in tokens]
+            return [self.expansions.get(tokens[0], tokens[0])] + self._canonical(" ".join(tokens[1:]))
+        return [self.expansions.get(entry, entry)]
+
+    def match_passengers(self, query):
+        """Nomi canonici per query: nome, sigla o forma originale; altrimenti parole intere o sottostringa"""
+        q = " ".join((query or "").upper().split())
+        if not q:
+            return []
+        if q in self.by_passenger:
+            return [q]
+        if q in self.expansions:
+            return [self.expansions[q]]
+        exact = [n for n, aliases in self.aliases.items() if q in aliases]
+        if exact:
+            return exact
+        padded = f" {q} "
+        words = [n for n in self.by_passenger if padded in f" {n} "]
+        return words or [n for n in self.by_passenger if q in n]
+
+    def _passenger_rows(self, query):
+        rows = set()
+        for name in self.match_passengers(query):
+            rows.update(self.by_passenger[name])
+        return rows
+
+    def _date_rows(self, date_from, date_to):
+        low = bisect_left(self._sorted_keys, date_from) if date_from is not None else 0
+        high = bisect_right(self._sorted_keys, date_to) if date_to is not None else self.size
+        return set(self._by_date[low:high])
+
+    def flight(self, i):
+        """Volo originale + campi normalizzati"""
+        record = dict(self.data["flights"][i])
+        if self.months[i] and FLIGHTS_FIRST_YEAR is not None:
+            year = self.log_years[i] + FLIGHTS_FIRST_YEAR
+            record["date_iso"] = f"{year:04d}-{self.months[i]:02d}-{self.days[i]:02d}"
+        else:
+            record["date_iso"] = None
+        record.update({
+            "id": i,
+            "log_year": self.log_years[i] + 1,
+            "month": self.months[i] or None,
+            "day": self.days[i] or None,
+            "tail_number": self.tails[i],
+            "aircraft_type": self.aircraft[i],
+            "passenger_names": list(self.passengers[i]),
+            "unnamed_passengers": self.unnamed[i],
+        })
+        return record
+
+    def query(self, passenger=None, with_passengers=(), airport=None, origin=None, destination=None,
+              route=None, tail=None, date_from=None, date_to=None, page=1, per_page=FLIGHTS_PAGE_SIZE):
+        """
+        Voli filtrati (in ordine di registro), una pagina alla volta.
+        Date come AAAA[-MM[-GG]]: l'anno è FLIGHTS_FIRST_YEAR + anno del registro;
+        ValueError se FLIGHTS_FIRST_YEAR non è impostato.
+        """
+        candidates = []
+        if passenger:
+            candidates.append(self._passenger_rows(passenger))
+        for other in with_passengers:
+            candidates.append(self._passenger_rows(other))
+        if airport:
+            candidates.append(set(self.by_airport.get(airport.strip().upper(), ())))
+        if origin or destination:
+            o, d = (origin or "").strip().upper(), (destination or "").strip().upper()
+            if o and d:
+                candidates.append(set(self.by_route.get(f"{o}-{d}", ())))
+            else:
+                rows = self.by_airport.get(o or d, ())
+                candidates.append({i for i in rows if (self.origins[i] == o if o else self.destinations[i] == d)})
+        if route:
+            candidates.append(set(self.by_route.get(route.strip().upper(), ())))
+        if tail:
+            candidates.append(set(self.by_tail.get(tail.strip().upper(), ())))
+        low, high = _query_date(date_from), _query_date(date_to, end=True)
+        if low is not None or high is not None:
+            candidates.append(self._date_rows(low, high))
+
+        if candidates:
+            candidates.sort(key=len)
+            rows = candidates[0].intersection(*candidates[1:])
+            rows = sorted(rows)
+        else:
+            rows = range(self.size)
+
+        per_page = max(1, min(per_page, FLIGHTS_MAX_PAGE_SIZE))
+        page = max(1, page)
+        total = len(rows)
+        selected = rows[(page - 1) * per_page:page * per_page]
+
+        result = {
+            "flights": [self.flight(i) for i in selected],
+            "total": total,
+            "page": page,
+            "per_page": per_page,
+            "pages": (total + per_page - 1) // per_page,
+            "route_counts": dict(Counter(f"{self.origins[i]}-{self.destinations[i]}" for i in rows).most_common()),
+        }
+        if passenger:
+            matched = set(self.match_passengers(passenger))
+            result["matched_passengers"] = sorted(matched)
+            result["co_passenger_counts"] = dict(Counter(
+                name for i in rows for name in self.passengers[i] if name not in matched).most_common())
+        return result
+
+    def passenger_names(self):
+        """Passeggeri con nome (le sigle non espanse di due lettere sono escluse)"""
+        return sorted(name for name in self.by_passenger if len(name) > 2)
+
+    def etag(self, *parts):
+        """ETag di una risposta: versione del file + parametri della richiesta"""
+        return hashlib.sha1(json.dumps([self.version, parts], sort_keys=True).encode()).hexdigest()[:20]
+
+
+_log = None
+_log_lock = threading.Lock()
+
+
+def get_flight_log():
+    """Registro voli analizzato, ricaricato se il JSON cambia; None se manca"""
+    global _log
+    try:
+        st = os.stat(FLIGHTS_JSON)
+    except OSError:
+        return None
+    version = f"{st.st_size:x}-{int(st.st_mtime):x}"
+    if _log is not None and _log.version == version:
+        return _log
+    with _log_lock:
+        if _log is None or _log.version != version:
+            with open(FLIGHTS_JSON, "r") as f:
+                _log = FlightLog(json.load(f), version)
+            print(f"[FLIGHTS] Registro voli indicizzato: {_log.size} voli, "
+                  f"{len(_log.by_passenger)} passeggeri, {len(_log.expansions)} sigle espanse", flush=True)
+    return _log
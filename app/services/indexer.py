@@ -0,0 +1,249 @@
+"""
+Indicizzazione del corpus locale (DOCUMENTS_DIR → ChromaDB).
+Pipeline: pool di lettori → chunking → scrittura/embedding a lotti,
+collegati da code limitate. Un manifest persistente {doc_id: hash, mtime}
+permette di rielaborare solo i file nuovi o modificati (o indicizzati con
+un'altra versione del chunker); un lock globale impedisce due
+reindicizzazioni complete in parallelo.
+"""
+import os
+import json
+import queue
+import hashlib
+import threading
+from datetime import datetime
+
+from app.config import DOCUMENTS_DIR, INDEX_MANIFEST
+from app.services.chunker import CHUNKER_VERSION
+
+READER_WORKERS = 4
+QUEUE_SIZE = 64                 # documenti in attesa tra uno stadio e l'altro
+WRITE_BATCH_CHUNKS = 512        # chunk per ogni add su ChromaDB
+MANIFEST_SAVE_EVERY = 200       # documenti scritti tra un salvataggio e l'altro
+
+_index_lock = threading.Lock()
+_running_job_id = None
+
+
+class IndexManifest:
+    """Manifest JSON dei documenti già indicizzati: {doc_id: {hash, mtime, size, chunker, indexed_at}}"""
+
+    def __init__(self, path=INDEX_MANIFEST):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self._entries = json.load(f)
+            except Exception as e:
+                print(f"[INDEX-ALL] Manifest illeggibile, ricostruzione completa: {e}", flush=True)
+
+    def get(self, doc_id):
+        with self._lock:
+            return self._entries.get(doc_id)
+
+    def set(self, doc_id, entry):
+        with self._lock:
+            self._entries[doc_id] = entry
+
+    def save(self):
+        with self._lock:
+            data = json.dumps(self._entries)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+
+def _put(q, item, stop):
+    """put su coda limitata che si arrende se la pipeline viene fermata"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _bump(job, lock, key, amount=1):
+    with lock:
+        job[key] += amount
+
+
+def _reader(files_q, read_q, manifest, force, job, job_lock, stop):
+    """Stadio 1: legge i .txt, scarta quelli invariati (mtime o hash) e già chunkati con la versione corrente"""
+    while not stop.is_set():
+        try:
+            filename = files_q.get_nowait()
+        except queue.Empty:
+            return
+        doc_id = filename[:-len('.txt')]
+        try:
+            path = os.path.join(DOCUMENTS_DIR, filename)
+            st = os.stat(path)
+            entry = manifest.get(doc_id)
+            current = entry is not None and entry.get('chunker', 1) == CHUNKER_VERSION
+            if not force and current and entry.get('mtime') == st.st_mtime and entry.get('size') == st.st_size:
+                _bump(job, job_lock, 'unchanged')
+                continue
+
+            with open(path, 'r', encoding='utf-8') as f:
+                text = f.read()
+            content_hash = hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+            if not force and current and entry.get('hash') == content_hash:
+                manifest.set(doc_id, dict(entry, mtime=st.st_mtime, size=st.st_size))
+                _bump(job, job_lock, 'unchanged')
+                continue
+
+            if not text.strip() or text.startswith('[Errore'):
+                _bump(job, job_lock, 'skipped')
+                continue
+
+            _put(read_q, {
+                'doc_id': doc_id, 'text': text, 'hash': content_hash,
+                'mtime': st.st_mtime, 'size': st.st_size,
+                'replace': entry is not None or force,
+            }, stop)
+        except Exception as e:
+            with job_lock:
+                job['errors'].append({'doc_id': doc_id, 'error': str(e)})
+
+
+def _chunker(read_q, write_q, job, job_lock, stop):
+    """Stadio 2: divide i testi in chunk pronti per ChromaDB ed estrae le entità"""
+    from app.agents.vectordb import build_chunk_records
+    from app.services.entity_store import record_document, document_key
+    while not stop.is_set():
+        try:
+            item = read_q.get(timeout=0.5)
+        except queue.Empty:
+            continue
+        if item is None:
+            _put(write_q, None, stop)
+            return
+        doc_id = item['doc_id']
+        try:
+            item['url'] = f"local://documents/{doc_id}"
+            text = item.pop('text')
+            item['records'] = build_chunk_records(item['url'], doc_id, text, {'doc_id': doc_id})
+            record_document(document_key(doc_id, item['url']), text)
+        except Exception as e:
+            with job_lock:
+                job['errors'].append({'doc_id': doc_id, 'error': str(e)})
+            continue
+        if not _put(write_q, item, stop):
+            return
+
+
+def _write_batch(batch, manifest, job, job_lock):
+    """Stadio 3: scrive un lotto di documenti e aggiorna il manifest"""
+    from app.agents.vectordb import write_chunk_records, delete_document_chunks
+
+    for item in batch:
+        if item['replace']:
+            delete_document_chunks(item['url'])
+    write_chunk_records([r for item in batch for r in item['records']])
+
+    now = datetime.now().isoformat()
+    for item in batch:
+        manifest.set(item['doc_id'], {
+            'hash': item['hash'], 'mtime': item['mtime'], 'size': item['size'],
+            'chunks': len(item['records']), 'chunker': CHUNKER_VERSION, 'indexed_at': now,
+        })
+    _bump(job, job_lock, 'indexed', len(batch))
+
+
+def run_local_index(job, force=False):
+    """Esegue la pipeline completa aggiornando il dict `job` (stato, contatori, errori)"""
+    job_lock = threading.Lock()
+    stop = threading.Event()
+    manifest = IndexManifest()
+
+    txt_files = sorted(f for f in os.listdir(DOCUMENTS_DIR) if f.endswith('.txt'))
+    job['total'] = len(txt_files)
+
+    files_q = queue.Queue()
+    for filename in txt_files:
+        files_q.put(filename)
+    read_q = queue.Queue(maxsize=QUEUE_SIZE)
+    write_q = queue.Queue(maxsize=QUEUE_SIZE)
+
+    readers = [
+        threading.Thread(target=_reader, args=(files_q, read_q, manifest, force, job, job_lock, stop), daemon=True)
+        for _ in range(READER_WORKERS)
+    ]
+    for t in readers:
+        t.start()
+
+    def _close_readers():
+        for t in readers:
+            t.join()
+        _put(read_q, None, stop)
+    threading.Thread(target=_close_readers, daemon=True).start()
+    threading.Thread(target=_chunker, args=(read_q, write_q, job, job_lock, stop), daemon=True).start()
+
+    batch, batch_chunks, since_save = [], 0, 0
+    try:
+        while True:
+            item = write_q.get()
+            if item is not None:
+                batch.append(item)
+                batch_chunks += len(item['records'])
+            if batch and (item is None or batch_chunks >= WRITE_BATCH_CHUNKS):
+                _write_batch(batch, manifest, job, job_lock)
+                since_save += len(batch)
+                batch, batch_chunks = [], 0
+                done = job['indexed'] + job['unchanged'] + job['skipped'] + len(job['errors'])
+                job['progress'] = f"Indicizzazione {done}/{job['total']}"
+                if since_save >= MANIFEST_SAVE_EVERY:
+                    manifest.save()
+                    since_save = 0
+            if item is None:
+                break
+    except Exception:
+        stop.set()
+        raise
+    finally:
+        manifest.save()
+
+
+def start_local_index_job(job_id, jobs, force=False):
+    """
+    Avvia la reindicizzazione in background se non ce n'è già una in corso.
+    Ritorna (job_id effettivo, avviato) — se un job è già attivo ritorna il suo id.
+    """
+    global _running_job_id
+    if not _index_lock.acquire(blocking=False):
+        return _running_job_id, False
+
+    _running_job_id = job_id
+    jobs[job_id] = {
+        'status': 'running',
+        'progress': 'Avvio indicizzazione...',
+        'indexed': 0,
+        'skipped': 0,
+        'unchanged': 0,
+        'errors': [],
+        'total': 0,
+    }
+
+    def _run():
+        global _running_job_id
+        job = jobs[job_id]
+        try:
+            run_local_index(job, force=force)
+            job['status'] = 'completed'
+            job['progress'] = 'Completato!'
+            print(f"[INDEX-ALL] Completato: {job['indexed']} indicizzati, {job['unchanged']} invariati", flush=True)
+        except Exception as e:
+            job['status'] = 'error'
+            job['progress'] = f'Errore: {str(e)}'
+        finally:
+            _running_job_id = None
+            _index_lock.release()
+
+    threading.Thread(target=_run, daemon=True).start()
+    return job_id, True
@@ -1,33 +1,190 @@
 """
 Ricerca nel database Epstein su justice.gov — unica copia.
+Client condiviso: Session con pool di connessioni, cache TTL+LRU delle
+risposte e rate limiter token-bucket comune a tutti i thread.
 """
 import re
+import copy
+import math
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import requests
+from requests.adapters import HTTPAdapter
+
+from app.config import (
+    JUSTICE_GOV_CACHE_SIZE, JUSTICE_GOV_CACHE_TTL,
+    JUSTICE_GOV_RATE, JUSTICE_GOV_BURST, JUSTICE_GOV_MAX_WORKERS, JUSTICE_GOV_PAGE_RETRIES,
+)
+from app.services.cache import TTLCache
+from app.services.efta_registry import efta_registry
+
+SEARCH_URL = "https://www.justice.gov/multimedia-search"
+
+SEARCH_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:146.0) Gecko/20100101 Firefox/146.0",
+    "Accept": "*/*",
+    "Accept-Language": "it-IT,it;q=0.8,en-US;q=0.5,en;q=0.3",
+    "Accept-Encoding": "gzip, deflate, br",
+    "Referer": "https://www.justice.gov/epstein",
+    "x-queueit-ajaxpageurl": "https%3A%2F%2Fwww.justice.gov%2Fepstein",
+    "Alt-Used": "www.justice.gov",
+    "Connection": "keep-alive",
+    "Sec-Fetch-Dest": "empty",
+    "Sec-Fetch-Mode": "cors",
+    "Sec-Fetch-Site": "same-origin",
+}
+
+
+class TokenBucket:
+    """Rate limiter token-bucket thread-safe."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocca finché non è disponibile un token."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class JusticeGovClient:
+    """Client justice.gov con Session condivisa, cache e rate limiting."""
+
+    def __init__(self, cache_size=JUSTICE_GOV_CACHE_SIZE, cache_ttl=JUSTICE_GOV_CACHE_TTL,
+                 rate=JUSTICE_GOV_RATE, burst=JUSTICE_GOV_BURST):
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        self.session.mount("https://", adapter)
+        self.session.headers.update(SEARCH_HEADERS)
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl)
+        self.limiter = TokenBucket(rate, burst)
+
+    @staticmethod
+    def _cache_key(query, page):
+        return (" ".join(str(query).split()).lower(), int(page))
+
+    def search(self, query, page=0):
+        """Cerca una pagina di risultati; le risposte valide restano in cache."""
+        key = self._cache_key(query, page)
+        cached = self.cache.get(key)
+        if cached is not None:
+            result = copy.deepcopy(cached)
+            result["query"] = query
+            return result
+
+        self.limiter.acquire()
+        try:
+            response = self.session.get(SEARCH_URL, params={"keys": query, "page": page}, timeout=30)
+            response.raise_for_status()
+            result = parse_json_results(response.json(), query)
+        except Exception as e:
+            return {"error": str(e), "results": []}
+
+        self.cache.set(key, copy.deepcopy(result))
+        return result
+
+    def _search_page(self, query, page, retries=JUSTICE_GOV_PAGE_RETRIES):
+        """Una pagina, ripetuta fino a retries volte se la richiesta fallisce"""
+        result = self.search(query, page)
+        for attempt in range(retries):
+            if not result.get("error"):
+                break
+            time.sleep(0.5 * (attempt + 1))
+            result = self.search(query, page)
+        return result
+
+    def search_all_pages(self, query, max_pages=10, max_workers=JUSTICE_GOV_MAX_WORKERS):
+        """
+        Scarica fino a max_pages pagine in parallelo e unisce i risultati.
+        La prima pagina dà il totale e la dimensione pagina; le successive
+        partono insieme (entro max_workers e il rate limiter) e ci si ferma
+        alla prima pagina vuota. Una pagina in errore (dopo i tentativi) non
+        ferma le altre: il risultato ha "partial", "failed_pages" ed "error".
+        Risultati deduplicati per id/url.
+        """
+        first = self._search_page(query, 0)
+        if first.get("error"):
+            return {"query": query, "total": 0, "count": 0, "results": [],
+                    "pages_fetched": 0, "error": first["error"]}
+
+        total = first.get("total", 0)
+        page_size = len(first.get("results", []))
+        pages = {0: first.get("results", [])}
+        errors = {}
+
+        if page_size and page_size < total and max_pages > 1:
+            last_page = min(max_pages, math.ceil(total / page_size))
+            first_empty = last_page
+            with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+                futures = {executor.submit(self._search_page, query, p): p for p in range(1, last_page)}
+                for future in as_completed(futures):
+                    if future.cancelled():
+                        continue
+                    page = futures[future]
+                    result = future.result()
+                    page_results = result.get("results", [])
+                    if result.get("error"):
+                        errors[page] = result["error"]
+                    elif page_results:
+                        pages[page] = page_results
+                    elif page < first_empty:
+                        first_empty = page
+                        for f, p in futures.items():
+                            if p > page:
+                                f.cancel()
+            pages = {p: r for p, r in pages.items() if p < first_empty}
+            errors = {p: e for p, e in errors.items() if p < first_empty}
+
+        results = []
+        seen = set()
+        for page in sorted(pages):
+            for doc in pages[page]:
+                key = doc.get("id") or doc.get("url")
+                if key and key in seen:
+                    continue
+                if key:
+                    seen.add(key)
+                results.append(doc)
+
+        response = {"query": query, "total": total, "count": len(results),
+                    "results": results, "pages_fetched": len(pages)}
+        if errors:
+            print(f"[JUSTICE.GOV] '{query}': pagine non scaricate {sorted(errors)}", flush=True)
+            response.update({
+                "partial": True,
+                "failed_pages": sorted(errors),
+                "error": f"{len(errors)} pagine non scaricate: {errors[min(errors)]}",
+            })
+        return response
+
+    def stats(self):
+        return {"cache": self.cache.stats()}
+
+
+justice_gov_client = JusticeGovClient()
 
 
 def search_justice_gov(query, page=0, size=20):
     """Cerca nel database Epstein su justice.gov"""
-    url = "https://www.justice.gov/multimedia-search"
-    params = {"keys": query, "page": page}
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:146.0) Gecko/20100101 Firefox/146.0",
-        "Accept": "*/*",
-        "Accept-Language": "it-IT,it;q=0.8,en-US;q=0.5,en;q=0.3",
-        "Accept-Encoding": "gzip, deflate, br",
-        "Referer": "https://www.justice.gov/epstein",
-        "x-queueit-ajaxpageurl": "https%3A%2F%2Fwww.justice.gov%2Fepstein",
-        "Alt-Used": "www.justice.gov",
-        "Connection": "keep-alive",
-        "Sec-Fetch-Dest": "empty",
-        "Sec-Fetch-Mode": "cors",
-        "Sec-Fetch-Site": "same-origin",
-    }
-    try:
-        response = requests.get(url, params=params, headers=headers, timeout=30)
-        response.raise_for_status()
-        return parse_json_results(response.json(), query)
-    except Exception as e:
-        return {"error": str(e), "results": []}
+    return justice_gov_client.search(query, page)
+
+
+def search_all_pages(query, max_pages=10, max_workers=JUSTICE_GOV_MAX_WORKERS):
+    """Cerca su più pagine in parallelo, risultati uniti e deduplicati"""
+    return justice_gov_client.search_all_pages(query, max_pages=max_pages, max_workers=max_workers)
 
 
 def parse_json_results(data, query):
@@ -62,6 +219,11 @@ def parse_json_results(data, query):
 
         results.append(result)
 
+    try:
+        efta_registry.record_results(results)
+    except Exception as e:
+        print(f"[EFTA] Errore aggiornamento registro: {e}", flush=True)
+
     return {"query": query, "total": total, "count": len(results), "results": results}
 
 
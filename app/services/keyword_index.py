@@ -0,0 +1,190 @@
+"""
+Indice BM25 (sqlite FTS5) sugli stessi chunk di ChromaDB.
+Serve le ricerche per token esatti — codici EFTA, nomi, marche come N908JE,
+importi — che la ricerca densa gestisce male. Viene aggiornato dagli stessi
+punti che scrivono/cancellano nella collection, indicizzatore compreso.
+L'indice FTS5 è contentless: il testo dei chunk resta solo in ChromaDB e
+viene letto (fetch_texts) per i risultati. Le righe FTS dei chunk eliminati
+restano orfane, escluse dal join; quando superano quelle vive l'indice va
+ricostruito (is_initialized torna False).
+"""
+import re
+import json
+import sqlite3
+import threading
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+PHRASE_RE = re.compile(r'"([^"]+)"')
+SNIPPET_TOKENS = 16
+
+
+def build_fts_query(text, operator="OR"):
+    """
+    Converte testo libero in una query FTS5 sicura: le frasi tra virgolette
+    restano frasi, ogni altro token è quotato; i termini sono uniti con operator.
+    """
+    terms = []
+    for phrase in PHRASE_RE.findall(text):
+        tokens = TOKEN_RE.findall(phrase)
+        if tokens:
+            terms.append('"' + " ".join(tokens) + '"')
+    for token in TOKEN_RE.findall(PHRASE_RE.sub(" ", text)):
+        terms.append(f'"{token}"')
+    return f" {operator} ".join(dict.fromkeys(terms))
+
+
+def make_snippet(text, query, tokens=SNIPPET_TOKENS):
+    """Finestra di circa tokens parole attorno al primo termine della query, termini in **grassetto**"""
+    terms = {t.lower() for t in TOKEN_RE.findall(query)}
+    words = list(TOKEN_RE.finditer(text))
+    hits = [i for i, m in enumerate(words) if m.group().lower() in terms]
+    if not hits:
+        return ""
+    first = max(0, hits[0] - tokens // 4)
+    last = min(len(words), first + tokens)
+    out, pos = [], words[first].start()
+    for m in words[first:last]:
+        out.append(text[pos:m.start()])
+        out.append(f"**{m.group()}**" if m.group().lower() in terms else m.group())
+        pos = m.end()
+    snippet = " ".join("".join(out).split())
+    return ("…" if first > 0 else "") + snippet + ("…" if last < len(words) else "")
+
+
+class KeywordIndex:
+    """
+    Tabella chunk (id, url, titolo, metadati) + indice FTS5 contentless.
+    fetch_texts(chunk_ids) → {chunk_id: testo} legge il testo dalla collection.
+    """
+
+    def __init__(self, db_path, fetch_texts=None):
+        self.db_path = db_path
+        self.fetch_texts = fetch_texts
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _db(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(chunks)")}
+            if "body" in columns:
+                # Schema precedente (testo copiato nella tabella): si ricostruisce da ChromaDB
+                conn.executescript("""
+                    DROP TRIGGER IF EXISTS chunks_ai;
+                    DROP TRIGGER IF EXISTS chunks_ad;
+                    DROP TABLE IF EXISTS chunks_fts;
+                    DROP TABLE IF EXISTS chunks;
+                    DELETE FROM meta WHERE key = 'initialized';
+                """)
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS chunks (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    chunk_id TEXT UNIQUE NOT NULL,
+                    url TEXT NOT NULL,
+                    title TEXT,
+                    meta TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_chunks_url ON chunks (url);
+                CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+                    title, body, content='',
+                    tokenize='unicode61 remove_diacritics 2'
+                );
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            """)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def _meta_int(self, conn, key):
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return int(row[0]) if row else 0
+
+    # ── aggiornamenti ──
+
+    def add(self, records, commit=True):
+        """Indicizza chunk [(id, testo, metadati)]; gli id già presenti sono ignorati"""
+        with self._lock:
+            conn = self._db()
+            for chunk_id, text, meta in records:
+                cur = conn.execute(
+                    "INSERT OR IGNORE INTO chunks (chunk_id, url, title, meta) VALUES (?, ?, ?, ?)",
+                    (chunk_id, meta.get("url", ""), meta.get("title", ""), json.dumps(meta)),
+                )
+                if cur.rowcount:
+                    conn.execute("INSERT INTO chunks_fts (rowid, title, body) VALUES (?, ?, ?)",
+                                 (cur.lastrowid, meta.get("title", ""), text))
+            if commit:
+                conn.commit()
+
+    def remove_urls(self, urls):
+        """Elimina i chunk degli URL; le loro righe FTS diventano orfane (AUTOINCREMENT: rowid mai riusati)"""
+        with self._lock:
+            conn = self._db()
+            removed = 0
+            for url in urls:
+                removed += conn.execute("DELETE FROM chunks WHERE url = ?", (url,)).rowcount
+            if removed:
+                orphans = self._meta_int(conn, "orphans") + removed
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('orphans', ?)", (str(orphans),))
+                live = conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+                if orphans > live:
+                    conn.execute("DELETE FROM meta WHERE key = 'initialized'")
+            conn.commit()
+
+    def clear(self):
+        with self._lock:
+            conn = self._db()
+            conn.execute("DELETE FROM chunks")
+            conn.execute("INSERT INTO chunks_fts (chunks_fts) VALUES ('delete-all')")
+            conn.execute("DELETE FROM meta WHERE key IN ('orphans', 'initialized')")
+            conn.commit()
+
+    def mark_initialized(self):
+        with self._lock:
+            conn = self._db()
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('initialized', '1')")
+            conn.commit()
+
+    def is_initialized(self):
+        with self._lock:
+            return self._db().execute("SELECT 1 FROM meta WHERE key = 'initialized'").fetchone() is not None
+
+    # ── ricerca ──
+
+    def search(self, query, limit=20, operator="OR"):
+        """
+        Documenti ordinati per BM25 (miglior chunk per URL).
+        Ritorna [{"url", "title", "text", "snippet", "bm25", "metadata"}].
+        """
+        fts_query = build_fts_query(query, operator)
+        if not fts_query:
+            return []
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT c.chunk_id, c.url, c.title, c.meta, bm25(chunks_fts) AS rank "
+                "FROM chunks_fts JOIN chunks c ON c.id = chunks_fts.rowid "
+                "WHERE chunks_fts MATCH ? ORDER BY rank LIMIT ?",
+                (fts_query, limit * 5),
+            ).fetchall()
+
+        best = {}
+        for chunk_id, url, title, meta, rank in rows:
+            if url not in best:
+                best[url] = (chunk_id, title, meta, rank)
+                if len(best) >= limit:
+                    break
+        texts = self.fetch_texts([b[0] for b in best.values()]) if self.fetch_texts and best else {}
+
+        docs = []
+        for url, (chunk_id, title, meta, rank) in best.items():
+            text = texts.get(chunk_id, "")
+            docs.append({
+                "url": url,
+                "title": title or "Unknown",
+                "text": text,
+                "snippet": make_snippet(text, query),
+                "bm25": round(-rank, 4),
+                "metadata": json.loads(meta) if meta else {},
+            })
+        return docs
@@ -1,26 +1,131 @@
 """
-Download e estrazione testo da PDF: PyPDF2, Tesseract, Claude Vision.
+Download e estrazione testo da PDF: PyMuPDF/PyPDF2, Tesseract, Claude Vision.
 """
 import os
 import io
 import re
 import base64
 import threading
+from concurrent.futures import Future
 import requests
-import PyPDF2
 
 from app.config import DOCUMENTS_DIR
 from app.extensions import pdf_cache, OCR_AVAILABLE, PYMUPDF_AVAILABLE
+from app.services.pdf_cache import make_cache_key
+from app.services.chunker import PAGE_MARKER_RE
+from app.services.efta_registry import efta_registry
+from app.services.pdf_extract import (
+    extract_pdf_pages, log_extraction_timings, iter_ocr_pages, pages_without_text,
+)
 from app.services.claude import get_anthropic_client, call_claude_with_retry
 from app.services.settings import get_model, get_language_instruction
 
 
+VISION_MAX_PAGES = 5
+# Prefisso dei messaggi di errore di extract_text_with_claude_vision
+VISION_ERROR_PREFIX = "[Errore"
+
+# Lavori in corso: {chiave: Future} — i chiamanti concorrenti attendono lo stesso risultato.
+# Chiavi ("text", cache_key) per l'estrazione di una variante, ("pdf", url) per il download.
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+# doc_id con indicizzazione ChromaDB in corso
+_indexing = set()
+_indexing_lock = threading.Lock()
+
+
+def _single_flight(key, fn):
+    """Esegue fn una volta per chiave: le chiamate concorrenti ricevono lo stesso risultato"""
+    with _inflight_lock:
+        future = _inflight.get(key)
+        is_leader = future is None
+        if is_leader:
+            future = Future()
+            _inflight[key] = future
+
+    if not is_leader:
+        return future.result()
+
+    try:
+        result = fn()
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
 def download_pdf_text(url, use_ocr=False, use_claude_vision=False):
-    """Scarica un PDF e ne estrae il testo"""
-    cache_key = f"{url}_ocr{use_ocr}_vision{use_claude_vision}"
-    if cache_key in pdf_cache:
-        return pdf_cache[cache_key]
+    """
+    Scarica un PDF e ne estrae il testo (single-flight per URL/variante).
+    Le varianti (testo, OCR, Vision) condividono un solo download per URL.
+    """
+    cache_key = make_cache_key(url, use_ocr, use_claude_vision)
+    cached = pdf_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    def _extract():
+        # Un altro leader potrebbe aver appena completato la stessa variante
+        text = pdf_cache.get(cache_key)
+        if text is None:
+            text = _fetch_pdf_text(url, use_ocr, use_claude_vision, cache_key)
+        return text
+
+    return _single_flight(("text", cache_key), _extract)
+
+
+def _download_pdf(url, doc_id):
+    """Byte del PDF: copia in DOCUMENTS_DIR se c'è, altrimenti un solo download per URL"""
+    if doc_id:
+        pdf_path = os.path.join(DOCUMENTS_DIR, f"{doc_id}.pdf")
+        if os.path.exists(pdf_path):
+            with open(pdf_path, 'rb') as f:
+                return f.read()
+
+    def _get():
+        headers = {
+            "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:146.0) Gecko/20100101 Firefox/146.0",
+            "Cookie": "justiceGovAgeVerified=true",
+            "Referer": "https://www.justice.gov/epstein",
+        }
+        response = requests.get(url, headers=headers, timeout=120, allow_redirects=True)
+        response.raise_for_status()
+        return response.content
+
+    return _single_flight(("pdf", url), _get)
 
+
+def _schedule_index(url, doc_id, text):
+    """
+    Avvia l'indicizzazione ChromaDB in background, una sola per doc_id;
+    add_document_to_vectordb registra anche le entità del testo completo
+    """
+    with _indexing_lock:
+        if doc_id in _indexing:
+            return
+        _indexing.add(doc_id)
+
+    from app.agents.vectordb import add_document_to_vectordb
+
+    def _index_bg():
+        try:
+            add_document_to_vectordb(url, doc_id, text, {'doc_id': doc_id})
+            print(f"[AUTO-INDEX] Indicizzato {doc_id}", flush=True)
+        except Exception as idx_err:
+            print(f"[AUTO-INDEX] Errore {doc_id}: {idx_err}", flush=True)
+        finally:
+            with _indexing_lock:
+                _indexing.discard(doc_id)
+    threading.Thread(target=_index_bg, daemon=True).start()
+
+
+def _fetch_pdf_text(url, use_ocr, use_claude_vision, cache_key):
+    """Download, estrazione, salvataggio e auto-indicizzazione di un PDF"""
     # Check locale PRIMA del download
     doc_id_match = re.search(r'EFTA\d+', url)
     doc_id = doc_id_match.group() if doc_id_match else None
@@ -29,30 +134,30 @@ def download_pdf_text(url, use_ocr=False, use_claude_vision=False):
         if os.path.exists(txt_path):
             with open(txt_path, 'r', encoding='utf-8') as f:
                 text = f.read()
-            pdf_cache[cache_key] = text
+            pdf_cache.set(cache_key, text)
             return text
 
     try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10.15; rv:146.0) Gecko/20100101 Firefox/146.0",
-            "Cookie": "justiceGovAgeVerified=true",
-            "Referer": "https://www.justice.gov/epstein",
-        }
-        response = requests.get(url, headers=headers, timeout=120, allow_redirects=True)
-        response.raise_for_status()
-
-        content = response.content
+        content = _download_pdf(url, doc_id)
         if not content.startswith(b'%PDF'):
             return "[Errore: il file non è un PDF valido - possibile redirect o protezione]"
 
-        pdf_file = io.BytesIO(content)
         try:
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            text = ""
-            for page in pdf_reader.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
+            pages = extract_pdf_pages(content)
+            log_extraction_timings(doc_id or url, pages)
+            # Marcatori di pagina come per l'OCR: il chunker ne ricava le pagine dei chunk
+            text = "".join(f"--- Pagina {p['page']} ---\n{p['text']}\n\n" for p in pages if p["text"].strip())
+            missing = pages_without_text(pages)
+
+            if text.strip() and missing:
+                # PDF misto: OCR solo delle pagine senza layer di testo
+                ocr_texts = ocr_missing_pages(content, missing, use_claude_vision)
+                if ocr_texts:
+                    print(f"[PDF] {doc_id or url}: OCR di {len(ocr_texts)}/{len(pages)} pagine senza testo", flush=True)
+                    text = "".join(
+                        f"--- Pagina {p['page']} ---\n{ocr_texts.get(p['page'], p['text'])}\n\n"
+                        for p in pages
+                    )
 
             if not text.strip():
                 if use_claude_vision:
@@ -77,26 +182,18 @@ def download_pdf_text(url, use_ocr=False, use_claude_vision=False):
                     txt_path = os.path.join(DOCUMENTS_DIR, f"{doc_id}.txt")
                     with open(txt_path, 'w', encoding='utf-8') as f:
                         f.write(text)
+                    efta_registry.mark_local(doc_id, url)
                 except Exception as save_err:
                     print(f"[SAVE DOC] Errore salvataggio {doc_id}: {save_err}")
 
-            # Auto-indicizza in ChromaDB (in background)
+            # Auto-indicizza in ChromaDB ed estrae le entità (in background)
             if doc_id and text and not text.startswith('[Errore') and not text.startswith('[OCR'):
                 try:
-                    from app.agents.vectordb import add_document_to_vectordb
-                    title_for_index = doc_id
-
-                    def _index_bg():
-                        try:
-                            add_document_to_vectordb(url, title_for_index, text, {'doc_id': doc_id})
-                            print(f"[AUTO-INDEX] Indicizzato {doc_id}", flush=True)
-                        except Exception as idx_err:
-                            print(f"[AUTO-INDEX] Errore {doc_id}: {idx_err}", flush=True)
-                    threading.Thread(target=_index_bg, daemon=True).start()
+                    _schedule_index(url, doc_id, text)
                 except Exception:
                     pass
 
-            pdf_cache[cache_key] = text
+            pdf_cache.set(cache_key, text)
             return text
         except Exception as pdf_err:
             return f"[Errore parsing PDF: {str(pdf_err)}]"
@@ -107,35 +204,73 @@ def download_pdf_text(url, use_ocr=False, use_claude_vision=False):
         return f"[Errore generico: {str(e)}]"
 
 
-def extract_text_with_tesseract(pdf_content):
-    """Estrae testo da PDF usando OCR Tesseract"""
+def ocr_missing_pages(pdf_content, page_numbers, use_claude_vision=False):
+    """
+    OCR delle sole pagine indicate → {pagina: testo}.
+    Tesseract se disponibile; Claude Vision solo se richiesto esplicitamente
+    (è a pagamento: sui PDF misti non parte in automatico).
+    """
+    if use_claude_vision:
+        # Una sola chiamata per tutte le pagine: la trascrizione è divisa sui marcatori
+        pages = list(page_numbers)[:VISION_MAX_PAGES]
+        text = extract_text_with_claude_vision(pdf_content, max_pages=len(pages), pages=pages)
+        if not text or text.startswith(VISION_ERROR_PREFIX):
+            return {}
+        return split_pages(text, pages)
+    if OCR_AVAILABLE:
+        try:
+            return {n: t for n, t in iter_ocr_pages(pdf_content, pages=page_numbers, dpi=200) if t.strip()}
+        except Exception as e:
+            print(f"[OCR] Errore OCR selettivo: {e}", flush=True)
+    return {}
+
+
+def split_pages(text, page_numbers):
+    """
+    Trascrizione con marcatori "--- Pagina N ---" → {pagina: testo}, limitata
+    alle pagine richieste. Senza marcatori tutto il testo va alla prima pagina.
+    """
+    markers = list(PAGE_MARKER_RE.finditer(text))
+    if not markers:
+        return {page_numbers[0]: text.strip()} if text.strip() and page_numbers else {}
+    wanted = set(page_numbers)
+    results = {}
+    for m, nxt in zip(markers, markers[1:] + [None]):
+        page_no = int(m.group(1))
+        body = text[m.end():nxt.start() if nxt else len(text)].strip()
+        if page_no in wanted and body:
+            results[page_no] = body
+    return results
+
+
+def extract_text_with_tesseract(pdf_content, pages=None):
+    """Estrae testo da PDF usando OCR Tesseract (tutte le pagine o solo quelle indicate)"""
     if not OCR_AVAILABLE:
         return "[OCR non disponibile - installa pytesseract e pdf2image]"
     try:
-        from pdf2image import convert_from_bytes
-        import pytesseract
-        images = convert_from_bytes(pdf_content, dpi=200)
-        text = ""
-        for i, img in enumerate(images):
-            page_text = pytesseract.image_to_string(img, lang='eng')
-            text += f"--- Pagina {i+1} ---\n{page_text}\n\n"
+        page_texts = dict(iter_ocr_pages(pdf_content, pages=pages, dpi=200))
+        text = "".join(f"--- Pagina {n} ---\n{page_texts[n]}\n\n" for n in sorted(page_texts))
         return text if text.strip() else "[OCR completato ma nessun testo trovato]"
     except Exception as e:
         return f"[Errore OCR Tesseract: {str(e)}]"
 
 
-def extract_text_with_claude_vision(pdf_content, max_pages=5):
-    """Estrae testo da PDF usando Claude Vision"""
+def extract_text_with_claude_vision(pdf_content, max_pages=5, pages=None):
+    """Estrae testo da PDF usando Claude Vision (prime max_pages pagine o quelle indicate)"""
     try:
         if not OCR_AVAILABLE:
             return "[pdf2image non disponibile - necessario per Claude Vision]"
 
         from pdf2image import convert_from_bytes
-        images = convert_from_bytes(pdf_content, dpi=150)
-        images = images[:max_pages]
+        if pages is None:
+            page_numbers = list(range(1, max_pages + 1))
+            images = convert_from_bytes(pdf_content, dpi=150, first_page=1, last_page=max_pages)
+        else:
+            page_numbers = list(pages)[:max_pages]
+            images = [convert_from_bytes(pdf_content, dpi=150, first_page=n, last_page=n)[0] for n in page_numbers]
 
         image_contents = []
-        for i, img in enumerate(images):
+        for page_no, img in zip(page_numbers, images):
             img_buffer = io.BytesIO()
             img.save(img_buffer, format='PNG')
             img_base64 = base64.b64encode(img_buffer.getvalue()).decode('utf-8')
@@ -143,11 +278,12 @@ def extract_text_with_claude_vision(pdf_content, max_pages=5):
                 "type": "image",
                 "source": {"type": "base64", "media_type": "image/png", "data": img_base64},
             })
-            image_contents.append({"type": "text", "text": f"[Pagina {i+1}]"})
+            image_contents.append({"type": "text", "text": f"[Pagina {page_no}]"})
 
         image_contents.append({
             "type": "text",
             "text": "Trascrivi TUTTO il testo visibile in queste immagini di documenti scansionati. Mantieni la formattazione originale il più possibile. Includi intestazioni, date, firme, note a margine - tutto ciò che è leggibile."
+                   " Inizia la trascrizione di ogni pagina con una riga \"--- Pagina N ---\", dove N è il numero indicato dopo l'immagine."
                    + get_language_instruction(),
         })
 
@@ -0,0 +1,215 @@
+"""
+Cache a due livelli per i testi estratti dai PDF:
+LRU in memoria con budget in byte davanti a uno store su disco (sqlite)
+indirizzato per contenuto. Le varianti OCR/Vision hanno chiavi proprie.
+Anche lo store su disco ha un budget (byte compressi): oltre il limite
+si eliminano le voci usate meno di recente e i blob non più referenziati.
+"""
+import sys
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+from datetime import datetime
+from collections import OrderedDict
+
+
+def make_cache_key(url, use_ocr=False, use_claude_vision=False):
+    """Chiave di cache per URL + variante di estrazione"""
+    variant = "vision" if use_claude_vision else ("ocr" if use_ocr else "text")
+    return f"{variant}:{url}"
+
+
+class PdfTextCache:
+    """Cache testi PDF: memoria (LRU, limite in byte) + sqlite (persistente)."""
+
+    # Voci eliminate per volta quando lo store supera il budget su disco
+    EVICT_BATCH = 32
+
+    def __init__(self, db_path, max_memory_bytes=64 * 1024 * 1024, max_disk_bytes=None):
+        self.db_path = db_path
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self._disk_bytes = 0
+        self._memory = OrderedDict()  # {key: text}
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._conn = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        self.writes = 0
+
+    def _db(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, content_hash TEXT NOT NULL, created_at TEXT)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS blobs ("
+                "content_hash TEXT PRIMARY KEY, size INTEGER, data BLOB)"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(entries)")}
+            if "accessed_at" not in columns:
+                conn.execute("ALTER TABLE entries ADD COLUMN accessed_at REAL")
+                conn.execute("UPDATE entries SET accessed_at = 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries (accessed_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_hash ON entries (content_hash)")
+            # Blob rimasti senza voce (sovrascritti prima della pulizia)
+            conn.execute("DELETE FROM blobs WHERE content_hash NOT IN (SELECT content_hash FROM entries)")
+            conn.commit()
+            self._disk_bytes = conn.execute("SELECT COALESCE(SUM(length(data)), 0) FROM blobs").fetchone()[0]
+            self._conn = conn
+        return self._conn
+
+    def _release_blob(self, conn, content_hash):
+        """Elimina il blob se nessuna voce lo usa più, aggiornando i byte su disco (con _db_lock)"""
+        old = conn.execute(
+            "SELECT length(data) FROM blobs WHERE content_hash = ? AND NOT EXISTS "
+            "(SELECT 1 FROM entries WHERE content_hash = ?)", (content_hash, content_hash)
+        ).fetchone()
+        if old is not None:
+            conn.execute("DELETE FROM blobs WHERE content_hash = ?", (content_hash,))
+            self._disk_bytes -= old[0]
+
+    def _enforce_disk_budget(self, conn):
+        """
+        Elimina le voci meno usate di recente finché lo store non rientra nel budget (con _db_lock).
+        Ogni lotto libera solo i blob delle proprie voci: il costo non cresce con lo store.
+        """
+        if not self.max_disk_bytes:
+            return
+        while self._disk_bytes > self.max_disk_bytes:
+            rows = conn.execute(
+                "SELECT key, content_hash FROM entries ORDER BY accessed_at LIMIT ?", (self.EVICT_BATCH,)
+            ).fetchall()
+            if not rows:
+                break
+            conn.executemany("DELETE FROM entries WHERE key = ?", [(k,) for k, _ in rows])
+            for content_hash in {h for _, h in rows}:
+                self._release_blob(conn, content_hash)
+            self.disk_evictions += len(rows)
+        conn.commit()
+
+    # ── memoria ──
+
+    def _remember(self, key, text):
+        size = sys.getsizeof(text)
+        if size > self.max_memory_bytes:
+            return
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_bytes -= sys.getsizeof(old)
+            self._memory[key] = text
+            self._memory_bytes += size
+            while self._memory_bytes > self.max_memory_bytes and self._memory:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= sys.getsizeof(evicted)
+                self.evictions += 1
+
+    # ── API ──
+
+    def get(self, key):
+        with self._lock:
+            text = self._memory.get(key)
+            if text is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return text
+
+        try:
+            with self._db_lock:
+                conn = self._db()
+                row = conn.execute(
+                    "SELECT b.data FROM entries e JOIN blobs b ON b.content_hash = e.content_hash "
+                    "WHERE e.key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (time.time(), key))
+                    conn.commit()
+        except sqlite3.Error as e:
+            print(f"[PDF CACHE] Errore lettura: {e}", flush=True)
+            row = None
+
+        if row is None:
+            self.misses += 1
+            return None
+
+        text = zlib.decompress(row[0]).decode("utf-8")
+        self.disk_hits += 1
+        self._remember(key, text)
+        return text
+
+    def set(self, key, text):
+        self._remember(key, text)
+        data = text.encode("utf-8")
+        content_hash = hashlib.sha1(data).hexdigest()
+        try:
+            compressed = zlib.compress(data)
+            with self._db_lock:
+                conn = self._db()
+                previous = conn.execute("SELECT content_hash FROM entries WHERE key = ?", (key,)).fetchone()
+                inserted = conn.execute(
+                    "INSERT OR IGNORE INTO blobs (content_hash, size, data) VALUES (?, ?, ?)",
+                    (content_hash, len(data), compressed),
+                ).rowcount
+                self._disk_bytes += len(compressed) if inserted else 0
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, content_hash, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, content_hash, datetime.now().isoformat(), time.time()),
+                )
+                if previous and previous[0] != content_hash:
+                    # Il vecchio testo della voce: via il blob se nessun'altra voce lo usa
+                    self._release_blob(conn, previous[0])
+                conn.commit()
+                self._enforce_disk_budget(conn)
+            self.writes += 1
+        except sqlite3.Error as e:
+            print(f"[PDF CACHE] Errore scrittura: {e}", flush=True)
+
+    def __contains__(self, key):
+        """Presenza della voce, senza contare hit/miss né aggiornarne l'uso"""
+        with self._lock:
+            if key in self._memory:
+                return True
+        try:
+            with self._db_lock:
+                return self._db().execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone() is not None
+        except sqlite3.Error:
+            return False
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        disk_entries = 0
+        disk_bytes = 0
+        try:
+            with self._db_lock:
+                disk_entries = self._db().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+                disk_bytes = self._db().execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+        except sqlite3.Error:
+            pass
+        stored_bytes = self._disk_bytes
+        return {
+            "memory_entries": len(self._memory),
+            "memory_bytes": self._memory_bytes,
+            "memory_limit_bytes": self.max_memory_bytes,
+            "disk_entries": disk_entries,
+            "disk_bytes": disk_bytes,
+            "disk_stored_bytes": stored_bytes,
+            "disk_limit_bytes": self.max_disk_bytes,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "disk_evictions": self.disk_evictions,
+            "writes": self.writes,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else 0.0,
+        }
@@ -0,0 +1,187 @@
+"""
+Estrazione testo PDF pagina per pagina su un pool di processi.
+Usa PyMuPDF quando disponibile (molto più veloce), altrimenti PyPDF2.
+OCR Tesseract pagina per pagina: rasterizzazione lazy, risultati in streaming.
+"""
+import io
+import os
+import tempfile
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+
+from app.config import PDF_WORKERS, PDF_PARALLEL_MIN_PAGES, PDF_PAGES_PER_TASK
+from app.extensions import PYMUPDF_AVAILABLE
+from app.services.pool_workers import extract_page_range, ocr_page
+
+# Moduli caricati dal forkserver: i worker partono da qui, non da una copia
+# del processo principale (client MongoDB, connessioni sqlite, thread)
+POOL_PRELOAD = ["app.services.pool_workers"]
+
+# Sotto questa soglia di caratteri una pagina è considerata senza layer di testo
+TEXT_LAYER_MIN_CHARS = 20
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _pool_context():
+    """forkserver dove disponibile, altrimenti spawn: mai fork del processo dell'app"""
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_forkserver_preload(POOL_PRELOAD)
+        return ctx
+    return multiprocessing.get_context("spawn")
+
+
+def get_process_pool():
+    """
+    Pool di processi condiviso per estrazione e OCR (creato al primo uso).
+    I task sono le funzioni di app.services.pool_workers.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=_pool_context())
+        return _pool
+
+
+def _reset_process_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+@contextmanager
+def _temp_pdf(content):
+    """
+    Copia temporanea del PDF su disco: i worker lo aprono dal percorso
+    invece di ricevere i byte serializzati in ogni task
+    """
+    fd, pdf_path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        yield pdf_path
+    finally:
+        try:
+            os.remove(pdf_path)
+        except OSError:
+            pass
+
+
+def count_pdf_pages(content, use_pymupdf=PYMUPDF_AVAILABLE):
+    """Numero di pagine del PDF"""
+    if use_pymupdf:
+        import fitz
+        with fitz.open(stream=content, filetype="pdf") as doc:
+            return doc.page_count
+    import PyPDF2
+    return len(PyPDF2.PdfReader(io.BytesIO(content)).pages)
+
+
+def extract_pdf_pages(content, use_pymupdf=None):
+    """
+    Estrae il testo di tutte le pagine.
+    Ritorna [{"page": n, "text": str, "ms": float}] in ordine di pagina (n da 1).
+    I PDF piccoli vengono estratti nel processo corrente; quelli grandi
+    sono divisi in blocchi di pagine distribuiti sul pool.
+    """
+    if use_pymupdf is None:
+        use_pymupdf = PYMUPDF_AVAILABLE
+    try:
+        n_pages = count_pdf_pages(content, use_pymupdf)
+    except Exception:
+        if not use_pymupdf:
+            raise
+        # PDF che PyMuPDF non apre: riprova con PyPDF2
+        use_pymupdf = False
+        n_pages = count_pdf_pages(content, use_pymupdf)
+
+    ranges = [(s, min(s + PDF_PAGES_PER_TASK, n_pages)) for s in range(0, n_pages, PDF_PAGES_PER_TASK)]
+
+    rows = None
+    if n_pages >= PDF_PARALLEL_MIN_PAGES and len(ranges) > 1:
+        try:
+            with _temp_pdf(content) as pdf_path:
+                pool = get_process_pool()
+                futures = [pool.submit(extract_page_range, pdf_path, s, e, use_pymupdf) for s, e in ranges]
+                rows = [row for f in futures for row in f.result()]
+        except BrokenProcessPool:
+            print("[PDF] Pool di processi non disponibile, estrazione sequenziale", flush=True)
+            _reset_process_pool()
+            rows = None
+
+    if rows is None:
+        rows = extract_page_range(content, 0, n_pages, use_pymupdf)
+
+    rows.sort(key=lambda r: r[0])
+    return [{"page": i + 1, "text": text, "ms": round(ms, 2)} for i, text, ms in rows]
+
+
+def pages_without_text(pages):
+    """Numeri delle pagine senza layer di testo (immagini scansionate)"""
+    return [p["page"] for p in pages if len(p["text"].strip()) < TEXT_LAYER_MIN_CHARS]
+
+
+def log_extraction_timings(label, pages):
+    """Stampa un riepilogo dei tempi di estrazione per pagina"""
+    if not pages:
+        return
+    total = sum(p["ms"] for p in pages)
+    slowest = max(pages, key=lambda p: p["ms"])
+    print(
+        f"[PDF] {label}: {len(pages)} pagine, {total:.0f}ms CPU "
+        f"(più lenta: pagina {slowest['page']} {slowest['ms']:.0f}ms)",
+        flush=True,
+    )
+
+
+def iter_ocr_pages(content, pages=None, dpi=200, use_pymupdf=None):
+    """
+    Generatore OCR: restituisce (pagina, testo) man mano che le pagine finiscono.
+    Al massimo PDF_WORKERS pagine sono rasterizzate contemporaneamente,
+    quindi la memoria di picco dipende dal pool e non dalla lunghezza del PDF.
+    """
+    if use_pymupdf is None:
+        use_pymupdf = PYMUPDF_AVAILABLE
+    if pages is None:
+        pages = range(1, count_pdf_pages(content, use_pymupdf) + 1)
+
+    with _temp_pdf(content) as pdf_path:
+        todo = iter(pages)
+        pending = {}  # {future: pagina}
+        waiting = None  # pagina estratta da todo ma non ancora accettata dal pool
+        try:
+            pool = get_process_pool()
+            while len(pending) < PDF_WORKERS:
+                waiting = next(todo, None)
+                if waiting is None:
+                    break
+                pending[pool.submit(ocr_page, pdf_path, waiting, dpi, use_pymupdf)] = waiting
+                waiting = None
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    page_no, text, _ = future.result()
+                    del pending[future]
+                    yield page_no, text
+                    waiting = next(todo, None)
+                    if waiting is not None:
+                        pending[pool.submit(ocr_page, pdf_path, waiting, dpi, use_pymupdf)] = waiting
+                        waiting = None
+        except BrokenProcessPool:
+            print("[OCR] Pool di processi non disponibile, OCR sequenziale", flush=True)
+            _reset_process_pool()
+            retry = sorted(pending.values()) + ([waiting] if waiting is not None else [])
+            pending = {}
+            for page_no in retry + list(todo):
+                page_no, text, _ = ocr_page(pdf_path, page_no, dpi, use_pymupdf)
+                yield page_no, text
+        finally:
+            for future in pending:
+                future.cancel()
@@ -0,0 +1,58 @@
+"""
+Funzioni eseguite nei processi del pool (estrazione pagine PDF, OCR).
+Il modulo non importa app.config, app.extensions né altri servizi: i processi
+figli partono da un forkserver che ha caricato solo questo modulo, senza
+connessioni MongoDB, sqlite o thread del processo principale.
+Le librerie PDF/OCR sono importate dentro le funzioni.
+"""
+import io
+import time
+
+
+def _open_pdf(pdf):
+    """Documento PyMuPDF da byte o da percorso"""
+    import fitz
+    if isinstance(pdf, (bytes, bytearray)):
+        return fitz.open(stream=pdf, filetype="pdf")
+    return fitz.open(pdf)
+
+
+def extract_page_range(pdf, start, end, use_pymupdf):
+    """
+    Estrae il testo delle pagine [start, end) → [(indice, testo, ms)].
+    pdf sono i byte del file (processo corrente) o il suo percorso (worker).
+    """
+    out = []
+    if use_pymupdf:
+        with _open_pdf(pdf) as doc:
+            for i in range(start, end):
+                t0 = time.perf_counter()
+                text = doc[i].get_text() or ""
+                out.append((i, text, (time.perf_counter() - t0) * 1000))
+        return out
+
+    import PyPDF2
+    reader = PyPDF2.PdfReader(io.BytesIO(pdf) if isinstance(pdf, (bytes, bytearray)) else pdf)
+    for i in range(start, end):
+        t0 = time.perf_counter()
+        text = reader.pages[i].extract_text() or ""
+        out.append((i, text, (time.perf_counter() - t0) * 1000))
+    return out
+
+
+def ocr_page(pdf_path, page_no, dpi, use_pymupdf):
+    """Rasterizza una sola pagina e ne fa l'OCR → (pagina, testo, ms)"""
+    import pytesseract
+    t0 = time.perf_counter()
+    if use_pymupdf:
+        import fitz
+        from PIL import Image
+        with fitz.open(pdf_path) as doc:
+            pix = doc[page_no - 1].get_pixmap(dpi=dpi)
+            img = Image.frombytes("RGB", (pix.width, pix.height), pix.samples)
+    else:
+        from pdf2image import convert_from_path
+        img = convert_from_path(pdf_path, dpi=dpi, first_page=page_no, last_page=page_no)[0]
+    text = pytesseract.image_to_string(img, lang='eng')
+    return page_no, text, (time.perf_counter() - t0) * 1000
+